@@ -0,0 +1,69 @@
+"""Recall@k and query latency of the IVF index against exact cosine scoring, on a synthetic library whose games are
+drawn from a set of archetypes (so there is real neighbourhood structure to find).
+
+    python -m benchmarks.bench_ann --titles 100000 --nprobe 1 4 8 16 32
+"""
+import argparse
+import time
+
+import numpy as np
+from scipy import sparse
+
+from text_processing.ann import build_index
+from text_processing.similarity_metrics import SimilarityRecommender
+
+
+def clustered_features(num_titles: int, num_labels: int = 500, num_archetypes: int = 300, labels_per_title: int = 8,
+                       seed: int = 0) -> sparse.csr_matrix:
+    rng = np.random.default_rng(seed)
+    # each archetype favours a handful of labels, on top of a long tail of popular ones
+    archetype_labels = rng.integers(0, num_labels, size=(num_archetypes, 12))
+    archetypes = rng.integers(0, num_archetypes, num_titles)
+    own = archetype_labels[archetypes[:, None], rng.integers(0, 12, size=(num_titles, labels_per_title - 2))]
+    popularity = 1 / np.arange(1, num_labels + 1)
+    noise = rng.choice(num_labels, size=(num_titles, 2), p=popularity / popularity.sum())
+    columns = np.hstack([own, noise]).ravel()
+    rows = np.repeat(np.arange(num_titles), labels_per_title)
+    matrix = sparse.csr_matrix((np.ones(rows.size, dtype=np.float32), (rows, columns)),
+                               shape=(num_titles, num_labels))
+    matrix.data[:] = 1
+    return matrix
+
+
+def percentiles(latencies: list) -> str:
+    latencies = np.array(latencies) * 1000
+    return f"p50 {np.percentile(latencies, 50):7.3f}ms  p99 {np.percentile(latencies, 99):7.3f}ms"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--titles', type=int, default=100_000)
+    parser.add_argument('--queries', type=int, default=300)
+    parser.add_argument('-k', type=int, default=10)
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    recommender = SimilarityRecommender(clustered_features(args.titles))
+    start = time.perf_counter()
+    index = build_index(recommender)
+    print(f"built {len(index.centroids)} lists over {args.titles} titles in {time.perf_counter() - start:.2f}s")
+
+    targets = np.random.default_rng(1).integers(0, args.titles, args.queries)
+    exact, latencies = {}, []
+    for target in targets:
+        start = time.perf_counter()
+        exact[target] = recommender.recommend(int(target), args.k, return_scores=True, exact=True)
+        latencies.append(time.perf_counter() - start)
+    print(f"exact          {percentiles(latencies)}")
+
+    for nprobe in args.nprobe:
+        hits, latencies = 0, []
+        for target in targets:
+            start = time.perf_counter()
+            indices, scores = index.recommend(int(target), args.k, return_scores=True, nprobe=nprobe)
+            latencies.append(time.perf_counter() - start)
+            # ties at the k-th score make the exact list ambiguous, so count anything scoring at least that high
+            kth_score = exact[target][1][-1]
+            hits += int(np.sum(scores >= kth_score - 1e-6))
+        recall = hits / (args.k * len(targets))
+        print(f"nprobe {nprobe:<6} {percentiles(latencies)}  recall@{args.k} {recall:.3f}")
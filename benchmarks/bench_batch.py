@@ -0,0 +1,45 @@
+"""Per-title recommend calls against recommend_batch, for lists over a whole synthetic catalogue.
+
+    python -m benchmarks.bench_batch --titles 20000 --n-jobs 1 2 4
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.bench_embeddings import library_recommender
+from text_processing.embeddings import SVDEmbedding
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--titles', type=int, default=20_000)
+    parser.add_argument('-k', type=int, default=10)
+    parser.add_argument('--loop-sample', type=int, default=2000, help='titles to time the per-title loop on')
+    parser.add_argument('--n-jobs', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--components', type=int, default=128)
+    args = parser.parse_args()
+
+    recommender = library_recommender(args.titles)
+    targets = np.arange(len(recommender))
+
+    start = time.perf_counter()
+    for target in targets[:args.loop_sample]:
+        recommender.recommend(int(target), args.k, return_scores=True)
+    loop = (time.perf_counter() - start) / min(args.loop_sample, len(targets))
+    print(f"recommend loop:            {loop * 1000:7.3f}ms per title  ({loop * len(targets):.1f}s for the catalogue)")
+
+    expected = None
+    for n_jobs in args.n_jobs:
+        start = time.perf_counter()
+        indices, scores = recommender.recommend_batch(targets, args.k, n_jobs=n_jobs)
+        seconds = time.perf_counter() - start
+        expected = scores if expected is None else expected
+        print(f"recommend_batch n_jobs={n_jobs:<3} {seconds / len(targets) * 1000:7.3f}ms per title  ({seconds:.1f}s, "
+              f"x{loop * len(targets) / seconds:.1f}, same scores: {np.allclose(scores, expected)})")
+
+    embedding = SVDEmbedding(args.components).fit(recommender.features)
+    for n_jobs in args.n_jobs:
+        start = time.perf_counter()
+        embedding.recommend_batch(targets, args.k, n_jobs=n_jobs)
+        seconds = time.perf_counter() - start
+        print(f"embedding batch n_jobs={n_jobs:<3} {seconds / len(targets) * 1000:7.3f}ms per title  ({seconds:.1f}s)")
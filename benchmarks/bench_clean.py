@@ -0,0 +1,77 @@
+"""Times the row-wise dataset_clean mappers (through .apply) against the batch clean_library pipeline, on
+new_data.csv and games.csv scaled up, and checks that both produce the same output.
+
+    python -m benchmarks.bench_clean --scale 10
+"""
+import argparse
+import time
+from ast import literal_eval
+from pathlib import Path
+
+import pandas as pd
+
+from text_processing.dataset_clean import assign_platform_aliases, assert_esrb_rating, map_genres, \
+    batch_assign_platform_aliases, batch_assert_esrb_rating, batch_map_genres
+
+datasets = Path(__file__).parent.parent.joinpath('datasets')
+
+
+# stands in for rows the row-wise function raises on
+raised = object()
+
+
+def row_wise(f):
+    # map_genres raises on single genres and assert_esrb_rating on missing ratings; only those rows are left out of
+    # the comparison
+    def apply(value):
+        try:
+            return f(value)
+        except (KeyError, TypeError, ValueError, SyntaxError):
+            return raised
+    return apply
+
+
+def mismatches(expected: pd.Series, result: pd.Series) -> int:
+    """Rows where the batch output differs from the row-wise one, NaN/None counting as equal to each other"""
+    compared = expected.map(lambda value: value is not raised)
+    expected, result = expected[compared], result[compared]
+    both_missing = expected.isna() & result.isna()
+    return int((~both_missing & (expected != result)).sum())
+
+
+def run(label: str, col: pd.Series, row_f, batch_f):
+    start = time.perf_counter()
+    expected = col.apply(row_wise(row_f))
+    row_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = batch_f(col)
+    batch_time = time.perf_counter() - start
+    print(f"{label:<28} {len(col):>8} rows  apply: {row_time * 1000:8.1f}ms  batch: {batch_time * 1000:8.1f}ms  "
+          f"x{row_time / batch_time:5.1f}  mismatches: {mismatches(expected, result)}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', type=int, default=10)
+    args = parser.parse_args()
+
+    new_data = pd.read_csv(datasets.joinpath('new_data.csv')).dropna(subset=['id'])
+    new_data = pd.concat([new_data] * args.scale, ignore_index=True)
+    games = pd.read_csv(datasets.joinpath('games.csv'))
+    games = pd.concat([games] * args.scale, ignore_index=True)
+
+    run('platforms (new_data)', new_data['platforms'], assign_platform_aliases, batch_assign_platform_aliases)
+    # the comma separated form assign_platform_aliases is written for
+    joined = new_data['platforms'].map(lambda x: ','.join(literal_eval(x)))
+    run('platforms (new_data, joined)', joined, assign_platform_aliases, batch_assign_platform_aliases)
+    run('age_ratings (new_data)', new_data['age_ratings'], assert_esrb_rating, batch_assert_esrb_rating)
+    run('genres (new_data)', new_data['genres'], map_genres, batch_map_genres)
+    run('genres (games)', games['Genres'], map_genres, batch_map_genres)
+
+    # columns read from library_store are already lists, which skips parsing entirely
+    lists = new_data['genres'].map(lambda x: list(literal_eval(x)) if isinstance(x, str) else [])
+    start = time.perf_counter()
+    batch_map_genres(lists)
+    print(f"{'genres (new_data, lists)':<28} {len(lists):>8} rows  batch: "
+          f"{(time.perf_counter() - start) * 1000:8.1f}ms")
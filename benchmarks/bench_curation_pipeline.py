@@ -0,0 +1,61 @@
+"""Throughput and peak memory of the streaming curation pipeline against the offline IGDB stub, for growing source
+files. Sources are vgsales.csv titles repeated with a numbered suffix (so they survive dedupe), mixed with the titles
+the stub knows, so each size has both passes and fails. Each size runs in its own process, so max_rss is that size's
+peak resident memory.
+
+    python -m benchmarks.bench_curation_pipeline --sizes 20000 100000 400000
+"""
+import argparse
+import csv
+import resource
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from curation_pipeline import CurationPipeline, default_source
+from igdb_stub_server import StubServer
+from library_store import LibraryStore
+
+
+def write_source(path: Path, num_titles: int):
+    with open(default_source, encoding='utf-8', newline='') as f:
+        titles = [row['Name'] for row in csv.DictReader(f)]
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Rank', 'Name'])
+        for i in range(num_titles):
+            title = titles[i % len(titles)]
+            writer.writerow([i, title if i < len(titles) else f"{title} {i // len(titles)}"])
+
+
+def run_size(num_titles: int, batch_size: int, flush_rows: int) -> dict:
+    with tempfile.TemporaryDirectory() as directory, StubServer() as server:
+        directory = Path(directory)
+        source = directory.joinpath('titles.csv')
+        write_source(source, num_titles)
+        pipeline = CurationPipeline('client-id', 'token', base_url=server.url, rate=10_000,
+                                    store=LibraryStore(directory.joinpath('library')),
+                                    checkpoint_path=directory.joinpath('checkpoint.json'), batch_size=batch_size,
+                                    flush_rows=flush_rows)
+        start = time.perf_counter()
+        checkpoint = pipeline.run(source)
+        seconds = time.perf_counter() - start
+    return {'seconds': seconds, 'max_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+            'passes': checkpoint['passes'], 'fails': checkpoint['fails']}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[20_000, 100_000, 400_000])
+    parser.add_argument('--batch-size', type=int, default=50)
+    parser.add_argument('--flush-rows', type=int, default=500)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        # a fresh process per size keeps max_rss from carrying over between sizes
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            result = executor.submit(run_size, size, args.batch_size, args.flush_rows).result()
+        print(f"{size:>8} titles  {result['seconds']:7.1f}s  {size / result['seconds']:7.0f} titles/s  "
+              f"max rss {result['max_rss'] / 1024 ** 2:7.1f}MiB  passes {result['passes']}  fails {result['fails']}",
+              flush=True)
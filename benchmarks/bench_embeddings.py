@@ -0,0 +1,80 @@
+"""Top-k agreement, query latency and memory of SVD embeddings against exact scoring of the full features, on a
+synthetic library encoded the way the recommenders see it (multi-label blocks + summary tf-idf, fused).
+
+    python -m benchmarks.bench_embeddings --titles 100000 --components 64 128 256
+"""
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.bench_ann import percentiles
+from benchmarks.synthetic_library import SyntheticLibrary
+from response_parser import parse_payloads
+from text_processing.embeddings import SVDEmbedding
+from text_processing.encoders import MultiLabelEncoder
+from text_processing.similarity_metrics import FusedRecommender
+from text_processing.summary_features import SummaryVectorizer
+
+
+def library_recommender(num_titles: int) -> FusedRecommender:
+    df = parse_payloads(SyntheticLibrary.from_datasets().payloads(num_titles)).to_pandas()
+    blocks = {field: MultiLabelEncoder().fit_transform(df[field])
+              for field in ['genres', 'platforms', 'themes', 'involved_companies']}
+    blocks['summary'] = SummaryVectorizer('fitted', min_df=2, preprocess=False).fit_transform(df['summary'])
+    return FusedRecommender(blocks)
+
+
+def features_bytes(recommender: FusedRecommender) -> int:
+    # the stored rows and the inverted index exact scoring runs on
+    return sum(m.data.nbytes + m.indices.nbytes + m.indptr.nbytes
+               for m in (recommender.features, recommender._inverted))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--titles', type=int, default=100_000)
+    parser.add_argument('--queries', type=int, default=300)
+    parser.add_argument('-k', type=int, default=10)
+    parser.add_argument('--components', type=int, nargs='+', default=[64, 128, 256])
+    args = parser.parse_args()
+
+    recommender = library_recommender(args.titles)
+    print(f"{len(recommender)} titles x {recommender.features.shape[1]} features, "
+          f"{features_bytes(recommender) / 1024 ** 2:.1f}MiB sparse (features + inverted index)")
+
+    targets = np.random.default_rng(1).integers(0, len(recommender), args.queries)
+    exact, latencies = {}, []
+    for target in targets:
+        start = time.perf_counter()
+        exact[target] = recommender.recommend(int(target), args.k, return_scores=True, exact=True)
+        latencies.append(time.perf_counter() - start)
+    print(f"exact           {percentiles(latencies)}")
+    start = time.perf_counter()
+    recommender.score_rows(recommender.features[targets])
+    print(f"exact, batched  {(time.perf_counter() - start) / len(targets) * 1000:7.3f}ms per query")
+
+    for n_components in args.components:
+        with tempfile.TemporaryDirectory() as directory:
+            start = time.perf_counter()
+            SVDEmbedding(n_components).fit(recommender.features, directory)
+            fit_seconds = time.perf_counter() - start
+            embedding = SVDEmbedding.open(directory)
+
+            hits, latencies = 0, []
+            for target in targets:
+                start = time.perf_counter()
+                indices = embedding.recommend(int(target), args.k)
+                latencies.append(time.perf_counter() - start)
+                # ties at the k-th exact score make the exact list ambiguous, so count any game scoring that high
+                kth_score = exact[target][1][-1]
+                hits += int(np.sum(recommender.scores(int(target))[indices] >= kth_score - 1e-6))
+            agreement = hits / (args.k * len(targets))
+            start = time.perf_counter()
+            embedding.score_rows(embedding.embeddings[targets])
+            batched = (time.perf_counter() - start) / len(targets) * 1000
+            print(f"{n_components:>4} components {percentiles(latencies)}  top-{args.k} agreement {agreement:.3f}  "
+                  f"batched {batched:.3f}ms per query  {embedding.memory_usage() / 1024 ** 2:6.1f}MiB  "
+                  f"fit {fit_seconds:.1f}s")
+            del embedding
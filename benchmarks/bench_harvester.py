@@ -0,0 +1,66 @@
+"""Compares the sequential post_request loop from data_curation.ipynb against the async harvester, with and without
+batching, offline.
+
+    python -m benchmarks.bench_harvester --titles 200 --offset 1180 --latency 0.15 --rate 4 --batch-size 50
+"""
+import argparse
+import asyncio
+import csv
+import time
+from pathlib import Path
+
+from data_pull import format_query, post_request, validate_response
+from igdb_harvester import IGDBHarvester
+from igdb_stub_server import StubServer
+
+vgsales = Path(__file__).parent.parent.joinpath('datasets', 'vgsales.csv')
+
+
+def load_titles(n: int, offset: int = 0) -> list:
+    with open(vgsales, encoding='utf-8') as f:
+        names = dict.fromkeys(row['Name'] for row in csv.DictReader(f))
+    return list(names)[offset:offset + n]
+
+
+def sequential(titles: list, base_url: str) -> int:
+    found = 0
+    for title in titles:
+        response = post_request(format_query(title), 'client-id', 'token', base_url=base_url)
+        if isinstance(validate_response(response, title), dict):
+            found += 1
+    return found
+
+
+async def concurrent(titles: list, base_url: str, rate: float, batch_size: int = 1) -> tuple:
+    async with IGDBHarvester('client-id', 'token', base_url=base_url, rate=rate) as harvester:
+        passes, fails, discards = await harvester.harvest(titles, batch_size=batch_size)
+    return len(passes) + len(discards), harvester.num_requests
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--titles', type=int, default=200)
+    # new_data.csv (which the stub serves) covers the later part of vgsales.csv
+    parser.add_argument('--offset', type=int, default=1180)
+    parser.add_argument('--latency', type=float, default=0.15, help='simulated round trip time, in seconds')
+    parser.add_argument('--rate', type=float, default=4, help='requests/sec allowed by the stub')
+    parser.add_argument('--batch-size', type=int, default=50, help='titles per request for the batched harvester')
+    args = parser.parse_args()
+
+    titles = load_titles(args.titles, args.offset)
+    with StubServer(latency=args.latency, rate_limit=args.rate) as server:
+        start = time.perf_counter()
+        found = sequential(titles, server.url)
+        elapsed = time.perf_counter() - start
+        print(f"sequential: {len(titles)} titles, {found} found in {elapsed:.2f}s "
+              f"({len(titles) / elapsed:.1f} titles/s)")
+
+        for label, batch_size in (('harvester', 1), (f'batched x{args.batch_size}', args.batch_size)):
+            # the stub's rate window needs to reset between runs
+            time.sleep(1)
+            server.stats.update(requests=0, rate_limited=0)
+            start = time.perf_counter()
+            found, num_requests = asyncio.run(concurrent(titles, server.url, args.rate, batch_size))
+            elapsed = time.perf_counter() - start
+            print(f"{label}: {len(titles)} titles, {found} found in {elapsed:.2f}s with {num_requests} requests "
+                  f"({len(titles) / elapsed:.1f} titles/s, {server.stats['rate_limited']} rate limited)")
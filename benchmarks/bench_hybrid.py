@@ -0,0 +1,82 @@
+"""Latency of hybrid recommendations on a synthetic library: the personalized PageRank walk over the similar_games graph
+on its own (against whole-graph sparse mat-vec iteration), and the full blend with content scores.
+
+    python -m benchmarks.bench_hybrid --titles 100000 --steps 2 3 4
+"""
+import argparse
+import time
+
+import numpy as np
+from scipy import sparse
+
+from benchmarks.bench_ann import percentiles
+from benchmarks.synthetic_library import SyntheticLibrary
+from response_parser import parse_payloads
+from text_processing.encoders import MultiLabelEncoder
+from text_processing.hybrid import HybridRecommender, SimilarGamesGraph
+from text_processing.similarity_metrics import FusedRecommender
+from text_processing.summary_features import SummaryVectorizer
+
+
+def matvec_pagerank(transition: sparse.csr_matrix, dangling: np.ndarray, target: int, restart: float,
+                    steps: int) -> np.ndarray:
+    # the textbook version: every step is a mat-vec over the whole graph
+    scores = np.zeros(transition.shape[0])
+    scores[target] = 1.0
+    for _ in range(steps):
+        spread = (1 - restart) * (transition @ scores)
+        spread[target] += restart * scores[~dangling].sum() + scores[dangling].sum()
+        scores = spread
+    return scores
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--titles', type=int, default=100_000)
+    parser.add_argument('--queries', type=int, default=300)
+    parser.add_argument('-k', type=int, default=10)
+    parser.add_argument('--steps', type=int, nargs='+', default=[2, 3, 4])
+    parser.add_argument('--summary', action='store_true', help='include summary tf-idf in the content features')
+    args = parser.parse_args()
+
+    df = parse_payloads(SyntheticLibrary.from_datasets().payloads(args.titles)).to_pandas()
+    start = time.perf_counter()
+    graph = SimilarGamesGraph.from_library(df['name'], df['similar_games'])
+    print(f"graph: {len(graph)} games, {graph.num_edges} edges, mean degree {graph.degree.mean():.1f}, "
+          f"built in {time.perf_counter() - start:.2f}s")
+
+    blocks = {field: MultiLabelEncoder().fit_transform(df[field])
+              for field in ['genres', 'platforms', 'themes', 'involved_companies']}
+    if args.summary:
+        blocks['summary'] = SummaryVectorizer('fitted', min_df=2, preprocess=False).fit_transform(df['summary'])
+    recommender = FusedRecommender(blocks)
+
+    adjacency = sparse.csr_matrix((np.ones(len(graph.indices)), graph.indices, graph.indptr),
+                                  shape=(len(graph), len(graph)))
+    dangling = graph.degree == 0
+    transition = (adjacency @ sparse.diags(np.divide(1, graph.degree, out=np.zeros(len(graph)),
+                                                     where=~dangling))).tocsr()
+    targets = np.random.default_rng(1).integers(0, len(graph), args.queries)
+
+    for steps in args.steps:
+        latencies, reference, error = [], [], 0.0
+        for target in targets:
+            start = time.perf_counter()
+            scores = graph.personalized_pagerank(int(target), steps=steps)
+            latencies.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            expected = matvec_pagerank(transition, dangling, int(target), 0.3, steps)
+            reference.append(time.perf_counter() - start)
+            error = max(error, float(np.abs(scores - expected).max()))
+        print(f"walk, {steps} steps     {percentiles(latencies)}   whole-graph mat-vecs {percentiles(reference)}  "
+              f"max diff {error:.1e}")
+
+    hybrid = HybridRecommender(recommender, graph, df['rating_count'])
+    for name, weights in [('content only', {'content': 1.0}), ('hybrid', None)]:
+        hybrid.set_weights(weights or {'content': 0.6, 'graph': 0.3, 'popularity': 0.1})
+        latencies = []
+        for target in targets:
+            start = time.perf_counter()
+            hybrid.recommend(int(target), args.k)
+            latencies.append(time.perf_counter() - start)
+        print(f"{name:<18} {percentiles(latencies)}")
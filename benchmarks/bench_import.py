@@ -0,0 +1,72 @@
+"""Cold-start import times of the project's modules, each measured in a fresh interpreter. Exits non-zero if a module
+goes over its time budget or drags in a heavy dependency that should only load on first use, so it can run as a
+regression check:
+
+    python -m benchmarks.bench_import --repeat 5
+"""
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+repo_root = Path(__file__).parent.parent
+
+# seconds, generous enough for a slow CI box; numpy + pandas alone are ~1s there
+import_budgets = {
+    'data_pull': 0.5,
+    'response_cache': 0.2,
+    'text_processing.dataset_clean': 1.5,
+    'text_processing.nlp': 1.5,
+    'text_processing.similarity_metrics': 1.5,
+    'text_processing.encoders': 1.5,
+    'text_processing.title_index': 1.5,
+    'recommendation_service': 2.5,
+}
+
+# dependencies that take seconds to import and must only load when a function actually needs them
+lazy_dependencies = ['sklearn', 'nltk', 'matplotlib', 'category_encoders']
+
+probe = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'loaded': [m for m in {lazy} if m in sys.modules]}}))
+"""
+
+
+def measure(module: str, repeat: int = 3) -> dict:
+    """Best-of-repeat import time of a module in a fresh interpreter, and which lazy dependencies it loaded"""
+    runs = []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, '-c', probe.format(module=module, lazy=lazy_dependencies)],
+                                cwd=repo_root, capture_output=True, text=True, check=True)
+        runs.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    return {'seconds': min(run['seconds'] for run in runs), 'loaded': runs[0]['loaded']}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('modules', nargs='*', default=list(import_budgets))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', type=Path, help='also write the results here')
+    args = parser.parse_args()
+
+    results, failures = {}, []
+    for module in args.modules:
+        result = results[module] = measure(module, args.repeat)
+        budget = import_budgets.get(module)
+        over_budget = budget is not None and result['seconds'] > budget
+        if over_budget:
+            failures.append(f"{module} took {result['seconds']:.3f}s, budget {budget}s")
+        if result['loaded']:
+            failures.append(f"{module} imported {', '.join(result['loaded'])} at import time")
+        status = 'FAIL' if over_budget or result['loaded'] else 'ok'
+        print(f"{module:40s} {result['seconds'] * 1000:8.1f}ms  budget {budget or '-':>4}s  {status}")
+
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+    if failures:
+        print('\n'.join(failures), file=sys.stderr)
+        sys.exit(1)
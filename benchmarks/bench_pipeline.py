@@ -0,0 +1,179 @@
+"""End-to-end pipeline benchmark on synthetic libraries (see synthetic_library): times every stage from raw IGDB
+payloads to top-k recommendations and records peak memory, then writes the results as JSON so runs can be compared
+across commits.
+
+    python -m benchmarks.bench_pipeline --sizes 5000 50000
+    python -m benchmarks.bench_pipeline --sizes 500000 --skip parse_response preprocess
+    python -m benchmarks.bench_pipeline --compare benchmarks/results/pipeline-<old commit>.json
+
+Stages:
+    parse_response   data_pull.parse_response, game by game
+    parse_payloads   response_parser.parse_payloads, columnar, to a DataFrame
+    clean            dataset_clean.clean_library
+    preprocess       nlp.preprocess_corpus over summaries
+    encode           encoders.fit_encoders + transform for the multi-label fields
+    tfidf            summary_features.SummaryVectorizer (fitted tf-idf) over the preprocessed summaries
+    similarity       building a FusedRecommender over all feature blocks
+    top_k            single-title recommendations for --queries random titles
+
+Each size runs in its own process, so max_rss is that size's peak resident memory. --trace-memory also records each
+stage's peak Python/numpy allocations with tracemalloc, which slows the Python-heavy stages down.
+"""
+import argparse
+import json
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import orjson
+
+repo_root = Path(__file__).parent.parent
+results_dir = Path(__file__).parent.joinpath('results')
+stages = ['parse_response', 'parse_payloads', 'clean', 'preprocess', 'encode', 'tfidf', 'similarity', 'top_k']
+
+
+# ///////////////////////////////////////////////////////////////////////////////////
+
+def _max_rss() -> int:
+    # kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class StageTimer:
+    def __init__(self, trace_memory: bool = False):
+        self.trace_memory = trace_memory
+        self.results = {}
+
+    @contextmanager
+    def stage(self, name: str, **info):
+        if self.trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        yield info
+        seconds = time.perf_counter() - start
+        result = {'seconds': seconds, 'max_rss': _max_rss(), **info}
+        if self.trace_memory:
+            result['peak_traced'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        self.results[name] = result
+        print(f"  {name:<16} {seconds:9.3f}s  max rss {result['max_rss'] / 1024 ** 2:8.1f}MiB", flush=True)
+
+
+def run_size(num_games: int, skip: list, queries: int = 1000, trace_memory: bool = False, n_jobs: int = 1,
+             seed: int = 0) -> dict:
+    from data_pull import parse_response
+    from response_parser import parse_payloads
+    from benchmarks.synthetic_library import SyntheticLibrary
+    from text_processing.dataset_clean import clean_library
+    from text_processing.encoders import MultiLabelEncoder
+    from text_processing.nlp import preprocess_corpus
+    from text_processing.similarity_metrics import FusedRecommender
+
+    timer = StageTimer(trace_memory)
+    start = time.perf_counter()
+    payloads = list(SyntheticLibrary.from_datasets().payloads(num_games, seed))
+    print(f"{num_games} games: generated {sum(map(len, payloads)) / 1024 ** 2:.1f}MiB of payloads in "
+          f"{time.perf_counter() - start:.1f}s", flush=True)
+
+    if 'parse_response' not in skip:
+        with timer.stage('parse_response'):
+            # decode and parse a page at a time, the way the curation notebook does, keeping only the count
+            parsed = sum(len(parse_response(orjson.loads(payload))) for payload in payloads)
+        timer.results['parse_response']['games'] = parsed
+
+    with timer.stage('parse_payloads'):
+        df = parse_payloads(payloads).to_pandas()
+    del payloads
+
+    if 'clean' not in skip:
+        with timer.stage('clean'):
+            df = clean_library(df)
+
+    summaries = df['summary'].fillna('').tolist()
+    if 'preprocess' not in skip:
+        with timer.stage('preprocess', n_jobs=n_jobs):
+            summaries = preprocess_corpus(summaries, n_jobs=n_jobs)
+
+    blocks = {}
+    with timer.stage('encode') as info:
+        # clean_library joins platforms and genres into comma separated strings
+        for field in ['genres', 'platforms', 'themes', 'involved_companies']:
+            sep = ',' if field in ('genres', 'platforms') and 'clean' not in skip else None
+            blocks[field] = MultiLabelEncoder(sep=sep).fit_transform(df[field])
+        info['labels'] = {field: block.shape[1] for field, block in blocks.items()}
+
+    if 'tfidf' not in skip:
+        from text_processing.summary_features import SummaryVectorizer
+        with timer.stage('tfidf') as info:
+            blocks['summary'] = SummaryVectorizer('fitted', preprocess=False).fit_transform(summaries)
+            info['terms'] = blocks['summary'].shape[1]
+
+    with timer.stage('similarity'):
+        recommender = FusedRecommender(blocks)
+
+    targets = np.random.default_rng(seed).integers(0, num_games, queries)
+    latencies = []
+    with timer.stage('top_k', queries=queries) as info:
+        for target in targets:
+            query_start = time.perf_counter()
+            recommender.recommend(int(target), N=10)
+            latencies.append(time.perf_counter() - query_start)
+        info['p50_ms'] = float(np.percentile(latencies, 50) * 1000)
+        info['p99_ms'] = float(np.percentile(latencies, 99) * 1000)
+    return timer.results
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=repo_root, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old: dict, new: dict):
+    """Prints new / old time for each stage both runs have"""
+    print(f"\n{'size':>8} {'stage':<16} {'old':>9} {'new':>9} {'ratio':>7}")
+    for size, new_stages in new['results'].items():
+        for stage, result in new_stages.items():
+            old_result = old['results'].get(size, {}).get(stage)
+            if old_result:
+                print(f"{size:>8} {stage:<16} {old_result['seconds']:8.3f}s {result['seconds']:8.3f}s "
+                      f"{result['seconds'] / old_result['seconds']:6.2f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[5_000, 50_000])
+    parser.add_argument('--skip', nargs='*', default=[], choices=['parse_response', 'clean', 'preprocess', 'tfidf'])
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--n-jobs', type=int, default=1, help='worker processes for preprocess')
+    parser.add_argument('--trace-memory', action='store_true')
+    parser.add_argument('--out', type=Path, help='default: benchmarks/results/pipeline-<commit>.json')
+    parser.add_argument('--compare', type=Path, help='an earlier results file to compare against')
+    args = parser.parse_args()
+
+    commit = git_commit()
+    report = {'commit': commit, 'timestamp': datetime.now(timezone.utc).isoformat(),
+              'python': platform.python_version(), 'machine': platform.machine(), 'argv': sys.argv[1:],
+              'results': {}}
+    for size in args.sizes:
+        # a fresh process per size keeps max_rss from carrying over between sizes
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            report['results'][str(size)] = executor.submit(run_size, size, args.skip, args.queries,
+                                                           args.trace_memory, args.n_jobs).result()
+
+    out = args.out or results_dir.joinpath(f"pipeline-{commit or 'unknown'}.json")
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2))
+    print(f"wrote {out}")
+    if args.compare:
+        compare(json.loads(args.compare.read_text()), report)
@@ -0,0 +1,47 @@
+"""Single-title recommendation latency on a synthetic library, with no N x N similarity matrix.
+
+    python -m benchmarks.bench_recommender --titles 100000
+"""
+import argparse
+import time
+
+import numpy as np
+from scipy import sparse
+
+from text_processing.similarity_metrics import SimilarityRecommender
+
+
+def synthetic_features(num_titles: int, num_labels: int = 200, labels_per_title: int = 6,
+                       seed: int = 0) -> sparse.csr_matrix:
+    # zipf-like label popularity, as genres/themes/platforms have a few very common labels
+    rng = np.random.default_rng(seed)
+    popularity = 1 / np.arange(1, num_labels + 1)
+    popularity /= popularity.sum()
+    indices = rng.choice(num_labels, size=(num_titles, labels_per_title), p=popularity)
+    rows = np.repeat(np.arange(num_titles), labels_per_title)
+    matrix = sparse.csr_matrix((np.ones(rows.size, dtype=np.float32), (rows, indices.ravel())),
+                               shape=(num_titles, num_labels))
+    matrix.data[:] = 1
+    return matrix
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--titles', type=int, default=100_000)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('-k', type=int, default=10)
+    args = parser.parse_args()
+
+    features = synthetic_features(args.titles)
+    start = time.perf_counter()
+    recommender = SimilarityRecommender(features)
+    print(f"built for {args.titles} titles in {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    targets = np.random.default_rng(1).integers(0, args.titles, args.queries)
+    latencies = []
+    for target in targets:
+        start = time.perf_counter()
+        recommender.recommend(int(target), args.k)
+        latencies.append(time.perf_counter() - start)
+    latencies = np.array(latencies) * 1000
+    print(f"recommend k={args.k}: p50 {np.percentile(latencies, 50):.3f}ms  p99 {np.percentile(latencies, 99):.3f}ms")
@@ -0,0 +1,41 @@
+"""Memory and speed of RecordStore against the list of parse_response dicts, on a synthetic library.
+
+    python -m benchmarks.bench_record_store --titles 50000
+"""
+import argparse
+import time
+
+import orjson
+
+from benchmarks.synthetic_library import SyntheticLibrary
+from data_pull import parse_response
+from record_store import RecordStore
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--titles', type=int, default=50_000)
+    args = parser.parse_args()
+
+    payloads = list(SyntheticLibrary.from_datasets().payloads(args.titles))
+
+    start = time.perf_counter()
+    rows = [row for payload in payloads for row in parse_response(orjson.loads(payload))]
+    print(f"parse_response rows:      {time.perf_counter() - start:7.3f}s")
+    start = time.perf_counter()
+    store = RecordStore.from_payloads(payloads)
+    print(f"RecordStore.from_payloads {time.perf_counter() - start:7.3f}s")
+
+    report = store.memory_report(rows)
+    print(f"dicts: {report['baseline_bytes'] / 1024 ** 2:8.1f}MiB  store: {report['store_bytes'] / 1024 ** 2:8.1f}MiB  "
+          f"x{report['ratio']:.1f} smaller")
+    print(f"vocabulary sizes: {report['vocabulary_sizes']}")
+
+    start = time.perf_counter()
+    sum(len(game.platforms) for game in store)
+    print(f"iterate records (platforms): {time.perf_counter() - start:7.3f}s")
+    start = time.perf_counter()
+    sum(len(row['platforms']) for row in rows)
+    print(f"iterate dicts (platforms):   {time.perf_counter() - start:7.3f}s")
+    start = time.perf_counter()
+    df = store.to_pandas()
+    print(f"to_pandas:                   {time.perf_counter() - start:7.3f}s  {df.shape}")
@@ -0,0 +1,64 @@
+"""Footprint and throughput of SummaryVectorizer's fitted and hashing modes on synthetic summaries. Half the summaries
+are used to fit, the other half stand in for newly harvested games and are transformed in batches.
+
+    python -m benchmarks.bench_summary_features --summaries 100000
+    python -m benchmarks.bench_summary_features --summaries 100000 --preprocess
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.synthetic_library import SyntheticLibrary
+from record_store import deep_size
+from text_processing.summary_features import SummaryVectorizer, summary_modes
+
+
+def csr_bytes(matrix) -> int:
+    return matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--summaries', type=int, default=100_000)
+    parser.add_argument('--batch-size', type=int, default=10_000)
+    parser.add_argument('--preprocess', action='store_true', help='run nlp.preprocess_corpus first (slow)')
+    args = parser.parse_args()
+
+    summaries = [game.get('summary', '') for game in SyntheticLibrary.from_datasets().games(args.summaries)]
+    fit_summaries, new_summaries = summaries[:len(summaries) // 2], summaries[len(summaries) // 2:]
+    if args.preprocess:
+        from text_processing.nlp import preprocess_corpus
+        start = time.perf_counter()
+        fit_summaries, new_summaries = preprocess_corpus(fit_summaries), preprocess_corpus(new_summaries)
+        print(f"preprocess: {time.perf_counter() - start:.1f}s")
+
+    for mode in summary_modes:
+        vectorizer = SummaryVectorizer(mode, preprocess=False)
+        start = time.perf_counter()
+        fitted = vectorizer.fit_transform(fit_summaries, args.batch_size)
+        fit_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        transformed = vectorizer.transform(new_summaries, args.batch_size)
+        transform_seconds = time.perf_counter() - start
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory).joinpath('summary_tfidf.npz')
+            vectorizer.save(path)
+            artifact = path.stat().st_size
+            start = time.perf_counter()
+            SummaryVectorizer.load(path)
+            load_seconds = time.perf_counter() - start
+
+        # what the vectorizer keeps in memory to transform: the vocabulary (fitted) and idf weights
+        state = vectorizer.idf_.nbytes + (deep_size(vectorizer._vectorizer.vocabulary_)
+                                          if mode == 'fitted' else 0)
+        matrix = csr_bytes(fitted) + csr_bytes(transformed)
+        dense = (fitted.shape[0] + transformed.shape[0]) * fitted.shape[1] * 8
+        print(f"\n{mode}: {fitted.shape[1]} columns, {fitted.nnz + transformed.nnz} non-zeros, {fitted.dtype}")
+        print(f"  fit_transform {len(fit_summaries)}:  {fit_seconds:7.2f}s  {len(fit_summaries) / fit_seconds:9.0f}/s")
+        print(f"  transform {len(new_summaries)}:      {transform_seconds:7.2f}s  "
+              f"{len(new_summaries) / transform_seconds:9.0f}/s")
+        print(f"  matrix: {matrix / 1024 ** 2:8.1f}MiB  (dense float64: {dense / 1024 ** 3:.1f}GiB)")
+        print(f"  in-memory state: {state / 1024 ** 2:6.2f}MiB  artifact: {artifact / 1024 ** 2:6.2f}MiB  "
+              f"load: {load_seconds * 1000:.0f}ms")
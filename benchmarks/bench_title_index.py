@@ -0,0 +1,41 @@
+"""Build time and lookup latency of TitleIndex, for exact and typo'd queries, over the vgsales.csv names.
+
+    python -m benchmarks.bench_title_index --queries 2000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.bench_ann import percentiles
+from text_processing.title_index import TitleIndex
+
+
+def add_typo(title: str, rng: np.random.Generator) -> str:
+    i = rng.integers(0, max(1, len(title) - 1))
+    return title[:i] + title[i + 1:i + 2] + title[i:i + 1] + title[i + 2:]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--csv', default='datasets/vgsales.csv')
+    parser.add_argument('--queries', type=int, default=2000)
+    args = parser.parse_args()
+
+    names = pd.read_csv(args.csv)['Name'].dropna().drop_duplicates().tolist()
+    start = time.perf_counter()
+    index = TitleIndex(names)
+    print(f"built index over {len(names)} titles in {time.perf_counter() - start:.3f}s")
+
+    rng = np.random.default_rng(0)
+    targets = rng.choice(len(names), args.queries)
+    for label, queries in [('exact', [names[i] for i in targets]),
+                           ('typo', [add_typo(names[i], rng) for i in targets])]:
+        latencies, hits = [], 0
+        for target, query in zip(targets, queries):
+            start = time.perf_counter()
+            found = index.resolve(query)
+            latencies.append(time.perf_counter() - start)
+            hits += found is not None and names[found] == names[target]
+        print(f"{label:6s} {percentiles(latencies)}  top-1 accuracy {hits / len(queries):.3f}")
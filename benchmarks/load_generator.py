@@ -0,0 +1,90 @@
+"""Load generator for recommendation_service. Fires concurrent /recommend requests and reports throughput, latency
+percentiles and how well the service batched them. Without --url the service is started in-process on a free port.
+
+    python -m benchmarks.load_generator --library datasets/new_data.csv --requests 2000 --concurrency 32
+    python -m benchmarks.load_generator --url http://127.0.0.1:8090 --titles Minecraft Tetris
+"""
+import argparse
+import asyncio
+import time
+
+import aiohttp
+import numpy as np
+from aiohttp import web
+
+from benchmarks.bench_ann import percentiles
+from recommendation_service import RecommendationService, create_app, load_library
+
+
+async def run_load(url: str, titles: list, num_requests: int, concurrency: int, k: int, seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed)
+    # zipf-ish popularity, so some titles come up often enough to hit the cache
+    popularity = 1 / np.arange(1, len(titles) + 1)
+    picks = rng.choice(len(titles), num_requests, p=popularity / popularity.sum())
+    latencies, statuses = [], {}
+    queue = asyncio.Queue()
+    for i in picks:
+        queue.put_nowait(titles[i])
+
+    async def worker(session: aiohttp.ClientSession):
+        while not queue.empty():
+            title = queue.get_nowait()
+            start = time.perf_counter()
+            async with session.post(f"{url}/recommend", json={'title': title, 'k': k}) as response:
+                await response.read()
+            latencies.append(time.perf_counter() - start)
+            statuses[response.status] = statuses.get(response.status, 0) + 1
+
+    start = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*[worker(session) for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+        async with session.get(f"{url}/metrics") as response:
+            metrics = dict(line.rsplit(' ', 1) for line in (await response.text()).splitlines()
+                           if line.startswith('vgrm_') and '{' not in line)
+    return {'elapsed': elapsed, 'latencies': latencies, 'statuses': statuses, 'metrics': metrics}
+
+
+async def main(args):
+    runner = None
+    titles = args.titles
+    url = args.url
+    if url is None:
+        df = load_library(args.library)
+        titles = titles or df['name'].dropna().sample(min(args.num_titles, len(df)), random_state=0).tolist()
+        service = RecommendationService(df, max_batch=args.max_batch, max_wait=args.max_wait)
+        runner = web.AppRunner(create_app(service))
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        url = f"http://127.0.0.1:{runner.addresses[0][1]}"
+    if not titles:
+        raise ValueError("Pass --titles when running against an external service.")
+
+    try:
+        result = await run_load(url, titles, args.requests, args.concurrency, args.k)
+    finally:
+        if runner is not None:
+            await runner.cleanup()
+
+    metrics = result['metrics']
+    batches = float(metrics.get('vgrm_batches_total', 0))
+    mean_batch = float(metrics.get('vgrm_batched_queries_total', 0)) / batches if batches else 0
+    print(f"{args.requests} requests, concurrency {args.concurrency}: {args.requests / result['elapsed']:8.1f} req/s  "
+          f"{percentiles(result['latencies'])}")
+    print(f"statuses {result['statuses']}  cache hits {metrics.get('vgrm_cache_hits_total')}  "
+          f"batches {batches:.0f}  mean batch size {mean_batch:.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', help='running service to load; started in-process if not given')
+    parser.add_argument('--library', default='datasets/library', help='library for the in-process service')
+    parser.add_argument('--titles', nargs='*', help='titles to request, default: a sample of the library')
+    parser.add_argument('--num-titles', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--max-batch', type=int, default=64)
+    parser.add_argument('--max-wait', type=float, default=0.002)
+    asyncio.run(main(parser.parse_args()))
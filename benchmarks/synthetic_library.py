@@ -0,0 +1,172 @@
+"""Synthetic IGDB-shaped libraries of any size, for benchmarking.
+
+List lengths, label frequencies, missing-field rates, summary lengths and vocabulary are all taken from the real
+libraries in datasets/ (new_data.csv, plus games.csv for companies and summaries). The long tail of high-cardinality
+fields (tags, involved companies, similar games) grows with the library, at the rate labels first seen once appear in
+the real data, so a 500k library has far more companies than the 772 real games do.
+
+    library = SyntheticLibrary.from_datasets()
+    payloads = library.payloads(50_000)     # orjson-encoded pages of 500 games, like IGDB responses
+"""
+from ast import literal_eval
+from collections import Counter
+from pathlib import Path
+from typing import Iterator, List
+
+import numpy as np
+import orjson
+import pandas as pd
+
+from data_pull import age_ratings, categories, max_query_limit
+
+datasets = Path(__file__).parent.parent.joinpath('datasets')
+
+named_list_fields = ['platforms', 'genres', 'themes']
+# fields whose vocabulary grows with the library, and the prefix of the labels made up for their tail
+tail_fields = {'tags': 'tag', 'involved_companies': 'Company'}
+# made-up tags are numbered from here, clear of real IGDB tag ids
+synthetic_tag_base = 2 ** 40
+
+
+# ///////////////////////////////////////////////////////////////////////////////////
+
+def _lists(col: pd.Series) -> pd.Series:
+    return col.dropna().map(lambda x: list(literal_eval(x)) if isinstance(x, str) else list(x))
+
+
+class FieldDistribution:
+    """Empirical distribution of one list field \n
+    :param lists: the field's lists from the real data (missing entries dropped)
+    :param missing_rate: fraction of games without the field
+    """
+
+    def __init__(self, lists: pd.Series, missing_rate: float):
+        self.lengths = lists.map(len).to_numpy()
+        counts = Counter(label for labels in lists for label in labels)
+        self.labels = np.array(list(counts), dtype=object)
+        self.probs = np.array(list(counts.values()), dtype=float)
+        self.probs /= self.probs.sum()
+        # share of label occurrences that are the only occurrence of their label: how fast the vocabulary grows
+        self.novel_rate = sum(1 for c in counts.values() if c == 1) / max(1, sum(counts.values()))
+        self.missing_rate = missing_rate
+
+    def sample(self, rng: np.random.Generator, num_games: int, tail_prefix: str | None = None) -> List[list]:
+        """Label lists for num_games games; None for games missing the field"""
+        lengths = rng.choice(self.lengths, num_games)
+        labels = self.labels[rng.choice(len(self.labels), lengths.sum(), p=self.probs)]
+        if tail_prefix is not None and self.novel_rate > 0:
+            novel = rng.random(len(labels)) < self.novel_rate
+            tail_size = max(1, int(self.novel_rate * len(labels)))
+            labels[novel] = [f"{tail_prefix} {i}" for i in rng.integers(0, tail_size, novel.sum())]
+        missing = rng.random(num_games) < self.missing_rate
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        return [None if missing[i] else labels[offsets[i]:offsets[i + 1]].tolist() for i in range(num_games)]
+
+
+class SyntheticLibrary:
+    def __init__(self, library: pd.DataFrame, extra_summaries: pd.Series | None = None,
+                 extra_companies: pd.Series | None = None):
+        self.fields = {}
+        for field in named_list_fields + list(tail_fields) + ['age_ratings', 'similar_games']:
+            lists = _lists(library[field])
+            if field == 'involved_companies' and extra_companies is not None:
+                lists = pd.concat([lists, _lists(extra_companies)], ignore_index=True)
+            self.fields[field] = FieldDistribution(lists, library[field].isna().mean())
+
+        age_rating_codes = {name: code for code, name in age_ratings.items()}
+        self.fields['age_ratings'].labels = np.array([age_rating_codes.get(label, 1)
+                                                      for label in self.fields['age_ratings'].labels], dtype=object)
+        category_codes = {name: code for code, name in categories.items()}
+        self.categories = library['category'].map(category_codes).dropna().astype(int).to_numpy()
+        self.years = library['release_dates'].dropna().astype(int).to_numpy()
+        self.ratings = library['rating'].to_numpy()
+        self.rating_counts = library['rating_count'].fillna(0).astype(int).to_numpy()
+
+        summaries = library['summary'].dropna()
+        if extra_summaries is not None:
+            summaries = pd.concat([summaries, extra_summaries.dropna()], ignore_index=True)
+        words = Counter(word for summary in summaries for word in summary.split())
+        self.summary_words = np.array(list(words), dtype=object)
+        self.summary_word_probs = np.array(list(words.values()), dtype=float) / sum(words.values())
+        self.summary_lengths = summaries.str.split().str.len().to_numpy()
+        self.summary_missing_rate = library['summary'].isna().mean()
+
+        title_words = Counter(word for name in library['name'].dropna() for word in name.split())
+        self.title_words = np.array(list(title_words), dtype=object)
+        self.label_ids = {}
+
+    @classmethod
+    def from_datasets(cls, directory: str | Path = datasets) -> 'SyntheticLibrary':
+        directory = Path(directory)
+        library = pd.read_csv(directory.joinpath('new_data.csv')).dropna(subset=['id'])
+        games = pd.read_csv(directory.joinpath('games.csv'))
+        return cls(library, extra_summaries=games['Summary'], extra_companies=games['Team'])
+
+    def games(self, num_games: int, seed: int = 0, first_id: int = 1) -> List[dict]:
+        """num_games IGDB-shaped game bodies, as returned by the games endpoint with data_pull.game_fields"""
+        rng = np.random.default_rng(seed)
+        name_lengths = rng.integers(1, 5, num_games)
+        name_words = self.title_words[rng.integers(0, len(self.title_words), name_lengths.sum())]
+        name_offsets = np.concatenate([[0], np.cumsum(name_lengths)])
+        names = [' '.join(name_words[name_offsets[i]:name_offsets[i + 1]]) for i in range(num_games)]
+
+        lists = {field: dist.sample(rng, num_games, tail_fields.get(field))
+                 for field, dist in self.fields.items() if field != 'similar_games'}
+        # similar games point at other games in the synthetic library
+        similar_lengths = rng.choice(self.fields['similar_games'].lengths, num_games)
+        similar_missing = rng.random(num_games) < self.fields['similar_games'].missing_rate
+        similar = rng.integers(0, num_games, similar_lengths.sum())
+        similar_offsets = np.concatenate([[0], np.cumsum(similar_lengths)])
+
+        summary_lengths = rng.choice(self.summary_lengths, num_games)
+        summary_words = self.summary_words[rng.choice(len(self.summary_words), summary_lengths.sum(),
+                                                      p=self.summary_word_probs)]
+        summary_offsets = np.concatenate([[0], np.cumsum(summary_lengths)])
+        summary_missing = rng.random(num_games) < self.summary_missing_rate
+
+        # label ids stay the same across calls, as IGDB's do
+        label_ids = self.label_ids
+
+        def named(labels):
+            return [{'id': label_ids.setdefault(label, len(label_ids)), 'name': label} for label in labels]
+
+        categories_ = rng.choice(self.categories, num_games)
+        years = rng.choice(self.years, num_games)
+        ratings = rng.choice(self.ratings, num_games)
+        rating_counts = rng.choice(self.rating_counts, num_games)
+        bodies = []
+        for i in range(num_games):
+            slug = f"{names[i].lower().replace(' ', '-')}--{first_id + i}"
+            body = {'id': first_id + i, 'name': names[i], 'slug': slug,
+                    'category': int(categories_[i]), 'release_dates': [{'id': first_id + i, 'y': int(years[i])}],
+                    'rating_count': int(rating_counts[i])}
+            if ratings[i] == ratings[i]:
+                body['rating'] = float(ratings[i])
+            for field in named_list_fields:
+                if lists[field][i] is not None:
+                    body[field] = named(lists[field][i])
+            if lists['tags'][i] is not None:
+                body['tags'] = [synthetic_tag_base + int(tag[4:]) if tag.startswith('tag ') else int(tag)
+                                for tag in lists['tags'][i]]
+            if lists['age_ratings'][i] is not None:
+                body['age_ratings'] = [{'id': j, 'rating': int(code)} for j, code in enumerate(lists['age_ratings'][i])]
+            if lists['involved_companies'][i] is not None:
+                body['involved_companies'] = [{'id': j, 'company': {'id': label_ids.setdefault(name, len(label_ids)),
+                                                                    'name': name}}
+                                              for j, name in enumerate(lists['involved_companies'][i])]
+            if not similar_missing[i]:
+                body['similar_games'] = [{'id': first_id + int(j), 'name': names[j]}
+                                         for j in similar[similar_offsets[i]:similar_offsets[i + 1]]]
+            if not summary_missing[i]:
+                body['summary'] = ' '.join(summary_words[summary_offsets[i]:summary_offsets[i + 1]])
+            bodies.append(body)
+        return bodies
+
+    def payloads(self, num_games: int, seed: int = 0, page_size: int = max_query_limit,
+                 block_size: int = 50_000) -> Iterator[bytes]:
+        """The library as orjson-encoded pages of page_size games, like successive IGDB responses. Games are generated
+        block_size at a time, so large libraries never exist as Python objects all at once"""
+        for block, start in enumerate(range(0, num_games, block_size)):
+            bodies = self.games(min(block_size, num_games - start), seed + block, first_id=start + 1)
+            for page in range(0, len(bodies), page_size):
+                yield orjson.dumps(bodies[page:page + page_size])
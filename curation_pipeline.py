@@ -0,0 +1,439 @@
+"""Streaming curation pipeline: vgsales.csv titles -> IGDB -> the columnar library, out of core.
+
+Replaces the load-everything flow of data_curation.ipynb (read all titles, chunk them, collect passes/fails/discards in
+lists, append_rows at the end) with a chain of generator stages
+
+    read titles -> dedupe -> query -> validate -> parse -> clean -> append
+
+each running in its own thread with a bounded queue to the next, so IGDB requests overlap with parsing and cleaning
+while no stage can run more than a few batches ahead. Rows are flushed to a LibraryStore every flush_rows games, and
+after every flush a checkpoint records how far through the source file the run has got. A crashed or interrupted run
+started again with the same checkpoint picks up at the first title after the last flush: parts written after it are
+dropped and the titles behind them queried again, so nothing is lost or appended twice.
+
+Memory doesn't depend on the size of the source: titles are streamed from the csv, at most queue_size batches wait
+between stages, and the only state that grows is an 8-byte digest per distinct title, for dedupe.
+
+    pipeline = CurationPipeline(twitch_client_id, access_token, store=LibraryStore(default_cleaned_store_path))
+    checkpoint = pipeline.run(datasets.joinpath('vgsales.csv'))
+
+or from the command line:
+
+    python curation_pipeline.py datasets/vgsales.csv --access-token <token>
+"""
+import argparse
+import asyncio
+import csv
+import hashlib
+import json
+import os
+import queue
+import threading
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, List
+
+import pandas as pd
+
+from data_pull import base_igdb_url, parse_response
+from igdb_harvester import HarvestError, IGDBHarvester
+from library_store import LibraryStore, datasets, part_number
+from library_sync import LibraryIndex
+from response_cache import CacheMissError
+
+default_source = datasets.joinpath('vgsales.csv')
+default_checkpoint_path = datasets.joinpath('curation_checkpoint.json')
+default_cleaned_store_path = datasets.joinpath('library_cleaned')
+
+# columns clean_library turns into comma separated strings, which go back into the store as lists
+cleaned_list_fields = ['platforms', 'age_ratings', 'genres']
+
+
+# ///////////////////////////////////////////////////////////////////////////////////
+
+class TitleBatch:
+    """A batch of source titles on its way through the pipeline. `position` is the source row of the batch's last
+    title, which is how far the run has got once the batch is flushed"""
+    __slots__ = ('position', 'titles', 'results', 'bodies', 'rows', 'fails', 'discards')
+
+    def __init__(self, position: int, titles: List[tuple]):
+        self.position = position
+        # (source row, title)
+        self.titles = titles
+        self.results = {}
+        self.bodies: List[dict] = []
+        self.rows: List[dict] = []
+        self.fails: List[tuple] = []
+        self.discards = 0
+
+
+_done = object()
+
+
+def bounded(stage: Iterator, queue_size: int, join_timeout: float = 5) -> Iterator:
+    """Runs a stage in a background thread, handing its output over through a queue of at most queue_size items. An
+    exception in the stage is re-raised in the consumer; closing the consumer stops the stage (and the stages behind
+    it) and waits up to join_timeout seconds for its thread to finish"""
+    items = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        # never block for good on a full queue: the consumer may have gone away
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in stage:
+                if not put(item):
+                    return
+            put(_done)
+        except BaseException as e:
+            put(e)
+        finally:
+            if hasattr(stage, 'close'):
+                stage.close()
+
+    thread = threading.Thread(target=produce, name='bounded-stage', daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        thread.join(join_timeout)
+
+
+# ///////////////////////////////////////// STAGES /////////////////////////////////////////
+
+def read_titles(csv_path: str | Path, column: str = 'Name') -> Iterator[tuple]:
+    """Streams (source row, title) pairs from a csv, one row at a time"""
+    with open(csv_path, encoding='utf-8', newline='') as f:
+        for position, row in enumerate(csv.DictReader(f)):
+            if row.get(column):
+                yield position, row[column]
+
+
+def dedupe_titles(titles: Iterable[tuple]) -> Iterator[tuple]:
+    """Drops repeats of a title, keeping the first, as drop_duplicates(subset=['Name'], keep='first') does"""
+    seen = set()
+    for position, title in titles:
+        digest = hashlib.blake2b(title.encode('utf-8'), digest_size=8).digest()
+        if digest not in seen:
+            seen.add(digest)
+            yield position, title
+
+
+def batch_titles(titles: Iterable[tuple], batch_size: int, after: int = -1) -> Iterator[TitleBatch]:
+    """Groups titles into batches, skipping titles up to source row `after` (those a resumed run already has)"""
+    batch = []
+    for position, title in titles:
+        if position <= after:
+            continue
+        batch.append((position, title))
+        if len(batch) == batch_size:
+            yield TitleBatch(position, batch)
+            batch = []
+    if batch:
+        yield TitleBatch(batch[-1][0], batch)
+
+
+def query_batches(batches: Iterable[TitleBatch], fetch: Callable[[List[str]], dict]) -> Iterator[TitleBatch]:
+    """Looks up each batch's titles, see IGDBFetcher"""
+    for batch in batches:
+        batch.results = fetch(list(dict.fromkeys(title for _, title in batch.titles)))
+        yield batch
+
+
+def validate_batches(batches: Iterable[TitleBatch], known_ids: set, search_type: str) -> Iterator[TitleBatch]:
+    """Sorts results into passes, fails and discards following the rules of request_chunks in data_curation.ipynb:
+    a game without release dates, or one already in the library, is discarded"""
+    for batch in batches:
+        for position, title in batch.titles:
+            result = batch.results.get(title)
+            bodies = result if isinstance(result, list) else [result] if isinstance(result, dict) else []
+            if not bodies:
+                batch.fails.append((position, title, search_type))
+            for body in bodies:
+                if body.get('release_dates') and body.get('id') not in known_ids:
+                    known_ids.add(body.get('id'))
+                    batch.bodies.append(body)
+                else:
+                    batch.discards += 1
+        batch.results = {}
+        yield batch
+
+
+def parse_batches(batches: Iterable[TitleBatch]) -> Iterator[TitleBatch]:
+    for batch in batches:
+        batch.rows = [parse_response(body) for body in batch.bodies]
+        batch.bodies = []
+        yield batch
+
+
+def clean_batches(batches: Iterable[TitleBatch]) -> Iterator[TitleBatch]:
+    """Applies dataset_clean.clean_library to each batch's rows, keeping the cleaned platforms, age ratings and genres
+    as lists so they still fit the library schema"""
+    from text_processing.dataset_clean import clean_library
+
+    for batch in batches:
+        if batch.rows:
+            cleaned = clean_library(pd.DataFrame(batch.rows))
+            for field in cleaned_list_fields:
+                cleaned[field] = [value.split(',') if isinstance(value, str) else None for value in cleaned[field]]
+            batch.rows = cleaned.astype(object).where(cleaned.notna(), None).to_dict('records')
+        yield batch
+
+
+# ///////////////////////////////////////////////////////////////////////////////////
+
+class IGDBFetcher:
+    """Blocking batch lookups for the query stage. Batches are sent by an igdb_harvester.IGDBHarvester (see
+    fetch_batch) running on an event loop in a background thread, so they share its connection pool, rate limiter,
+    retries and splitting of truncated batches. A batch whose request fails for good (see IGDBHarvester.post) comes
+    back empty, so its titles are recorded as fails rather than stopping the run \n
+    :param search_type: see data_pull.format_query
+    :param exact_matches_only: see data_pull.validate_results
+    :param join_timeout: seconds close() waits for the harvester and the loop's thread to shut down
+    :param harvester_kwargs: passed on to IGDBHarvester, e.g. base_url, rate, max_retries or cache
+
+    The loop starts on the first lookup; close the fetcher (or use it as a context manager) to stop it
+    """
+
+    def __init__(self, twitch_client_id: str, access_token: str, search_type: str = 'name equals',
+                 exact_matches_only: bool = True, join_timeout: float = 5, **harvester_kwargs):
+        self.twitch_client_id = twitch_client_id
+        self.access_token = access_token
+        self.search_type = search_type
+        self.exact_matches_only = exact_matches_only
+        self.harvester_kwargs = harvester_kwargs
+        self.harvester: IGDBHarvester | None = None
+        self.join_timeout = join_timeout
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._closed_requests = 0
+
+    @property
+    def num_requests(self) -> int:
+        return self._closed_requests + (self.harvester.num_requests if self.harvester is not None else 0)
+
+    def _start(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                # a new harvester per loop, since its rate limiter's lock belongs to the loop it was first used on
+                self.harvester = IGDBHarvester(self.twitch_client_id, self.access_token, **self.harvester_kwargs)
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+                self._thread.start()
+                asyncio.run_coroutine_threadsafe(self.harvester.__aenter__(), self._loop).result()
+            return self._loop
+
+    def __call__(self, titles: List[str]) -> dict:
+        """Looks up titles, returning title -> validated result (see data_pull.split_batch_results)"""
+        loop = self._start()
+        lookup = self.harvester.fetch_batch(titles, self.search_type, self.exact_matches_only)
+        future = asyncio.run_coroutine_threadsafe(lookup, loop)
+        self._pending.add(future)
+        try:
+            return future.result()
+        except (HarvestError, CacheMissError):
+            return {}
+        finally:
+            self._pending.discard(future)
+
+    def close(self):
+        with self._lock:
+            if self._loop is None:
+                return
+            # lookups still in flight are cancelled, and raise CancelledError in the threads waiting on them
+            for future in list(self._pending):
+                future.cancel()
+            closing = asyncio.run_coroutine_threadsafe(self.harvester.__aexit__(None, None, None), self._loop)
+            closing.result(self.join_timeout)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(self.join_timeout)
+            if not self._thread.is_alive():
+                self._loop.close()
+            self._closed_requests += self.harvester.num_requests
+            self.harvester, self._loop, self._thread = None, None, None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class CurationPipeline:
+    """Runs the curation stages over a title csv, appending to a LibraryStore in batches with a checkpoint after each
+    flush \n
+    :param fetch: titles -> validated results, e.g. an IGDBFetcher. If not given, one is built from
+    twitch_client_id/access_token and fetcher_kwargs, and closed at the end of every run
+    :param store: the library to append to
+    :param checkpoint_path: where progress is saved; a run with an existing checkpoint resumes from it
+    :param fails_path: csv that titles with no match are written to (source row, title, search type), to retry later
+    :param index: a library_sync.LibraryIndex to keep up to date with the appended games
+    :param batch_size: titles per IGDB request
+    :param flush_rows: games to collect before writing a part to the store
+    :param queue_size: batches allowed to wait between two stages
+    :param clean: run dataset_clean.clean_library on the rows before appending them
+    """
+
+    def __init__(self, twitch_client_id: str | None = None, access_token: str | None = None,
+                 fetch: Callable[[List[str]], dict] | None = None, store: LibraryStore | None = None,
+                 checkpoint_path: str | Path = default_checkpoint_path, fails_path: str | Path | None = None,
+                 index: LibraryIndex | None = None, batch_size: int = 50, flush_rows: int = 500, queue_size: int = 4,
+                 clean: bool = True, **fetcher_kwargs):
+        self._owns_fetch = fetch is None
+        self.fetch = fetch or IGDBFetcher(twitch_client_id, access_token, **fetcher_kwargs)
+        self.search_type = getattr(self.fetch, 'search_type', 'name equals')
+        self.store = store if store is not None else LibraryStore(default_cleaned_store_path)
+        self.checkpoint_path = Path(checkpoint_path)
+        self.fails_path = Path(fails_path) if fails_path is not None else self.checkpoint_path.with_suffix('.fails.csv')
+        self.index = index
+        self.batch_size = batch_size
+        self.flush_rows = flush_rows
+        self.queue_size = queue_size
+        self.clean = clean
+
+    # ////////////////////////////////////////// CHECKPOINTS //////////////////////////////////////////
+
+    def load_checkpoint(self, source: Path) -> dict:
+        """The saved checkpoint, or for a new run one that starts at the top of the source and remembers the store's
+        newest part, so parts written before the first flush can be told apart from the library's own"""
+        if not self.checkpoint_path.exists():
+            checkpoint = {'source': str(source), 'position': -1,
+                          'last_part': self.store.parts[-1].name if self.store.parts else '',
+                          'passes': 0, 'fails': 0, 'discards': 0}
+            self.save_checkpoint(checkpoint)
+            return checkpoint
+        with open(self.checkpoint_path, encoding='utf-8') as f:
+            checkpoint = json.load(f)
+        if checkpoint['source'] != str(source):
+            raise ValueError(f"Checkpoint {self.checkpoint_path} belongs to a run over {checkpoint['source']}, "
+                             f"not {source}.")
+        return checkpoint
+
+    def save_checkpoint(self, checkpoint: dict):
+        # write to a temp file first so a crash can't leave a half-written checkpoint behind
+        tmp_path = self.checkpoint_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _rollback(self, checkpoint: dict):
+        """Undoes whatever an interrupted run wrote after its last checkpoint: store parts, and fails past the
+        checkpoint's position. Compacting the store renames its parts, so compact with CurationPipeline.compact,
+        which keeps the checkpoint in step"""
+        for part in self.store.parts:
+            if part_number(part) > part_number(checkpoint['last_part']):
+                part.unlink()
+        if self.fails_path.exists():
+            with open(self.fails_path, encoding='utf-8', newline='') as f:
+                kept = [row for row in csv.reader(f) if int(row[0]) <= checkpoint['position']]
+            with open(self.fails_path, 'w', encoding='utf-8', newline='') as f:
+                csv.writer(f).writerows(kept)
+
+    # ////////////////////////////////////////// RUNNING //////////////////////////////////////////
+
+    def stages(self, source: Path, after: int, known_ids: set) -> Iterator[TitleBatch]:
+        """The chain of stages up to (not including) append, each behind a bounded queue"""
+        titles = bounded(dedupe_titles(read_titles(source)), self.queue_size * self.batch_size)
+        batches = bounded(query_batches(batch_titles(titles, self.batch_size, after), self.fetch), self.queue_size)
+        batches = bounded(parse_batches(validate_batches(batches, known_ids, self.search_type)), self.queue_size)
+        return bounded(clean_batches(batches), self.queue_size) if self.clean else batches
+
+    def _flush(self, rows: List[dict], fails: List[tuple], checkpoint: dict):
+        part = self.store.append(rows) if rows else None
+        if fails:
+            with open(self.fails_path, 'a', encoding='utf-8', newline='') as f:
+                csv.writer(f).writerows(fails)
+        if self.index is not None and rows:
+            for row in rows:
+                self.index.upsert(row['id'], row.get('slug'))
+            self.index.save()
+        if part is not None:
+            checkpoint['last_part'] = part.name
+        self.save_checkpoint(checkpoint)
+
+    def run(self, source: str | Path = default_source, max_titles: int | None = None) -> dict:
+        """Curates every title in the source csv not covered by the checkpoint \n
+        :param max_titles: stop after this many (deduped) titles, e.g. to run in sessions
+        :returns the checkpoint: source position reached, last store part, and pass/fail/discard counts"""
+        source = Path(source)
+        checkpoint = self.load_checkpoint(source)
+        self._rollback(checkpoint)
+        known_ids = self.store.ids()
+
+        rows, fails, processed = [], [], 0
+        batches = self.stages(source, checkpoint['position'], known_ids)
+        try:
+            for batch in batches:
+                rows.extend(batch.rows)
+                fails.extend(batch.fails)
+                checkpoint['position'] = batch.position
+                checkpoint['passes'] += len(batch.rows)
+                checkpoint['fails'] += len(batch.fails)
+                checkpoint['discards'] += batch.discards
+                processed += len(batch.titles)
+                if len(rows) >= self.flush_rows:
+                    self._flush(rows, fails, checkpoint)
+                    rows, fails = [], []
+                if max_titles is not None and processed >= max_titles:
+                    break
+        finally:
+            batches.close()
+            if self._owns_fetch:
+                self.fetch.close()
+        self._flush(rows, fails, checkpoint)
+        return checkpoint
+
+    def compact(self):
+        """Compacts the store between runs (see LibraryStore.compact). Anything an interrupted run wrote after its
+        checkpoint is rolled back first, and the checkpoint then points at the compacted part, so a later run doesn't
+        take that part for one written after the checkpoint"""
+        checkpoint = None
+        if self.checkpoint_path.exists():
+            with open(self.checkpoint_path, encoding='utf-8') as f:
+                checkpoint = json.load(f)
+            self._rollback(checkpoint)
+        part = self.store.compact()
+        if checkpoint is not None:
+            checkpoint['last_part'] = part.name if part is not None else ''
+            self.save_checkpoint(checkpoint)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('source', type=Path, nargs='?', default=default_source)
+    parser.add_argument('--store', type=Path, default=default_cleaned_store_path)
+    parser.add_argument('--checkpoint', type=Path, default=default_checkpoint_path)
+    parser.add_argument('--access-token', required=True, help='oauth2 access token, see data_curation.ipynb')
+    parser.add_argument('--base-url', default=base_igdb_url, help='e.g. an igdb_stub_server url for offline runs')
+    parser.add_argument('--search-type', default='name equals')
+    parser.add_argument('--batch-size', type=int, default=50)
+    parser.add_argument('--flush-rows', type=int, default=500)
+    parser.add_argument('--max-titles', type=int)
+    parser.add_argument('--no-clean', action='store_true')
+    parser.add_argument('--compact', action='store_true', help='compact the store after the run')
+    args = parser.parse_args()
+
+    from api_auth_keys import twitch_client_id
+    pipeline = CurationPipeline(twitch_client_id, args.access_token, store=LibraryStore(args.store),
+                                checkpoint_path=args.checkpoint, batch_size=args.batch_size,
+                                flush_rows=args.flush_rows, clean=not args.no_clean, base_url=args.base_url,
+                                search_type=args.search_type)
+    print(pipeline.run(args.source, args.max_titles))
+    if args.compact:
+        pipeline.compact()
@@ -2,8 +2,11 @@ from typing import List
 
 import requests
 from requests import Response
-from typing import List
-from Game import Game
+
+from instrumentation import count, instrumented, timer
+from response_cache import ResponseCache, CacheMissError
+
+base_igdb_url = "https://api.igdb.com/v4"
 
 # ///////////////////////////////////////////////////////////////////////////////////
 # dicts needed for mapping json data
@@ -68,6 +71,16 @@ age_ratings = {
     39: 'ACB_RC'
 }
 
+# fields requested for each game, and the categories of game we accept
+game_fields = ["id", "name", "release_dates.y", "category", "slug", "platforms.name", "genres.name", "tags",
+               "age_ratings.rating", "rating", "rating_count", "similar_games.name", "themes.name", "summary",
+               "involved_companies.company.name"]
+game_categories = [0, 1, 2, 8, 9, 10, 11]
+
+# IGDB caps the results of a single query at 500, and a multiquery at 10 sub-queries
+max_query_limit = 500
+max_multiquery_size = 10
+
 
 # ///////////////////////////////////////////////////////////////////////////////////
 
@@ -83,10 +96,8 @@ def format_query(title: str, search_type: str = 'name equals', sort_results: boo
     :param sort_results: sort the result of the query or not. Not compatible with search_type = 'search'. If true, then a value for 'sort_by' must also be passed
     """
 
-    fields = ["id", "name", "release_dates.y", "category", "slug", "platforms.name", "genres.name", "tags",
-              "age_ratings.rating", "rating", "rating_count", "similar_games.name", "themes.name", "summary",
-              "involved_companies.company.name"]
-    cats = [0, 1, 2, 8, 9, 10, 11]
+    fields = game_fields
+    cats = game_categories
 
     query_fields = f'f {",".join(fields)};'
 
@@ -120,28 +131,136 @@ def format_query(title: str, search_type: str = 'name equals', sort_results: boo
     return query.encode('utf-8')
 
 
-def post_request(query: str, twitch_client_id: str, access_token: str, endpoint: str = 'games') -> Response | None:
+def _quote(title: str) -> str:
+    return '"' + title.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def format_batch_query(titles: List[str], limit: int = max_query_limit, offset: int = 0) -> bytes:
+    """formats a single 'name equals' query matching any of the titles provided \n
+    :param titles: the titles to search for. Keep the batch small enough that every version of every title fits
+    within the limit; split_batch_results can't tell a title that wasn't found from one that was cut off
+    :param limit: max num of entries to return, at most 500
+    :param offset: num of entries to skip
+    """
+    cats = ",".join([str(i) for i in game_categories])
+    query = (f'f {",".join(game_fields)};'
+             f'where (name = ({",".join(_quote(title) for title in titles)})) & (category = ({cats})) & (version_parent = null);'
+             f'limit {limit};offset {offset};')
+    return query.encode('utf-8')
+
+
+def format_multiquery(titles: List[str], search_type: str = 'search', limit: int = 25) -> bytes:
+    """formats an IGDB multiquery with one sub-query per title, for search types that can't be combined into a single
+    where clause. Each sub-query is named after the title's position in the list \n
+    :param titles: the titles to search for, at most 10
+    :param search_type: see format_query
+    :param limit: max num of entries to return per title
+    """
+    if len(titles) > max_multiquery_size:
+        raise ValueError(f"A multiquery can hold at most {max_multiquery_size} queries, got {len(titles)}.")
+
+    sub_queries = []
+    for i, title in enumerate(titles):
+        # drop the trailing 'offset' clause, there is nothing to page through here
+        body = format_query(_quote(title)[1:-1], search_type=search_type, limit=limit).decode('utf-8')
+        body = body[:body.rindex('offset')]
+        sub_queries.append(f'query games "{i}" {{{body}}};')
+    return "".join(sub_queries).encode('utf-8')
+
+
+def split_batch_results(data: list, titles: List[str], exact_matches_only: bool = True) -> dict:
+    """Sends each record in a batched response back to the title that asked for it, then applies the rules of
+    validate_results to each title's share \n
+    :param data: the decoded json body of a response to format_batch_query or format_multiquery
+    :param titles: the titles in the batch, in the order they were passed to the query builder
+    :param exact_matches_only: see validate_results
+    :returns a dict of title -> validated result for every title in the batch"""
+    grouped = {title: [] for title in titles}
+    if data and 'result' in data[0]:
+        # multiquery responses come back as a list of {'name': <sub-query name>, 'result': [...]}
+        for sub_query in data:
+            grouped[titles[int(sub_query['name'])]].extend(sub_query['result'])
+    else:
+        for body in data:
+            if body.get('name') in grouped:
+                grouped[body.get('name')].append(body)
+    return {title: validate_results(results, title, exact_matches_only) for title, results in grouped.items()}
+
+
+@instrumented()
+def post_request(query: str, twitch_client_id: str, access_token: str, endpoint: str = 'games',
+                 base_url: str = base_igdb_url, cache: ResponseCache | None = None) -> Response | None:
     """Sends request to IGDB for data based on the endpoint provided, and content of the query \n
     :param query: query encoded as a byte-string
     :param endpoint: the endpoint to pull data from. For now, we will only use 'games'
+    :param base_url: root of the api, can be pointed at igdb_stub_server for offline runs
+    :param cache: serve repeated queries from disk instead of IGDB, see response_cache.ResponseCache.
+    In offline mode, a query that isn't cached raises CacheMissError
     :returns DB response as a json"""
-    base_igdb_url = "https://api.igdb.com/v4"
-    url = base_igdb_url + "/" + f"{endpoint}"
+    url = base_url + "/" + f"{endpoint}"
+
+    if cache is not None:
+        body = cache.get(endpoint, query)
+        if body is not None:
+            count('igdb_cache_hits')
+            return _cached_response(url, body)
+        if cache.offline:
+            raise CacheMissError(f"No cached response for query to {url}: {query[:120]!r}")
 
     headers = {'headers': {'Client-ID': twitch_client_id,
                            'Authorization': f"Bearer {access_token}"},
                'data': query}
 
-    response = requests.post(url, **headers)
+    with timer('igdb_http'):
+        response = requests.post(url, **headers)
+    count('igdb_requests')
 
     if response is None:
         return None
     else:
+        if cache is not None and response.status_code == 200:
+            cache.put(endpoint, query, response.content)
         return response
 
 
+def _cached_response(url: str, body: bytes) -> Response:
+    # rebuild a Response so callers can't tell a cached body apart from a fresh one
+    response = Response()
+    response.status_code = 200
+    response.url = url
+    response.encoding = 'utf-8'
+    response._content = body
+    return response
+
+
+@instrumented()
+def validate_results(data: list, title: str, exact_matches_only: bool = True) -> dict | list | None:
+    """Applies the same matching rules as validate_response, but to an already-decoded list of results \n
+    :param data: the decoded json body of a response
+    :param title: the title that was searched for
+    :param exact_matches_only: only accept a single result whose name matches the title exactly
+    :returns the matching result, a list of results (when exact_matches_only is False), or None"""
+    num_results = len(data)
+
+    if num_results == 0:
+        return None
+
+    elif num_results == 1:
+        body = data[0]
+        if exact_matches_only and title != body.get('name'):
+            return None
+        return body
+
+    # more than one result is ambiguous when we need an exact match
+    if exact_matches_only:
+        return None
+    return list(data)
+
+
+@instrumented()
 def validate_response(response: Response, title: str, exact_matches_only: bool = True) -> dict | list | None:
-    data = response.json()
+    with timer('json_decode'):
+        data = response.json()
     num_results = len(data)
 
     if num_results == 0:
@@ -180,6 +299,7 @@ def validate_response(response: Response, title: str, exact_matches_only: bool =
                 return None
 
 
+@instrumented()
 def parse_response(response) -> List[dict] | dict | None:
     # some gnarly code to extract values from the json data for games
     if isinstance(response, dict):
@@ -205,32 +325,14 @@ def parse_response(response) -> List[dict] | dict | None:
                   }
         return result
 
-    elif isinstance(response, list):
-        responses = []
-        for i in range(len(response.json())):
-            data = response.json()
-            body: dict = data[i]
-            result = {"id": body.get('id'),
-                      "release_dates": body.get('release_dates')[0].get('y'),
-                      "name": body.get('name'),
-                      "category": categories[body['category']] if 'category' in body else None,
-                      "slug": body.get('slug'),
-                      "platforms": [i['name'] for i in body['platforms']] if 'platforms' in body else None,
-                      "genres": [i['name'] for i in body['genres']] if 'genres' in body else None,
-                      "tags": [str(i) for i in body['tags']] if 'tags' in body else None,
-                      "age_ratings": [age_ratings[i['rating']] for i in
-                                      body['age_ratings']] if 'age_ratings' in body else None,
-                      "rating": body.get('rating', None),
-                      "rating_count": body.get('rating_count', 0),
-                      "similar_games": [i['name'] for i in body['similar_games']] if 'similar_games' in body else None,
-                      "themes": [i['name'] for i in body['themes']] if 'themes' in body else None,
-                      "summary": body.get('summary'),
-                      "involved_companies": [i['company']['name'] for i in
-                                             body['involved_companies']] if 'involved_companies' in body else None
-                      }
-
-            responses.append(result)
-        return responses
+    elif isinstance(response, (list, Response)):
+        # decode the payload once, rather than once per game. See response_parser for a columnar version of this
+        if isinstance(response, Response):
+            with timer('json_decode'):
+                data = response.json()
+        else:
+            data = response
+        return [parse_response(body) for body in data]
 
 
 
@@ -0,0 +1,232 @@
+import asyncio
+import json
+import random
+import time
+from typing import Iterable, List, Tuple
+
+import aiohttp
+
+from data_pull import base_igdb_url, format_query, format_batch_query, format_multiquery, split_batch_results, \
+    validate_results, parse_response, max_query_limit, max_multiquery_size
+from response_cache import ResponseCache, CacheMissError
+
+# IGDB allows 4 requests/sec, with up to 8 requests open at any one time
+IGDB_RATE_LIMIT = 4
+IGDB_MAX_IN_FLIGHT = 8
+
+# status codes worth retrying: rate limited, or a temporary problem on IGDB's end
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+# ///////////////////////////////////////////////////////////////////////////////////
+
+class TokenBucket:
+    """Async token bucket rate limiter. Tokens refill continuously at `rate` per second, up to `capacity`.
+    The default capacity of 1 spaces requests evenly rather than allowing bursts"""
+
+    def __init__(self, rate: float = IGDB_RATE_LIMIT, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else 1
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self):
+        # the lock makes waiters queue up in order, so nobody gets starved
+        async with self._lock:
+            self._refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+
+class HarvestError(Exception):
+    """Raised when a request still fails after all retries, or fails in a way retrying won't fix"""
+
+
+class IGDBHarvester:
+    """Sends queries to IGDB concurrently over a pool of keep-alive connections, respecting the rate limit \n
+    :param twitch_client_id: twitch client id, see api_auth_keys.py
+    :param access_token: oauth2 access token
+    :param base_url: root of the api; point this at igdb_stub_server for offline runs
+    :param rate: max requests per second
+    :param max_in_flight: max number of requests open at once
+    :param max_retries: number of times to retry a request before giving up on it
+    :param backoff: base delay (in seconds) for exponential backoff between retries
+    :param timeout: total timeout (in seconds) for a single request
+    :param cache: serve repeated queries from disk, see response_cache.ResponseCache. Cached queries don't count
+    against the rate limit
+
+    Usage:
+        async with IGDBHarvester(twitch_client_id, access_token) as harvester:
+            passes, fails, discards = await harvester.harvest(titles)
+    """
+
+    def __init__(self, twitch_client_id: str, access_token: str, base_url: str = base_igdb_url,
+                 rate: float = IGDB_RATE_LIMIT, max_in_flight: int = IGDB_MAX_IN_FLIGHT, max_retries: int = 5,
+                 backoff: float = 0.5, timeout: float = 30, cache: ResponseCache | None = None):
+        self.base_url = base_url.rstrip('/')
+        self.headers = {'Client-ID': twitch_client_id,
+                        'Authorization': f"Bearer {access_token}"}
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.limiter = TokenBucket(rate)
+        self.cache = cache
+        self.session: aiohttp.ClientSession | None = None
+        self.num_requests = 0
+        self.num_retries = 0
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.max_in_flight, keepalive_timeout=60)
+        self.session = aiohttp.ClientSession(connector=connector, headers=self.headers, timeout=self.timeout)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+        self.session = None
+
+    def _retry_delay(self, attempt: int, retry_after: str | None = None) -> float:
+        if retry_after is not None:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        # exponential backoff with full jitter
+        return random.uniform(0, self.backoff * 2 ** attempt)
+
+    async def post(self, query: bytes, endpoint: str = 'games') -> list:
+        """Sends a single query, retrying with backoff on rate limiting, server and connection errors \n
+        :param query: query encoded as a byte-string
+        :param endpoint: the endpoint to pull data from
+        :returns the decoded json body of the response
+        :raises HarvestError when retries run out, or straight away on any other HTTP error status"""
+        url = f"{self.base_url}/{endpoint}"
+        if self.cache is not None:
+            body = self.cache.get(endpoint, query)
+            if body is not None:
+                return json.loads(body)
+            if self.cache.offline:
+                raise CacheMissError(f"No cached response for query to {url}: {query[:120]!r}")
+
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire()
+            self.num_requests += 1
+            retry_after = None
+            try:
+                async with self.session.post(url, data=query) as response:
+                    if response.status not in RETRY_STATUSES:
+                        if response.status >= 400:
+                            # e.g. a query IGDB can't parse; sending it again won't help
+                            raise HarvestError(f"Request to {url} failed with HTTP {response.status}: "
+                                               f"{(await response.text())[:200]}")
+                        body = await response.read()
+                        if self.cache is not None:
+                            self.cache.put(endpoint, query, body)
+                        return json.loads(body)
+                    retry_after = response.headers.get('Retry-After')
+                    error = f"HTTP {response.status}"
+            except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError) as e:
+                error = repr(e)
+
+            if attempt < self.max_retries:
+                self.num_retries += 1
+                await asyncio.sleep(self._retry_delay(attempt, retry_after))
+
+        raise HarvestError(f"Request to {url} failed after {self.max_retries} retries ({error})")
+
+    async def fetch_title(self, title: str, search_type: str = 'name equals',
+                          exact_matches_only: bool = True) -> dict | list | None:
+        """Queries IGDB for a single title and validates the result, see data_pull.validate_results"""
+        query = format_query(title, search_type=search_type)
+        data = await self.post(query)
+        return validate_results(data, title, exact_matches_only=exact_matches_only)
+
+    async def fetch_batch(self, titles: List[str], search_type: str = 'name equals',
+                          exact_matches_only: bool = True) -> dict:
+        """Queries IGDB for several titles in a single request, see data_pull.split_batch_results. \n
+        'name equals' batches share one where clause, other search types are sent as a multiquery
+        :returns a dict of title -> validated result"""
+        if search_type != 'name equals':
+            results = {}
+            for i in range(0, len(titles), max_multiquery_size):
+                sub_batch = titles[i:i + max_multiquery_size]
+                data = await self.post(format_multiquery(sub_batch, search_type=search_type), endpoint='multiquery')
+                results.update(split_batch_results(data, sub_batch, exact_matches_only))
+            return results
+
+        data = await self.post(format_batch_query(titles))
+        if len(data) >= max_query_limit and len(titles) > 1:
+            # results were cut off, so some titles may be missing their matches. Split the batch and try again
+            half = len(titles) // 2
+            results = await self.fetch_batch(titles[:half], search_type, exact_matches_only)
+            results.update(await self.fetch_batch(titles[half:], search_type, exact_matches_only))
+            return results
+        return split_batch_results(data, titles, exact_matches_only)
+
+    async def harvest(self, titles: Iterable[str], search_type: str = 'name equals', exact_matches_only: bool = True,
+                      known_ids: set | None = None, batch_size: int = 1) -> Tuple[List[dict], List[tuple], List[dict]]:
+        """Async counterpart to the request_chunks loop in data_curation.ipynb \n
+        :param titles: titles to query for
+        :param search_type: see data_pull.format_query
+        :param exact_matches_only: see data_pull.validate_results
+        :param known_ids: ids of games already in the library, these are discarded rather than parsed
+        :param batch_size: number of titles to pack into each request, see fetch_batch. 1 sends a request per title
+        :returns passes (parsed results), fails (title, search_type) and discards (raw results), in title order"""
+        titles = list(titles)
+        known_ids = known_ids if known_ids is not None else set()
+        results = [None] * len(titles)
+        queue = asyncio.Queue()
+        for i in range(0, len(titles), batch_size):
+            queue.put_nowait(i)
+
+        async def worker():
+            while not queue.empty():
+                i = queue.get_nowait()
+                try:
+                    if batch_size == 1:
+                        results[i] = await self.fetch_title(titles[i], search_type, exact_matches_only)
+                    else:
+                        batch = titles[i:i + batch_size]
+                        # duplicate titles within a batch share a single result
+                        batch_results = await self.fetch_batch(list(dict.fromkeys(batch)), search_type,
+                                                               exact_matches_only)
+                        results[i:i + batch_size] = [batch_results[title] for title in batch]
+                except (HarvestError, CacheMissError):
+                    pass
+
+        # a worker per open connection keeps the pool busy without one task per title
+        await asyncio.gather(*(worker() for _ in range(self.max_in_flight)))
+
+        passes, fails, discards = [], [], []
+        for title, result in zip(titles, results):
+            bodies = result if isinstance(result, list) else [result] if isinstance(result, dict) else []
+            if not bodies:
+                fails.append((title, search_type))
+            for body in bodies:
+                # some of these don't have release_dates, which parse_response relies on
+                if body.get('release_dates') and body.get('id') not in known_ids:
+                    known_ids.add(body.get('id'))
+                    passes.append(parse_response(body))
+                else:
+                    discards.append(body)
+        return passes, fails, discards
+
+
+def harvest_titles(titles: Iterable[str], twitch_client_id: str, access_token: str, search_type: str = 'name equals',
+                   exact_matches_only: bool = True, known_ids: set | None = None, batch_size: int = 1,
+                   **harvester_kwargs):
+    """Blocking wrapper around IGDBHarvester.harvest, for use outside of an event loop"""
+
+    async def run():
+        async with IGDBHarvester(twitch_client_id, access_token, **harvester_kwargs) as harvester:
+            return await harvester.harvest(titles, search_type, exact_matches_only, known_ids, batch_size)
+
+    return asyncio.run(run())
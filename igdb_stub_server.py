@@ -0,0 +1,234 @@
+"""A local stand-in for the IGDB games endpoint, so the harvester can be tested and benchmarked offline.
+
+Serves records built from datasets/new_data.csv in the same json shape IGDB returns for the fields in
+data_pull.format_query. Supports the `name equals`, `name like` and `search` query forms, batched `name equals`
+queries and multiqueries, `sort`, `limit` and `offset`, and can simulate
+network latency, IGDB's rate limit and intermittent server errors.
+
+    python igdb_stub_server.py --port 8089 --latency 0.2
+
+then point the harvester at it with base_url="http://127.0.0.1:8089/v4"
+"""
+import argparse
+import asyncio
+import csv
+import random
+import re
+import threading
+import time
+from ast import literal_eval
+from pathlib import Path
+
+from aiohttp import web
+
+from data_pull import categories, age_ratings
+
+default_dataset = Path(__file__).parent.joinpath('datasets', 'new_data.csv')
+# request counters, under app[stats_key]
+stats_key = web.AppKey('stats', dict)
+
+quoted_pattern = re.compile(r'"((?:[^"\\]|\\.)*)"')
+name_equals_pattern = re.compile(r'name\s*=\s*\(?\s*((?:"(?:[^"\\]|\\.)*"\s*,?\s*)+)')
+search_pattern = re.compile(r'(?:^|;)search\s+"((?:[^"\\]|\\.)*)"')
+name_like_pattern = re.compile(r'name\s*~\s*\*?"((?:[^"\\]|\\.)*)"')
+multiquery_pattern = re.compile(r'query\s+games\s+"([^"]*)"\s*\{(.*?)\};', re.DOTALL)
+limit_pattern = re.compile(r'limit\s+(\d+);')
+offset_pattern = re.compile(r'offset\s+(\d+);')
+sort_pattern = re.compile(r'sort\s+(\w+)\s+(asc|desc);')
+id_pattern = re.compile(r'(?<![_.\w])id\s*=\s*\(([\d,\s]+)\)')
+updated_at_pattern = re.compile(r'updated_at\s*>\s*(\d+)')
+category_pattern = re.compile(r'category\s*=\s*\(([\d,\s]+)\)')
+
+
+# ///////////////////////////////////////////////////////////////////////////////////
+
+def _as_list(value: str) -> list:
+    return literal_eval(value) if value else []
+
+
+def load_records(csv_path: Path = default_dataset) -> list:
+    """Converts rows of the game library back into the json shape returned by IGDB. Every record gets the csv's
+    modification time as its `updated_at`"""
+    updated_at = int(csv_path.stat().st_mtime)
+    category_ids = {v: k for k, v in categories.items()}
+    rating_ids = {v: k for k, v in age_ratings.items()}
+    records = []
+    with open(csv_path, encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            if not row.get('id'):
+                continue
+            record = {"id": int(row['id']),
+                      "name": row['name'],
+                      "slug": row['slug'],
+                      "category": category_ids.get(row['category'], 0),
+                      "rating_count": int(row['rating_count'] or 0),
+                      "summary": row['summary'],
+                      "updated_at": updated_at}
+            if row['release_dates']:
+                record["release_dates"] = [{"id": 1, "y": int(float(row['release_dates']))}]
+            if row['rating']:
+                record["rating"] = float(row['rating'])
+            for field in ('platforms', 'genres', 'themes', 'similar_games'):
+                if row[field]:
+                    record[field] = [{"id": i, "name": name} for i, name in enumerate(_as_list(row[field]))]
+            if row['tags']:
+                record["tags"] = [int(tag) for tag in _as_list(row['tags'])]
+            if row['age_ratings']:
+                record["age_ratings"] = [{"id": i, "rating": rating_ids[r]}
+                                         for i, r in enumerate(_as_list(row['age_ratings']))]
+            if row['involved_companies']:
+                record["involved_companies"] = [{"id": i, "company": {"id": i, "name": name}}
+                                                for i, name in enumerate(_as_list(row['involved_companies']))]
+            records.append(record)
+    return records
+
+
+def _unescape(value: str) -> str:
+    return value.replace('\\"', '"').replace('\\\\', '\\')
+
+
+def run_query(query: str, records: list, names: dict) -> list:
+    """Evaluates the subset of APICalypse that data_pull.format_query produces against the stub records"""
+    search_match, like_match = search_pattern.search(query), name_like_pattern.search(query)
+    equals_match = name_equals_pattern.search(query)
+    if search_match or like_match:
+        term = _unescape((search_match or like_match).group(1)).lower()
+        matches = [r for r in records if term in r['name'].lower()]
+    elif id_pattern.search(query):
+        ids = {int(i) for i in id_pattern.search(query).group(1).split(',')}
+        matches = [r for r in records if r['id'] in ids]
+    elif equals_match:
+        matches = [r for name in quoted_pattern.findall(equals_match.group(1)) for r in names.get(_unescape(name), [])]
+    else:
+        matches = list(records)
+
+    updated_at_match = updated_at_pattern.search(query)
+    if updated_at_match:
+        matches = [r for r in matches if r['updated_at'] > int(updated_at_match.group(1))]
+
+    category_match = category_pattern.search(query)
+    if category_match:
+        cats = {int(c) for c in category_match.group(1).split(',')}
+        matches = [r for r in matches if r['category'] in cats]
+
+    sort_match = sort_pattern.search(query)
+    if sort_match:
+        field, order = sort_match.groups()
+        matches = sorted(matches, key=lambda r: r.get(field, 0), reverse=order == 'desc')
+
+    limit_match, offset_match = limit_pattern.search(query), offset_pattern.search(query)
+    limit = int(limit_match.group(1)) if limit_match else 10
+    offset = int(offset_match.group(1)) if offset_match else 0
+    return matches[offset:offset + limit]
+
+
+def create_app(records: list | None = None, latency: float = 0.0, error_rate: float = 0.0,
+               rate_limit: float | None = None) -> web.Application:
+    """Builds the stub application \n
+    :param records: records to serve, defaults to load_records()
+    :param latency: seconds to wait before answering each request
+    :param error_rate: fraction of requests answered with a 503
+    :param rate_limit: requests per second allowed before answering with a 429, None for no limit"""
+    records = records if records is not None else load_records()
+    names = {}
+    for record in records:
+        names.setdefault(record['name'], []).append(record)
+
+    app = web.Application()
+    app[stats_key] = {'requests': 0, 'rate_limited': 0, 'errors': 0}
+    window = {'start': time.monotonic(), 'count': 0}
+
+    async def simulate_conditions(request: web.Request) -> web.Response | None:
+        # rate limiting, latency and errors, applied before every request is answered
+        stats = request.app[stats_key]
+        stats['requests'] += 1
+
+        if rate_limit is not None:
+            now = time.monotonic()
+            if now - window['start'] >= 1:
+                window['start'], window['count'] = now, 0
+            window['count'] += 1
+            if window['count'] > rate_limit:
+                stats['rate_limited'] += 1
+                return web.Response(status=429, text='Too Many Requests')
+
+        if latency:
+            await asyncio.sleep(latency)
+        if error_rate and random.random() < error_rate:
+            stats['errors'] += 1
+            return web.Response(status=503, text='Service Unavailable')
+        return None
+
+    async def games(request: web.Request) -> web.Response:
+        error = await simulate_conditions(request)
+        if error is not None:
+            return error
+        query = (await request.read()).decode('utf-8')
+        return web.json_response(run_query(query, records, names))
+
+    async def multiquery(request: web.Request) -> web.Response:
+        error = await simulate_conditions(request)
+        if error is not None:
+            return error
+        query = (await request.read()).decode('utf-8')
+        return web.json_response([{"name": name, "result": run_query(body, records, names)}
+                                  for name, body in multiquery_pattern.findall(query)])
+
+    app.router.add_post('/v4/games', games)
+    app.router.add_post('/v4/multiquery', multiquery)
+    return app
+
+
+class StubServer:
+    """Runs the stub in a background thread, for use from synchronous code such as benchmarks \n
+    Usage:
+        with StubServer(latency=0.1) as server:
+            post_request(query, 'id', 'token', base_url=server.url)
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, **app_kwargs):
+        self.host = host
+        self.port = port
+        self.app = create_app(**app_kwargs)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._runner = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/v4"
+
+    @property
+    def stats(self) -> dict:
+        return self.app[stats_key]
+
+    async def _start(self):
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # port 0 picks a free port
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    def __enter__(self):
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+        return self
+
+    def __exit__(self, *exc_info):
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--dataset', type=Path, default=default_dataset)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit', type=float, default=None)
+    args = parser.parse_args()
+    web.run_app(create_app(load_records(args.dataset), args.latency, args.error_rate, args.rate_limit),
+                host=args.host, port=args.port)
@@ -0,0 +1,228 @@
+"""Stage-level counters, timers and histograms for the curation and recommendation pipeline.
+
+Off by default. Instrumented functions (post_request, validate_response, parse_response, the dataset_clean mappers,
+preprocess_text, the recommenders, ...) then cost one flag check per call. Once enabled, every call records its
+duration in a per-stage histogram, and optionally a sample of calls runs under cProfile.
+
+    import instrumentation
+    instrumentation.enable(profile_rate=0.01)
+    ... run a curation pass or some recommendations ...
+    print(instrumentation.to_prometheus())
+    instrumentation.profile_stats('preprocess_text').sort_stats('cumulative').print_stats(10)
+
+Setting VGRM_INSTRUMENTATION=1 in the environment enables it at import.
+"""
+import cProfile
+import functools
+import json
+import os
+import pstats
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List
+
+# upper bounds, in seconds, of the stage duration histograms. Spans per-row mappers (microseconds) to IGDB requests
+default_buckets = [1e-5, 5e-5, 1e-4, 5e-4, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0]
+metric_prefix = 'vgrm'
+
+
+# ///////////////////////////////////////////////////////////////////////////////////
+
+class Histogram:
+    def __init__(self, buckets: List[float] = None):
+        self.buckets = buckets or default_buckets
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def to_dict(self) -> dict:
+        return {'buckets': dict(zip(map(str, self.buckets + ['+Inf']), self.counts)), 'sum': self.sum,
+                'count': self.count}
+
+
+class _State:
+    def __init__(self):
+        self.enabled = os.environ.get('VGRM_INSTRUMENTATION') == '1'
+        self.profile_rate = 0.0
+        self.lock = threading.Lock()
+        self.counters: Dict[str, float] = {}
+        self.histograms: Dict[str, Histogram] = {}
+        self.errors: Dict[str, int] = {}
+        self.profiles: Dict[str, cProfile.Profile] = {}
+        # only one profiler can run at a time, across all threads
+        self.profiling = False
+        # per thread: stages currently running
+        self.local = threading.local()
+
+
+_state = _State()
+
+
+def enable(profile_rate: float = 0.0):
+    """Turns instrumentation on \n
+    :param profile_rate: fraction of calls to each stage to run under cProfile, 0 to never profile"""
+    _state.profile_rate = profile_rate
+    _state.enabled = True
+
+
+def disable():
+    _state.enabled = False
+
+
+def is_enabled() -> bool:
+    return _state.enabled
+
+
+def reset():
+    """Drops everything recorded so far"""
+    with _state.lock:
+        _state.counters.clear()
+        _state.histograms.clear()
+        _state.errors.clear()
+        _state.profiles.clear()
+
+
+def count(name: str, value: float = 1):
+    """Adds to a counter, if instrumentation is enabled"""
+    if _state.enabled:
+        with _state.lock:
+            _state.counters[name] = _state.counters.get(name, 0) + value
+
+
+def observe(stage: str, seconds: float):
+    """Records a duration for a stage, if instrumentation is enabled"""
+    if _state.enabled:
+        with _state.lock:
+            histogram = _state.histograms.get(stage)
+            if histogram is None:
+                histogram = _state.histograms[stage] = Histogram()
+            histogram.observe(seconds)
+
+
+@contextmanager
+def timer(stage: str):
+    """Times a block of code as a stage"""
+    if not _state.enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+
+def instrumented(stage: str | None = None):
+    """Decorator that times every call of a function as a stage (default: the function's name). Calls made while the
+    same stage is already running on this thread, e.g. parse_response recursing into each game, count towards the
+    outer call only"""
+
+    def decorator(f):
+        name = stage or f.__name__
+
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            if not _state.enabled:
+                return f(*args, **kwargs)
+            local = _state.local
+            active = getattr(local, 'stages', None)
+            if active is None:
+                active = local.stages = set()
+            if name in active:
+                return f(*args, **kwargs)
+
+            profiler = None
+            if _state.profile_rate and not _state.profiling and random.random() < _state.profile_rate:
+                # stages nested in a profiled call show up inside its profile rather than getting their own
+                with _state.lock:
+                    if not _state.profiling:
+                        _state.profiling = True
+                        profiler = _state.profiles.setdefault(name, cProfile.Profile())
+            active.add(name)
+            start = time.perf_counter()
+            try:
+                if profiler is not None:
+                    return profiler.runcall(f, *args, **kwargs)
+                return f(*args, **kwargs)
+            except Exception:
+                with _state.lock:
+                    _state.errors[name] = _state.errors.get(name, 0) + 1
+                raise
+            finally:
+                observe(name, time.perf_counter() - start)
+                active.discard(name)
+                if profiler is not None:
+                    _state.profiling = False
+
+        return wrapper
+
+    return decorator
+
+
+# ///////////////////////////////////////////////////////////////////////////////////
+
+def snapshot() -> dict:
+    """Everything recorded so far, as plain python types"""
+    with _state.lock:
+        return {'counters': dict(_state.counters),
+                'stages': {stage: {**histogram.to_dict(), 'errors': _state.errors.get(stage, 0)}
+                           for stage, histogram in _state.histograms.items()},
+                'profiled_stages': sorted(_state.profiles)}
+
+
+def to_json(indent: int | None = None) -> str:
+    return json.dumps(snapshot(), indent=indent)
+
+
+def to_prometheus(prefix: str = metric_prefix) -> str:
+    """Everything recorded so far, in the Prometheus text exposition format"""
+    data = snapshot()
+    lines = []
+    if data['counters']:
+        lines.append(f"# TYPE {prefix}_events_total counter")
+    for name, value in sorted(data['counters'].items()):
+        lines.append(f'{prefix}_events_total{{name="{name}"}} {value}')
+    if data['stages']:
+        lines.append(f"# TYPE {prefix}_stage_seconds histogram")
+    for stage, histogram in sorted(data['stages'].items()):
+        cumulative = 0
+        for bound, bucket_count in histogram['buckets'].items():
+            cumulative += bucket_count
+            lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+        lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {histogram["sum"]}')
+        lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {histogram["count"]}')
+    if data['stages']:
+        lines.append(f"# TYPE {prefix}_stage_errors_total counter")
+    for stage, histogram in sorted(data['stages'].items()):
+        lines.append(f'{prefix}_stage_errors_total{{stage="{stage}"}} {histogram["errors"]}')
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+def profile_stats(stage: str) -> pstats.Stats | None:
+    """Accumulated cProfile stats of a stage's sampled calls, or None if none were sampled"""
+    with _state.lock:
+        profiler = _state.profiles.get(stage)
+    return pstats.Stats(profiler) if profiler is not None else None
+
+
+def dump_profiles(directory: str | Path) -> List[Path]:
+    """Writes each profiled stage's stats to <directory>/<stage>.prof, for snakeviz/pstats"""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    with _state.lock:
+        profiles = dict(_state.profiles)
+    paths = []
+    for stage, profiler in profiles.items():
+        path = directory.joinpath(f"{stage}.prof")
+        profiler.dump_stats(path)
+        paths.append(path)
+    return paths
@@ -0,0 +1,220 @@
+"""Columnar storage for the game library.
+
+The library csvs store list fields as python reprs ("['Linux', 'PC (Microsoft Windows)']"), so every consumer has to
+literal_eval them row by row. LibraryStore keeps the library as a directory of Arrow IPC (or Parquet) part files with
+real list<string> columns, dictionary encoded, and reads them back memory-mapped.
+
+    store = LibraryStore.migrate_csvs([datasets.joinpath('library.csv'), datasets.joinpath('new_data.csv')])
+    df = store.to_pandas()
+
+or from the command line:
+
+    python library_store.py datasets/library.csv datasets/new_data.csv --out datasets/library
+"""
+import argparse
+import csv
+import os
+from ast import literal_eval
+from pathlib import Path
+from typing import Iterable, List
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+
+datasets = Path(__file__).parent.joinpath('datasets')
+default_store_path = datasets.joinpath('library')
+
+list_fields = ['platforms', 'genres', 'tags', 'age_ratings', 'similar_games', 'themes', 'involved_companies']
+
+_labels = pa.dictionary(pa.int32(), pa.string())
+library_schema = pa.schema([
+    ('id', pa.int64()),
+    ('release_dates', pa.int16()),
+    ('name', pa.string()),
+    ('category', _labels),
+    ('slug', pa.string()),
+    ('platforms', pa.list_(_labels)),
+    ('genres', pa.list_(_labels)),
+    ('tags', pa.list_(_labels)),
+    ('age_ratings', pa.list_(_labels)),
+    ('rating', pa.float64()),
+    ('rating_count', pa.int32()),
+    ('similar_games', pa.list_(_labels)),
+    ('themes', pa.list_(_labels)),
+    ('summary', pa.string()),
+    ('involved_companies', pa.list_(_labels)),
+])
+
+
+# ///////////////////////////////////////////////////////////////////////////////////
+
+def _label_list(lists: List[list]) -> pa.ListArray:
+    arr = pa.array(lists, type=pa.list_(pa.string()))
+    return pa.ListArray.from_arrays(arr.offsets, arr.values.dictionary_encode(), mask=arr.is_null())
+
+
+def table_from_rows(rows: List[dict]) -> pa.Table:
+    """Builds a library table from parsed rows (see data_pull.parse_response) or csv rows, where list fields may be
+    python reprs of lists"""
+    columns = {name: [] for name in library_schema.names}
+    for row in rows:
+        for name in library_schema.names:
+            value = row.get(name)
+            if value == '' or (isinstance(value, float) and value != value):
+                value = None
+            if name in list_fields and isinstance(value, str):
+                value = list(literal_eval(value))
+            columns[name].append(value)
+
+    # csv values arrive as strings; let arrow parse the numeric ones
+    numeric = {'id': pa.int64(), 'release_dates': pa.int16(), 'rating': pa.float64(), 'rating_count': pa.int32()}
+    arrays = {}
+    for name in library_schema.names:
+        if name in list_fields:
+            arrays[name] = _label_list(columns[name])
+        elif name in numeric:
+            values = [None if v is None else float(v) for v in columns[name]]
+            arrays[name] = pa.array(values, type=pa.float64()).cast(numeric[name])
+        elif name == 'category':
+            arrays[name] = pa.array(columns[name], type=pa.string()).dictionary_encode()
+        else:
+            arrays[name] = pa.array(columns[name], type=pa.string())
+    return conform(pa.table(arrays))
+
+
+def conform(table: pa.Table) -> pa.Table:
+    """Casts a table (e.g. from response_parser.ColumnBuffers.to_arrow) to the library schema"""
+    return table.select(library_schema.names).cast(library_schema)
+
+
+def part_number(part: str | Path) -> int:
+    """Sequence number of a part file (part-00012.arrow -> 12), -1 for no part ('')"""
+    name = Path(part).name
+    return int(name.split('.')[0].split('-')[1]) if name else -1
+
+
+def read_csv_rows(csv_path: str | Path) -> List[dict]:
+    with open(csv_path, encoding='utf-8', newline='') as f:
+        return [row for row in csv.DictReader(f) if row.get('id')]
+
+
+class LibraryStore:
+    """A directory of library part files. New rows are appended as new parts; reads memory-map every part and
+    concatenate them, keeping the last version of each game \n
+    :param path: the store's directory, created if it doesn't exist
+    :param file_format: 'arrow' (uncompressed IPC, zero-copy memory-mapped reads) or 'parquet' (smaller on disk)
+    """
+
+    def __init__(self, path: str | Path = default_store_path, file_format: str = 'arrow'):
+        if file_format not in ('arrow', 'parquet'):
+            raise ValueError(f"Invalid file format {file_format}, expected 'arrow' or 'parquet'.")
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.file_format = file_format
+
+    @property
+    def parts(self) -> List[Path]:
+        """Part files oldest first, by sequence number whatever their format, so later parts win on read"""
+        parts = [*self.path.glob('part-*.arrow'), *self.path.glob('part-*.parquet')]
+        return sorted(parts, key=lambda part: (part_number(part), part.suffix))
+
+    def _next_part(self) -> Path:
+        number = max((part_number(part) for part in self.parts), default=-1) + 1
+        return self.path.joinpath(f"part-{number:05d}.{self.file_format}")
+
+    def _write(self, table: pa.Table, path: Path):
+        tmp_path = path.with_suffix('.tmp')
+        if self.file_format == 'arrow':
+            # an IPC file holds one dictionary per field, but a table read from several parts has one per part
+            table = table.unify_dictionaries().combine_chunks()
+            with pa.OSFile(str(tmp_path), 'wb') as sink, ipc.new_file(sink, library_schema) as writer:
+                writer.write_table(table)
+        else:
+            pq.write_table(table, tmp_path)
+        # the rename keeps readers from ever seeing a half-written part
+        os.replace(tmp_path, path)
+
+    def append(self, data: pa.Table | List[dict]) -> Path | None:
+        """Writes a batch of games as a new part file \n
+        :param data: a table in (or castable to) library_schema, or parsed rows"""
+        table = conform(data) if isinstance(data, pa.Table) else table_from_rows(data)
+        if table.num_rows == 0:
+            return None
+        path = self._next_part()
+        self._write(table, path)
+        return path
+
+    def read(self, columns: List[str] | None = None, dedupe: bool = True) -> pa.Table:
+        """Reads the whole library \n
+        :param columns: only read these columns
+        :param dedupe: drop all but the last version of each game"""
+        tables = []
+        for part in self.parts:
+            if part.suffix == '.arrow':
+                # memory-mapped: nothing is copied until a column is actually used
+                table = ipc.open_file(pa.memory_map(str(part))).read_all()
+            else:
+                table = pq.read_table(part, memory_map=True)
+            tables.append(table)
+        if not tables:
+            return library_schema.empty_table()
+        table = pa.concat_tables(tables)
+        if dedupe:
+            table = _keep_last(table)
+        return table.select(columns) if columns else table
+
+    def to_pandas(self, columns: List[str] | None = None) -> pd.DataFrame:
+        """Reads the library as a DataFrame. List columns hold numpy arrays of strings, and categorical-like columns
+        are pandas categoricals"""
+        return self.read(columns).to_pandas()
+
+    def ids(self) -> set:
+        return set(self.read(['id'], dedupe=False).column('id').to_pylist())
+
+    def compact(self) -> Path | None:
+        """Rewrites all parts as a single deduped part. The compacted part is written under a temp name and renamed
+        into place as the newest part before any old part is removed, so a crash part way leaves a store that still
+        reads the same \n
+        :returns the compacted part"""
+        old_parts = self.parts
+        if not old_parts:
+            return None
+        table = self.read()
+        path = self._next_part()
+        self._write(table, path)
+        for part in old_parts:
+            part.unlink()
+        return path
+
+    @classmethod
+    def migrate_csvs(cls, csv_paths: Iterable[str | Path], path: str | Path = default_store_path,
+                     file_format: str = 'arrow') -> 'LibraryStore':
+        """One-shot migration of the existing library csvs into a store. Later csvs take precedence when the same
+        game appears in more than one"""
+        store = cls(path, file_format)
+        for csv_path in csv_paths:
+            store.append(read_csv_rows(csv_path))
+        store.compact()
+        return store
+
+
+def _keep_last(table: pa.Table) -> pa.Table:
+    # index of the last occurrence of each id, in original order
+    ids = table.column('id').to_numpy()
+    reversed_first = pd.Index(ids[::-1]).duplicated(keep='first')
+    keep = ~reversed_first[::-1]
+    if keep.all():
+        return table
+    return table.filter(pa.array(keep))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('csv_paths', nargs='+', type=Path)
+    parser.add_argument('--out', type=Path, default=default_store_path)
+    parser.add_argument('--format', choices=['arrow', 'parquet'], default='arrow')
+    args = parser.parse_args()
+    store = LibraryStore.migrate_csvs(args.csv_paths, args.out, args.format)
+    print(f"Migrated {store.read().num_rows} games to {args.out}")
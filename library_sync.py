@@ -0,0 +1,174 @@
+import csv
+import json
+import os
+from pathlib import Path
+from typing import Iterable, List
+
+from data_pull import game_fields, game_categories, max_query_limit, parse_response
+from igdb_harvester import IGDBHarvester
+
+datasets = Path(__file__).parent.joinpath('datasets')
+default_index_path = datasets.joinpath('library_index.json')
+
+# columns of the library csvs, in the order parse_response produces them
+library_fields = ['id', 'release_dates', 'name', 'category', 'slug', 'platforms', 'genres', 'tags', 'age_ratings',
+                  'rating', 'rating_count', 'similar_games', 'themes', 'summary', 'involved_companies']
+
+
+# ///////////////////////////////////////////////////////////////////////////////////
+
+class LibraryIndex:
+    """Persisted index of the games already in the library, so new rows can be deduped in O(1) and later syncs only
+    ask IGDB for games that changed since the last run \n
+    :param path: location of the json file the index is saved to
+
+    ids maps each game id to the `updated_at` timestamp of the version we hold, slugs maps slug -> id, and
+    high_water_mark is the newest `updated_at` seen so far: the next sync asks IGDB for everything updated after it.
+    """
+
+    def __init__(self, path: str | Path = default_index_path):
+        self.path = Path(path)
+        self.ids = {}
+        self.slugs = {}
+        self.high_water_mark = 0
+        if self.path.exists():
+            self.load()
+
+    @classmethod
+    def from_library(cls, csv_paths: Iterable[str | Path], path: str | Path = default_index_path,
+                     pulled_at: int | None = None) -> 'LibraryIndex':
+        """Seeds an index from existing library csvs (library.csv, new_data.csv). Their rows have no `updated_at`, so
+        every game counts as the version IGDB had when the csvs were pulled, and the first sync only asks for games
+        updated after that \n
+        :param pulled_at: unix timestamp of the pull, defaults to the newest modification time of the csvs"""
+        csv_paths = [Path(csv_path) for csv_path in csv_paths]
+        if pulled_at is None:
+            pulled_at = max((int(csv_path.stat().st_mtime) for csv_path in csv_paths), default=0)
+        index = cls(path)
+        for csv_path in csv_paths:
+            with open(csv_path, encoding='utf-8') as f:
+                for row in csv.DictReader(f):
+                    if row.get('id'):
+                        index.upsert(int(row['id']), row.get('slug'), pulled_at)
+        index.high_water_mark = max(index.high_water_mark, pulled_at)
+        return index
+
+    def load(self):
+        with open(self.path, encoding='utf-8') as f:
+            data = json.load(f)
+        # json keys are always strings
+        self.ids = {int(k): v for k, v in data['ids'].items()}
+        self.slugs = data['slugs']
+        self.high_water_mark = data['high_water_mark']
+
+    def save(self):
+        # write to a temp file first so a crash can't leave a half-written index behind
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'ids': self.ids, 'slugs': self.slugs, 'high_water_mark': self.high_water_mark}, f)
+        os.replace(tmp_path, self.path)
+
+    def __contains__(self, game_id: int) -> bool:
+        return game_id in self.ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def upsert(self, game_id: int, slug: str | None = None, updated_at: int | None = None) -> bool:
+        """Records a game in the index \n
+        :returns True if the game is new, or newer than the version we hold"""
+        current = self.ids.get(game_id)
+        updated_at = updated_at or 0
+        if current is not None and updated_at <= current:
+            return False
+        self.ids[game_id] = updated_at
+        if slug:
+            self.slugs[slug] = game_id
+        self.high_water_mark = max(self.high_water_mark, updated_at)
+        return True
+
+
+def format_updated_since_query(since: int, limit: int = max_query_limit, offset: int = 0) -> bytes:
+    """formats a query for every game IGDB has updated after the timestamp `since`, oldest update first, a page at a
+    time \n
+    :param since: unix timestamp, usually LibraryIndex.high_water_mark
+    :param offset: number of games to skip, for the pages after the first
+    """
+    query = (f'f {",".join(game_fields)},updated_at;'
+             f'where updated_at > {int(since)} & category = ({",".join(str(i) for i in game_categories)});'
+             f'sort updated_at asc;limit {limit};offset {offset};')
+    return query.encode('utf-8')
+
+
+def read_library_csv(csv_path: str | Path) -> tuple:
+    """The csv's columns and rows; library_fields and no rows if it doesn't exist yet"""
+    if not Path(csv_path).exists():
+        return library_fields, []
+    with open(csv_path, encoding='utf-8', newline='') as f:
+        reader = csv.DictReader(f)
+        return reader.fieldnames or library_fields, list(reader)
+
+
+def upsert_rows(rows: List[dict], csv_path: str | Path, index: LibraryIndex, updated_at: dict | None = None) -> int:
+    """Deduped replacement for the append_rows helper in data_curation.ipynb. Rows that are new to the index are added
+    to the csv, and rows newer than the version it holds replace that version in place, so the csv keeps one row per
+    id. The csv is rewritten through a temp file and the index saved straight after, so a crash leaves either the old
+    or the new csv; a sync after a crash before the index save upserts the same rows again, without duplicating them \n
+    :param rows: parsed rows, see data_pull.parse_response
+    :param updated_at: optional id -> `updated_at` timestamp for the rows
+    :returns the number of rows added or replaced"""
+    updated_at = updated_at or {}
+    changed = {}
+    for row in rows:
+        if index.upsert(row['id'], row.get('slug'), updated_at.get(row['id'])):
+            changed[row['id']] = row
+    if not changed:
+        return 0
+
+    fieldnames, existing = read_library_csv(csv_path)
+    csv_path = Path(csv_path)
+    tmp_path = csv_path.with_suffix('.tmp')
+    with open(tmp_path, 'w', encoding='utf-8', newline='') as csv_file:
+        dict_writer = csv.DictWriter(csv_file, fieldnames, extrasaction='ignore')
+        dict_writer.writeheader()
+        written = set()
+        for row in existing:
+            game_id = int(float(row['id'])) if row.get('id') else None
+            if game_id in changed:
+                # an updated game takes the place of its old row; any older duplicates of it are dropped
+                if game_id not in written:
+                    dict_writer.writerow(changed[game_id])
+                    written.add(game_id)
+            else:
+                dict_writer.writerow(row)
+        dict_writer.writerows(row for game_id, row in changed.items() if game_id not in written)
+    os.replace(tmp_path, csv_path)
+    index.save()
+    return len(changed)
+
+
+async def fetch_updated(harvester: IGDBHarvester, since: int, page_size: int = max_query_limit) -> List[dict]:
+    """Asks IGDB for every game updated after `since`, paging through the results \n
+    :returns the raw bodies of the changed games, including `updated_at`, oldest update first"""
+    bodies = []
+    while True:
+        page = await harvester.post(format_updated_since_query(since, page_size, len(bodies)))
+        bodies.extend(page)
+        if len(page) < page_size:
+            return bodies
+
+
+async def sync_library(harvester: IGDBHarvester, index: LibraryIndex, csv_path: str | Path,
+                       new_games: bool = True) -> int:
+    """Incremental sync: fetches only the games IGDB updated since the last run (the index's high water mark), upserts
+    them into the library csv and advances the high water mark \n
+    :param new_games: also add games that aren't in the library yet, rather than only updating the ones that are
+    :returns the number of rows added or replaced"""
+    changed = await fetch_updated(harvester, index.high_water_mark)
+    bodies = [body for body in changed if body.get('release_dates') and (new_games or body['id'] in index)]
+    rows = [parse_response(body) for body in bodies]
+    written = upsert_rows(rows, csv_path, index, {body['id']: body['updated_at'] for body in bodies})
+    # games we skipped still count towards the high water mark, or they'd be fetched again next time
+    index.high_water_mark = max([index.high_water_mark] + [body['updated_at'] for body in changed])
+    index.save()
+    return written
@@ -0,0 +1,280 @@
+"""Long-running recommendation service.
+
+Loads and encodes the game library once, then answers recommendation requests over HTTP/JSON. Concurrent requests
+are micro-batched so they share a single matrix product, and answers for popular titles are kept in an LRU cache.
+
+    python recommendation_service.py --library datasets/library --port 8090
+
+    POST /recommend   {"title": "Minecraft", "k": 10, "weights": {"genres": 0.5, "themes": 0.5}}
+    GET  /recommend?title=Minecraft&k=10&weights={"genres":1}
+    GET  /health
+    GET  /metrics     (Prometheus text format)
+"""
+import argparse
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+from aiohttp import web
+from scipy import sparse
+
+import instrumentation
+from text_processing.encoders import fit_encoders, multilabel_fields
+from text_processing.similarity_metrics import FusedRecommender, top_k
+from text_processing.title_index import TitleIndex
+
+default_library = Path(__file__).parent.joinpath('datasets', 'library')
+
+
+# ///////////////////////////////////////////////////////////////////////////////////
+
+def load_library(path: str | Path) -> pd.DataFrame:
+    """Reads the library from a LibraryStore directory or a library csv"""
+    path = Path(path)
+    if path.is_dir():
+        # pyarrow is only needed for store directories
+        from library_store import LibraryStore
+        return LibraryStore(path).to_pandas()
+    return pd.read_csv(path).dropna(subset=['id']).drop_duplicates(subset=['id'], keep='last')
+
+
+def build_recommender(df: pd.DataFrame, weights: Dict[str, float] | None = None,
+                      fields: List[str] | None = None) -> FusedRecommender:
+    """Encodes the library's list fields and stacks them into a FusedRecommender"""
+    fields = fields or multilabel_fields
+    encoders = fit_encoders(df, fields)
+    return FusedRecommender({field: encoders[field].transform(df[field]) for field in fields}, weights)
+
+
+class LRUCache:
+    def __init__(self, max_size: int = 4096):
+        self.max_size = max_size
+        self._items = OrderedDict()
+
+    def get(self, key):
+        if key not in self._items:
+            return None
+        self._items.move_to_end(key)
+        return self._items[key]
+
+    def put(self, key, value):
+        self._items[key] = value
+        self._items.move_to_end(key)
+        if len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def __len__(self):
+        return len(self._items)
+
+
+class Metrics:
+    """Counters and a latency histogram, rendered in the Prometheus text format"""
+    latency_buckets = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0]
+
+    def __init__(self):
+        self.counters = {'requests_total': 0, 'cache_hits_total': 0, 'not_found_total': 0, 'batches_total': 0,
+                         'batched_queries_total': 0}
+        self.latency_counts = [0] * (len(self.latency_buckets) + 1)
+        self.latency_sum = 0.0
+
+    def observe_latency(self, seconds: float):
+        self.latency_sum += seconds
+        self.latency_counts[np.searchsorted(self.latency_buckets, seconds)] += 1
+
+    def render(self, gauges: Dict[str, float]) -> str:
+        lines = [f"vgrm_{name} {value}" for name, value in {**self.counters, **gauges}.items()]
+        cumulative = np.cumsum(self.latency_counts)
+        for bound, count in zip(self.latency_buckets, cumulative):
+            lines.append(f'vgrm_request_seconds_bucket{{le="{bound}"}} {count}')
+        lines.append(f'vgrm_request_seconds_bucket{{le="+Inf"}} {cumulative[-1]}')
+        lines.append(f"vgrm_request_seconds_sum {self.latency_sum}")
+        lines.append(f"vgrm_request_seconds_count {cumulative[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+class MicroBatcher:
+    """Collects queries arriving close together and scores them with one product \n
+    :param max_batch: max queries per product
+    :param max_wait: seconds to wait for more queries once the first one arrives"""
+
+    def __init__(self, recommender: FusedRecommender, metrics: Metrics, max_batch: int = 64,
+                 max_wait: float = 0.002):
+        self.recommender = recommender
+        self.metrics = metrics
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = asyncio.Queue()
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+
+    async def submit(self, query: sparse.csr_matrix, target_game_index: int, k: int) -> tuple:
+        """Queues a query row (see FusedRecommender.query_row) and waits for its top k, excluding the target"""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((query, target_game_index, k, future))
+        return await future
+
+    def _score(self, batch: list) -> list:
+        scores = self.recommender.score_rows(sparse.vstack([query for query, _, _, _ in batch]))
+        results = []
+        for row, (_, index, k, _) in zip(scores, batch):
+            indices = top_k(row, k, exclude=index)
+            results.append((indices, row[indices]))
+        return results
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            self.metrics.counters['batches_total'] += 1
+            self.metrics.counters['batched_queries_total'] += len(batch)
+            try:
+                # the product runs off the event loop, so new requests keep queueing up for the next batch
+                results = await loop.run_in_executor(None, self._score, batch)
+                for (_, _, _, future), result in zip(batch, results):
+                    if not future.done():
+                        future.set_result(result)
+            except Exception as e:
+                for _, _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+
+class RecommendationService:
+    """Holds the warm model and answers requests, see create_app"""
+
+    def __init__(self, df: pd.DataFrame, weights: Dict[str, float] | None = None, max_k: int = 100,
+                 cache_size: int = 4096, **batcher_kwargs):
+        self.df = df.reset_index(drop=True)
+        self.names = self.df['name'].tolist()
+        self.ids = self.df['id'].astype(np.int64).tolist()
+        self.title_index = TitleIndex(self.names, self.df['slug'] if 'slug' in self.df else None)
+        self.recommender = build_recommender(self.df, weights)
+        self.max_k = max_k
+        self.cache = LRUCache(cache_size)
+        self.metrics = Metrics()
+        self.batcher = MicroBatcher(self.recommender, self.metrics, **batcher_kwargs)
+        self.started_at = time.time()
+
+    def resolve_title(self, title: str) -> int | None:
+        """Tolerates typos, subtitles and roman numerals, see TitleIndex"""
+        return self.title_index.resolve(title)
+
+    async def recommend(self, title: str, k: int = 10, weights: Dict[str, float] | None = None) -> dict | None:
+        index = self.resolve_title(title)
+        if index is None:
+            return None
+        k = max(1, min(int(k), self.max_k))
+        key = (index, k, tuple(sorted(weights.items())) if weights else None)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.metrics.counters['cache_hits_total'] += 1
+            return cached
+
+        # built here rather than in the batch, so bad weights fail this request only
+        query = self.recommender.query_row(index, weights)
+        indices, scores = await self.batcher.submit(query, index, k)
+        result = {'title': self.names[index], 'id': self.ids[index],
+                  'recommendations': [{'name': self.names[i], 'id': self.ids[i], 'score': float(score)}
+                                      for i, score in zip(indices, scores)]}
+        self.cache.put(key, result)
+        return result
+
+
+def parse_weights(weights) -> Dict[str, float] | None:
+    """Checks a request's weights: a json object (or its string form, from a query string) of feature name -> a
+    non-negative number. Raises ValueError for anything else"""
+    if isinstance(weights, str):
+        weights = json.loads(weights)
+    if weights is None:
+        return None
+    if not isinstance(weights, dict):
+        raise ValueError(f"weights must be an object of feature name -> weight, got {weights!r}")
+    for name, weight in weights.items():
+        # bool is an int subclass, but true/false aren't weights
+        if isinstance(weight, bool) or not isinstance(weight, (int, float)) or not 0 <= weight < float('inf'):
+            raise ValueError(f"weight of {name!r} must be a non-negative number, got {weight!r}")
+    return {name: float(weight) for name, weight in weights.items()}
+
+
+def create_app(service: RecommendationService) -> web.Application:
+    app = web.Application()
+
+    async def recommend(request: web.Request) -> web.Response:
+        start = time.perf_counter()
+        service.metrics.counters['requests_total'] += 1
+        try:
+            if request.method == 'POST':
+                body = await request.json()
+            else:
+                body = dict(request.query)
+            title = body['title']
+            k = int(body.get('k', 10))
+            weights = parse_weights(body.get('weights'))
+            result = await service.recommend(title, k, weights)
+        except (KeyError, ValueError, TypeError) as e:
+            return web.json_response({'error': f"Bad request: {e}"}, status=400)
+        finally:
+            service.metrics.observe_latency(time.perf_counter() - start)
+
+        if result is None:
+            service.metrics.counters['not_found_total'] += 1
+            return web.json_response({'error': f"Unknown title {title!r}"}, status=404)
+        return web.json_response(result)
+
+    async def health(request: web.Request) -> web.Response:
+        return web.json_response({'status': 'ok', 'games': len(service.names),
+                                  'uptime': time.time() - service.started_at})
+
+    async def metrics(request: web.Request) -> web.Response:
+        text = service.metrics.render({'games': len(service.names), 'cache_size': len(service.cache)})
+        # stage timings, when instrumentation is enabled
+        text += instrumentation.to_prometheus()
+        return web.Response(text=text, content_type='text/plain')
+
+    async def on_startup(app: web.Application):
+        service.batcher.start()
+
+    async def on_cleanup(app: web.Application):
+        await service.batcher.stop()
+
+    app.router.add_post('/recommend', recommend)
+    app.router.add_get('/recommend', recommend)
+    app.router.add_get('/health', health)
+    app.router.add_get('/metrics', metrics)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--library', type=Path, default=default_library,
+                        help='LibraryStore directory or library csv')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--max-batch', type=int, default=64)
+    parser.add_argument('--max-wait', type=float, default=0.002)
+    args = parser.parse_args()
+
+    service = RecommendationService(load_library(args.library), max_batch=args.max_batch, max_wait=args.max_wait)
+    web.run_app(create_app(service), host=args.host, port=args.port)
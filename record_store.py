@@ -0,0 +1,241 @@
+"""Compact in-memory store for parsed game records.
+
+parse_response builds a dict per game, holding its own copy of every platform, genre, theme, company and age rating
+string, so "PC (Microsoft Windows)" ends up stored once per PC game. RecordStore interns each list field into a
+vocabulary and keeps the games' lists as CSR-style code + offset arrays; scalar fields live in typed arrays. Rows are
+__slots__ views into the arrays, built on demand.
+
+    store = RecordStore.from_payloads(response.content for response in responses)
+    for game in store:
+        print(game.name, game.platforms)
+    df = store.to_pandas()
+    print(store.memory_report())
+"""
+import sys
+from array import array
+from typing import Iterable, Iterator, List
+
+import orjson
+import pyarrow as pa
+
+from data_pull import categories
+from response_parser import ColumnBuffers, category_names, field_order, list_fields
+
+scalar_fields = ['id', 'release_dates', 'name', 'category', 'slug', 'rating', 'rating_count', 'summary']
+
+category_codes = {name: code for code, name in categories.items()}
+
+
+# ///////////////////////////////////////////////////////////////////////////////////
+
+class Vocabulary:
+    """Label <-> code mapping for one list field; codes are assigned in order of first appearance"""
+    __slots__ = ('codes', 'labels')
+
+    def __init__(self, labels: Iterable[str] = ()):
+        self.labels: List[str] = []
+        self.codes = {}
+        for label in labels:
+            self.code(label)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, code: int) -> str:
+        return self.labels[code]
+
+    def code(self, label: str) -> int:
+        code = self.codes.get(label)
+        if code is None:
+            code = self.codes[label] = len(self.labels)
+            self.labels.append(label)
+        return code
+
+
+class GameRecord:
+    """Read-only view of one game in a RecordStore. Fields are looked up in the store's arrays when accessed, so a
+    record costs two slots however many fields the game has"""
+    __slots__ = ('_store', '_index')
+
+    def __init__(self, store: 'RecordStore', index: int):
+        self._store = store
+        self._index = index
+
+    def __getattr__(self, field: str):
+        return self._store.value(self._index, field)
+
+    def __getitem__(self, field: str):
+        return self._store.value(self._index, field)
+
+    def __repr__(self):
+        return f"GameRecord(id={self.id}, name={self.name!r})"
+
+    def to_dict(self) -> dict:
+        """The record as parse_response would have returned it, except that missing list fields are empty lists"""
+        return self._store.row(self._index)
+
+
+class RecordStore(ColumnBuffers):
+    """Column store of parsed games with interned list fields. Game i's labels for a list field are
+    vocabularies[field][codes[field][offsets[field][i]:offsets[field][i + 1]]]. Missing scalars are stored as -1
+    (release_dates, category) or nan (rating); a missing list field is an empty list. Scalars are kept and raw bodies
+    parsed as in response_parser.ColumnBuffers"""
+
+    def _init_lists(self):
+        self.vocabularies = {field: Vocabulary() for field in list_fields}
+        self.codes = {field: array('i') for field in list_fields}
+        self.offsets = {field: array('i', [0]) for field in list_fields}
+
+    def __getitem__(self, index: int) -> GameRecord:
+        if not -len(self) <= index < len(self):
+            raise IndexError(f"Record index {index} out of range for a store of {len(self)} games.")
+        return GameRecord(self, index % len(self))
+
+    def __iter__(self) -> Iterator[GameRecord]:
+        return (GameRecord(self, i) for i in range(len(self)))
+
+    # ////////////////////////////////////////// WRITING //////////////////////////////////////////
+
+    def _append_labels(self, field: str, labels):
+        codes = self.codes[field]
+        vocabulary = self.vocabularies[field]
+        codes.extend([vocabulary.code(label) for label in labels or ()])
+        self.offsets[field].append(len(codes))
+
+    def _append_ids(self, field: str, ids: list):
+        # only the labels are kept
+        pass
+
+    def append(self, row: dict):
+        """Adds a game parsed by data_pull.parse_response"""
+        category = row.get('category')
+        self._append_scalars(row['id'], row.get('release_dates'),
+                             category_codes[category] if category is not None else -1, row.get('rating'),
+                             row.get('rating_count'), row.get('name'), row.get('slug'), row.get('summary'))
+        for field in list_fields:
+            self._append_labels(field, row.get(field))
+
+    def append_body(self, body: dict):
+        """Adds a raw IGDB game body, skipping the intermediate dict parse_response would build"""
+        ColumnBuffers.append(self, body)
+
+    def extend(self, rows: Iterable[dict]):
+        for row in rows:
+            self.append(row)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[dict]) -> 'RecordStore':
+        store = cls()
+        store.extend(rows)
+        return store
+
+    @classmethod
+    def from_payloads(cls, payloads: Iterable[bytes | str | list], require_release_dates: bool = True) -> 'RecordStore':
+        """Builds a store straight from raw response bodies, see response_parser.parse_payloads"""
+        store = cls()
+        for payload in payloads:
+            data = orjson.loads(payload) if isinstance(payload, (bytes, str)) else payload
+            for body in data:
+                if require_release_dates and not body.get('release_dates'):
+                    continue
+                store.append_body(body)
+        return store
+
+    # ////////////////////////////////////////// READING //////////////////////////////////////////
+
+    def labels(self, index: int, field: str) -> List[str]:
+        offsets = self.offsets[field]
+        vocabulary = self.vocabularies[field].labels
+        return [vocabulary[code] for code in self.codes[field][offsets[index]:offsets[index + 1]]]
+
+    def value(self, index: int, field: str):
+        if field in self.codes:
+            return self.labels(index, field)
+        if field == 'release_dates':
+            year = self.release_dates[index]
+            return year if year != -1 else None
+        if field == 'category':
+            code = self.category[index]
+            return category_names[code] if code != -1 else None
+        if field == 'rating':
+            rating = self.rating[index]
+            return rating if rating == rating else None
+        if field in scalar_fields:
+            return getattr(self, field)[index]
+        raise AttributeError(f"Game records have no field {field!r}.")
+
+    def row(self, index: int) -> dict:
+        return {field: self.value(index, field) for field in field_order}
+
+    def _list_column(self, field: str) -> pa.Array:
+        # the vocabulary already is the dictionary, so the codes go in as they are
+        values = pa.DictionaryArray.from_arrays(pa.array(self.codes[field], type=pa.int32()),
+                                                pa.array(self.vocabularies[field].labels, type=pa.string()))
+        return pa.ListArray.from_arrays(pa.array(self.offsets[field], type=pa.int32()), values)
+
+    def indicator_matrix(self, field: str):
+        """Games x labels sparse indicator matrix of a list field, with the field's vocabulary codes as columns. A
+        label listed twice for the same game still counts once"""
+        import numpy as np
+        from scipy import sparse
+
+        codes = np.frombuffer(self.codes[field], dtype=np.int32)
+        matrix = sparse.csr_matrix((np.ones(len(codes), dtype=np.float32), codes,
+                                    np.frombuffer(self.offsets[field], dtype=np.int32)),
+                                   shape=(len(self), len(self.vocabularies[field])))
+        matrix.sum_duplicates()
+        matrix.data[:] = 1
+        return matrix
+
+    # ////////////////////////////////////////// MEMORY //////////////////////////////////////////
+
+    def memory_usage(self) -> int:
+        """Bytes held by the store: arrays, string lists and vocabularies, counting each object once"""
+        arrays = [self.id, self.release_dates, self.category, self.rating, self.rating_count,
+                  *self.codes.values(), *self.offsets.values()]
+        total = sum(sys.getsizeof(a) for a in arrays)
+        seen = set()
+        for strings in (self.name, self.slug, self.summary):
+            total += deep_size(strings, seen)
+        for vocabulary in self.vocabularies.values():
+            total += deep_size(vocabulary.labels, seen) + deep_size(vocabulary.codes, seen)
+        return total
+
+    def memory_report(self, rows: List[dict] | None = None) -> dict:
+        """Memory of the store against the list of parse_response dicts it replaces \n
+        :param rows: the parse_response rows to compare against. If not given, they are rebuilt with a separate copy
+        of every string, as decoding each response does"""
+        if rows is None:
+            rows = [{key: _copy_strings(value) for key, value in self.row(i).items()} for i in range(len(self))]
+        baseline = deep_size(rows)
+        store = self.memory_usage()
+        return {'games': len(self), 'store_bytes': store, 'baseline_bytes': baseline,
+                'ratio': baseline / store if store else None,
+                'vocabulary_sizes': {field: len(v) for field, v in self.vocabularies.items()}}
+
+
+def _copy_strings(value):
+    if isinstance(value, str):
+        return value.encode('utf-8').decode('utf-8')
+    if isinstance(value, list):
+        return [_copy_strings(v) for v in value]
+    return value
+
+
+def deep_size(obj, seen: set | None = None) -> int:
+    """sys.getsizeof of an object and everything it contains (dicts, lists, tuples, sets), each object counted once"""
+    seen = seen if seen is not None else set()
+    stack = [obj]
+    total = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+    return total
@@ -0,0 +1,112 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+default_cache_path = Path(__file__).parent.joinpath('datasets', 'igdb_cache.sqlite')
+
+
+class CacheMissError(LookupError):
+    """Raised in offline mode when a query has no cached response"""
+
+
+class ResponseCache:
+    """Content-addressed on-disk cache of IGDB response bodies, keyed on endpoint + query bytes \n
+    :param path: location of the sqlite database
+    :param ttl: seconds before an entry goes stale, None to keep entries forever
+    :param max_bytes: cap on the total size of cached bodies; least recently used entries are evicted past it
+    :param offline: cache-only mode. Stale entries are still served, and nothing is sent to IGDB, see post_request
+
+    Usage:
+        cache = ResponseCache(ttl=7 * 24 * 3600)
+        response = post_request(query, twitch_client_id, access_token, cache=cache)
+    """
+
+    def __init__(self, path: str | Path = default_cache_path, ttl: float | None = 30 * 24 * 3600,
+                 max_bytes: int = 1024 ** 3, offline: bool = False):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS responses ('
+                           'key BLOB PRIMARY KEY, endpoint TEXT, body BLOB, size INTEGER, '
+                           'created_at REAL, accessed_at REAL)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)')
+        self.total_bytes = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    @staticmethod
+    def make_key(endpoint: str, query: bytes | str) -> bytes:
+        if isinstance(query, str):
+            query = query.encode('utf-8')
+        return hashlib.sha256(endpoint.encode('utf-8') + b'\0' + query).digest()
+
+    def get(self, endpoint: str, query: bytes | str) -> bytes | None:
+        """Returns the cached body for a query, or None if there isn't a fresh one"""
+        key = self.make_key(endpoint, query)
+        with self._lock:
+            row = self._conn.execute('SELECT body, created_at FROM responses WHERE key = ?', (key,)).fetchone()
+            now = time.time()
+            if row is None or (not self.offline and self.ttl is not None and now - row[1] > self.ttl):
+                self.misses += 1
+                return None
+            self._conn.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (now, key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, endpoint: str, query: bytes | str, body: bytes):
+        key = self.make_key(endpoint, query)
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+            self._conn.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)',
+                               (key, endpoint, body, len(body), now, now))
+            self.total_bytes += len(body) - (old[0] if old else 0)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # drop least recently used entries until we're comfortably under the cap, so we don't evict on every put
+        target = self.max_bytes * 0.9
+        cursor = self._conn.execute('SELECT key, size FROM responses ORDER BY accessed_at')
+        evicted = []
+        for key, size in cursor:
+            if self.total_bytes <= target:
+                break
+            evicted.append((key,))
+            self.total_bytes -= size
+        cursor.close()
+        self._conn.executemany('DELETE FROM responses WHERE key = ?', evicted)
+
+    def purge_expired(self) -> int:
+        """Deletes stale entries, returns the number deleted"""
+        if self.ttl is None:
+            return 0
+        with self._lock:
+            cutoff = time.time() - self.ttl
+            deleted = self._conn.execute('DELETE FROM responses WHERE created_at < ?', (cutoff,)).rowcount
+            self.total_bytes = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+            return deleted
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM responses')
+            self.total_bytes = 0
+
+    def __len__(self):
+        return self._conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,145 @@
+"""Single-pass, columnar counterpart to data_pull.parse_response.
+
+Each payload is decoded exactly once with orjson, and every game is written straight into per-column buffers rather
+than into a dict of its own. List fields (platforms, genres, ...) are kept as a flat list of values plus an offsets
+array, which maps directly onto an Arrow list column.
+
+    buffers = parse_payloads(response.content for response in responses)
+    df = buffers.to_pandas()
+"""
+from array import array
+from typing import Iterable
+
+import orjson
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from data_pull import categories, age_ratings
+
+# max code in the categories/age_ratings dicts, used to build flat lookup lists
+category_names = [categories.get(i) for i in range(max(categories) + 1)]
+age_rating_names = [age_ratings.get(i) for i in range(max(age_ratings) + 1)]
+
+# list fields whose elements are {'id': .., 'name': ..}
+named_list_fields = ['platforms', 'genres', 'similar_games', 'themes']
+list_fields = ['platforms', 'genres', 'tags', 'age_ratings', 'similar_games', 'themes', 'involved_companies']
+# column order of parse_response rows
+field_order = ['id', 'release_dates', 'name', 'category', 'slug', 'platforms', 'genres', 'tags', 'age_ratings',
+               'rating', 'rating_count', 'similar_games', 'themes', 'summary', 'involved_companies']
+
+
+# ///////////////////////////////////////////////////////////////////////////////////
+
+class ColumnBuffers:
+    """Column buffers for parsed games. Scalar columns are typed arrays (or lists, for strings); list columns are
+    stored in `values[field]` and `offsets[field]`, where game i's values are values[offsets[i]:offsets[i + 1]], and
+    the IGDB ids of platforms, genres, themes and similar games are kept alongside in `ids[field]`.
+    `category` holds the IGDB category code, -1 where missing or unknown, and `release_dates` holds the year, -1 where missing.
+    Unlike parse_response, a missing list field is an empty list rather than None. \n
+    Subclasses can store list fields differently by overriding _init_lists, _append_labels, _append_ids and
+    _list_column, see record_store.RecordStore"""
+
+    def __init__(self):
+        self._init_scalars()
+        self._init_lists()
+
+    def _init_scalars(self):
+        self.id = array('q')
+        self.release_dates = array('h')
+        self.category = array('b')
+        self.rating = array('d')
+        self.rating_count = array('i')
+        self.name = []
+        self.slug = []
+        self.summary = []
+
+    def _init_lists(self):
+        self.values = {field: [] for field in list_fields}
+        self.offsets = {field: array('i', [0]) for field in list_fields}
+        # platform/genre/theme ids, alongside their names
+        self.ids = {field: array('q') for field in named_list_fields}
+
+    def __len__(self):
+        return len(self.id)
+
+    def _append_scalars(self, game_id: int, year, category_code: int, rating, rating_count, name, slug, summary):
+        self.id.append(game_id)
+        self.release_dates.append(int(year) if year is not None and year == year else -1)
+        # a category IGDB added after the categories dict was written is stored as missing, not as a code past the end
+        # of category_names (or past int8)
+        self.category.append(category_code if category_code in categories else -1)
+        self.rating.append(rating if rating is not None else float('nan'))
+        self.rating_count.append(int(rating_count) if rating_count is not None and rating_count == rating_count else 0)
+        self.name.append(name)
+        self.slug.append(slug)
+        self.summary.append(summary)
+
+    def _append_labels(self, field: str, labels):
+        values = self.values[field]
+        values.extend(labels or ())
+        self.offsets[field].append(len(values))
+
+    def _append_ids(self, field: str, ids: list):
+        self.ids[field].extend(ids)
+
+    def append(self, body: dict):
+        """Writes a single decoded game into the buffers"""
+        release_dates = body.get('release_dates')
+        self._append_scalars(body['id'], release_dates[0].get('y') if release_dates else None,
+                             body.get('category', -1), body.get('rating'), body.get('rating_count', 0),
+                             body.get('name'), body.get('slug'), body.get('summary'))
+        for field in named_list_fields:
+            items = body.get(field, ())
+            self._append_labels(field, [item['name'] for item in items])
+            self._append_ids(field, [item['id'] for item in items])
+        self._append_labels('tags', list(map(str, body.get('tags', ()))))
+        self._append_labels('age_ratings', [age_rating_names[item['rating']] for item in body.get('age_ratings', ())])
+        self._append_labels('involved_companies',
+                            [item['company']['name'] for item in body.get('involved_companies', ())])
+
+    def _list_column(self, field: str) -> pa.Array:
+        values = pa.array(self.values[field], type=pa.string()).dictionary_encode()
+        return pa.ListArray.from_arrays(pa.array(self.offsets[field], type=pa.int32()), values)
+
+    def to_arrow(self) -> pa.Table:
+        """Builds an Arrow table without going through per-row Python objects. Missing scalars become nulls, and
+        list/category columns are dictionary encoded"""
+        release_dates = pa.array(self.release_dates, type=pa.int16())
+        category = pa.array(self.category, type=pa.int8())
+        rating = pa.array(self.rating, type=pa.float64())
+        columns = {
+            'id': pa.array(self.id, type=pa.int64()),
+            'release_dates': pc.if_else(pc.equal(release_dates, -1), None, release_dates),
+            'name': pa.array(self.name, type=pa.string()),
+            'category': pa.DictionaryArray.from_arrays(
+                pc.if_else(pc.equal(category, -1), None, category), category_names),
+            'slug': pa.array(self.slug, type=pa.string()),
+            'rating': pc.if_else(pc.is_nan(rating), None, rating),
+            'rating_count': pa.array(self.rating_count, type=pa.int32()),
+            'summary': pa.array(self.summary, type=pa.string()),
+        }
+        for field in list_fields:
+            columns[field] = self._list_column(field)
+        return pa.table({name: columns[name] for name in field_order})
+
+    def to_pandas(self) -> pd.DataFrame:
+        """Converts the buffers to a DataFrame; list columns hold numpy arrays of strings"""
+        return self.to_arrow().to_pandas()
+
+
+def parse_payloads(payloads: Iterable[bytes | str | list], buffers: ColumnBuffers | None = None,
+                   require_release_dates: bool = True) -> ColumnBuffers:
+    """Decodes each payload once and appends every game in it to the column buffers \n
+    :param payloads: raw response bodies (bytes/str), or already-decoded lists of games
+    :param buffers: buffers to append to, a new one is created if not provided
+    :param require_release_dates: skip games without release dates, as the curation notebook does
+    """
+    buffers = buffers if buffers is not None else ColumnBuffers()
+    for payload in payloads:
+        data = orjson.loads(payload) if isinstance(payload, (bytes, str)) else payload
+        for body in data:
+            if require_release_dates and not body.get('release_dates'):
+                continue
+            buffers.append(body)
+    return buffers
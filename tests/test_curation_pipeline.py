@@ -0,0 +1,199 @@
+import asyncio
+import concurrent.futures
+import csv
+import threading
+import time
+
+import pytest
+from aiohttp import web
+
+from curation_pipeline import CurationPipeline, IGDBFetcher, bounded
+from igdb_stub_server import StubServer, load_records, quoted_pattern
+from library_store import LibraryStore
+
+
+class Crash(Exception):
+    pass
+
+
+@pytest.fixture(scope='module')
+def records():
+    return load_records()
+
+
+@pytest.fixture(scope='module')
+def server(records):
+    with StubServer(records=records) as server:
+        yield server
+
+
+@pytest.fixture
+def source(tmp_path, records):
+    # every stub title, some twice, with titles IGDB won't know mixed in
+    names = [r['name'] for r in records[:120]]
+    titles = [title for i, name in enumerate(names) for title in ([name, f"Unknown Game {i}"] if i % 7 == 0 else [name])]
+    path = tmp_path / 'titles.csv'
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Rank', 'Name'])
+        writer.writerows(enumerate(titles + names[:10]))
+    return path
+
+
+def pipeline(server, directory, fetch=None, **kwargs):
+    fetch = fetch or IGDBFetcher('client-id', 'token', base_url=server.url, rate=10_000)
+    kwargs = {'batch_size': 8, 'flush_rows': 20, 'clean': False, **kwargs}
+    return CurationPipeline(fetch=fetch, store=LibraryStore(directory / 'library'),
+                            checkpoint_path=directory / 'checkpoint.json', **kwargs)
+
+
+def crashing(fetch, after: int):
+    calls = []
+
+    def lookup(titles):
+        calls.append(titles)
+        if len(calls) > after:
+            raise Crash()
+        return fetch(titles)
+    return lookup
+
+
+def library(directory):
+    df = LibraryStore(directory / 'library').to_pandas()
+    return sorted(df['id']), df['id'].is_unique
+
+
+def fails(directory):
+    with open(directory / 'checkpoint.fails.csv', encoding='utf-8', newline='') as f:
+        return sorted(map(tuple, csv.reader(f)))
+
+
+@pytest.mark.parametrize('clean', [False, True])
+def test_crash_and_resume_matches_uninterrupted_run(tmp_path, server, source, clean):
+    expected = pipeline(server, tmp_path / 'full', clean=clean).run(source)
+    assert expected['passes'] > 0 and expected['fails'] > 0
+
+    with IGDBFetcher('client-id', 'token', base_url=server.url, rate=10_000) as fetch:
+        with pytest.raises(Crash):
+            pipeline(server, tmp_path / 'resumed', crashing(fetch, after=6), clean=clean).run(source)
+        assert len(LibraryStore(tmp_path / 'resumed' / 'library').parts) > 0
+        resumed = pipeline(server, tmp_path / 'resumed', fetch, clean=clean).run(source)
+
+    assert {k: resumed[k] for k in ('position', 'passes', 'fails', 'discards')} == \
+           {k: expected[k] for k in ('position', 'passes', 'fails', 'discards')}
+    ids, unique = library(tmp_path / 'resumed')
+    assert unique and ids == library(tmp_path / 'full')[0]
+    assert fails(tmp_path / 'resumed') == fails(tmp_path / 'full')
+
+
+def test_sessions_and_compaction(tmp_path, server, source):
+    expected = pipeline(server, tmp_path / 'full').run(source)
+    run = pipeline(server, tmp_path / 'sessions')
+    run.run(source, max_titles=40)
+    run.compact()
+    assert len(run.store.parts) == 1
+    checkpoint = run.run(source)
+    run.compact()
+
+    assert checkpoint['passes'] == expected['passes']
+    assert len(run.store.parts) == 1
+    ids, unique = library(tmp_path / 'sessions')
+    assert unique and ids == library(tmp_path / 'full')[0]
+
+
+def test_compact_rolls_back_interrupted_run(tmp_path, server, source):
+    expected = pipeline(server, tmp_path / 'full').run(source)
+    with IGDBFetcher('client-id', 'token', base_url=server.url, rate=10_000) as fetch:
+        with pytest.raises(Crash):
+            pipeline(server, tmp_path / 'crashed', crashing(fetch, after=6)).run(source)
+        run = pipeline(server, tmp_path / 'crashed', fetch)
+        run.compact()
+        run.run(source)
+    ids, unique = library(tmp_path / 'crashed')
+    assert unique and ids == library(tmp_path / 'full')[0]
+    assert fails(tmp_path / 'crashed') == fails(tmp_path / 'full')
+
+
+def test_client_error_fails_batch_without_stopping_run(tmp_path, records, source):
+    rejected = []
+
+    @web.middleware
+    async def reject(request, handler):
+        query = (await request.read()).decode('utf-8')
+        if 'Unknown Game 7' in query:
+            rejected.extend(quoted_pattern.findall(query))
+            return web.Response(status=400, text='Syntax Error')
+        return await handler(request)
+
+    stub = StubServer(records=records)
+    stub.app.middlewares.append(reject)
+    with stub:
+        checkpoint = pipeline(stub, tmp_path).run(source)
+    assert checkpoint['passes'] > 0
+    # every title of the rejected batch is recorded as a fail, and the run carried on past it
+    failed = {row[1] for row in fails(tmp_path)}
+    assert 'Unknown Game 7' in rejected and set(rejected) <= failed
+    assert 'Unknown Game 119' in failed
+
+
+def stage_threads():
+    return {thread for thread in threading.enumerate() if thread.name == 'bounded-stage'}
+
+
+def test_closing_mid_stream_leaves_no_threads(tmp_path, server, source):
+    before = stage_threads()
+
+    def endless():
+        i = 0
+        while True:
+            yield i
+            i += 1
+
+    # the producer is blocked on a full queue when the consumer goes away
+    items = bounded(bounded(endless(), 2), 2)
+    assert [next(items) for _ in range(5)] == list(range(5))
+    time.sleep(0.2)
+    items.close()
+    assert not stage_threads() - before
+
+    # breaking out of a run mid-stream stops every stage
+    checkpoint = pipeline(server, tmp_path, queue_size=1, clean=True).run(source, max_titles=8)
+    assert checkpoint['position'] >= 0
+    assert not stage_threads() - before
+
+
+def test_closing_fetcher_cancels_lookup_in_flight(records):
+    started, release = threading.Event(), threading.Event()
+
+    @web.middleware
+    async def slow(request, handler):
+        started.set()
+        while not release.is_set():
+            await asyncio.sleep(0.05)
+        return await handler(request)
+
+    stub = StubServer(records=records)
+    stub.app.middlewares.append(slow)
+    with stub:
+        try:
+            before = set(threading.enumerate())
+            fetch = IGDBFetcher('client-id', 'token', base_url=stub.url, rate=10_000)
+            outcome = []
+
+            def lookup():
+                try:
+                    outcome.append(fetch([records[0]['name']]))
+                except BaseException as e:
+                    outcome.append(e)
+
+            thread = threading.Thread(target=lookup)
+            thread.start()
+            assert started.wait(5)
+            closed_at = time.monotonic()
+            fetch.close()
+            thread.join(5)
+            assert time.monotonic() - closed_at < 5
+            assert not thread.is_alive() and isinstance(outcome[0], concurrent.futures.CancelledError)
+            assert set(threading.enumerate()) <= before
+        finally:
+            release.set()
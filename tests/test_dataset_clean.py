@@ -0,0 +1,90 @@
+from ast import literal_eval
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from library_store import datasets
+from text_processing.dataset_clean import assert_esrb_rating, assign_platform_aliases, batch_assert_esrb_rating, \
+    batch_assign_platform_aliases, batch_map_genres, clean_library, explode_list_column, map_genres
+
+raised = object()
+
+
+def row_wise(col: pd.Series, f) -> pd.Series:
+    def apply(value):
+        try:
+            return f(value)
+        except (KeyError, TypeError, ValueError, SyntaxError):
+            return raised
+    return col.apply(apply)
+
+
+def assert_same(expected: pd.Series, result: pd.Series):
+    """Every row the row-wise function doesn't raise on matches, NaN included"""
+    assert len(expected) == len(result)
+    for value, batch_value in zip(expected, result):
+        if value is raised:
+            continue
+        if pd.isna(value):
+            assert pd.isna(batch_value)
+        else:
+            assert value == batch_value
+
+
+@pytest.fixture(scope='module')
+def new_data():
+    return pd.read_csv(datasets.joinpath('new_data.csv')).dropna(subset=['id'])
+
+
+@pytest.fixture(scope='module')
+def games():
+    return pd.read_csv(datasets.joinpath('games.csv'))
+
+
+def test_platforms_raw(new_data):
+    assert_same(row_wise(new_data['platforms'], assign_platform_aliases),
+                batch_assign_platform_aliases(new_data['platforms']))
+
+
+def test_platforms_comma_joined(new_data):
+    joined = new_data['platforms'].map(lambda x: ','.join(literal_eval(x)))
+    expected = row_wise(joined, assign_platform_aliases)
+    assert not any(value is raised for value in expected)
+    assert_same(expected, batch_assign_platform_aliases(joined))
+
+
+def test_platforms_comma_joined_row():
+    col = pd.Series(['PlayStation 4,Xbox One,PC (Microsoft Windows)', 'Nintendo Switch', 'Unknown Console', ''])
+    assert batch_assign_platform_aliases(col).tolist() == [assign_platform_aliases(value) for value in col]
+    assert batch_assign_platform_aliases(col)[0] == 'PS4,XB1,Windows'
+
+
+def test_platform_lists():
+    col = pd.Series([['PlayStation 4', 'Xbox One'], [], None])
+    result = batch_assign_platform_aliases(col)
+    assert result[0] == 'PS4,XB1' and pd.isna(result[1]) and pd.isna(result[2])
+
+
+def test_age_ratings(new_data):
+    assert_same(row_wise(new_data['age_ratings'], assert_esrb_rating),
+                batch_assert_esrb_rating(new_data['age_ratings']))
+
+
+@pytest.mark.parametrize('dataset, column', [('new_data', 'genres'), ('games', 'Genres')])
+def test_genres(request, dataset, column):
+    col = request.getfixturevalue(dataset)[column]
+    assert_same(row_wise(col, map_genres), batch_map_genres(col))
+
+
+def test_clean_library_is_a_copy(new_data):
+    cleaned = clean_library(new_data)
+    assert cleaned['platforms'].tolist() == batch_assign_platform_aliases(new_data['platforms']).tolist()
+    assert new_data['genres'].iloc[0].startswith('[')
+
+
+def test_explode_list_column():
+    col = pd.Series(["['Adventure', \"Hack and slash/Beat 'em up\"]", ['RPG'], 'Shooter,Puzzle', np.nan, ''])
+    values, offsets = explode_list_column(col)
+    assert values.tolist() == ['Adventure', "Hack and slash/Beat 'em up", 'RPG', 'Shooter', 'Puzzle']
+    assert offsets.tolist() == [0, 2, 3, 5, 5, 5]
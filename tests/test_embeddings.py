@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from scipy import sparse
+
+from text_processing.embeddings import SVDEmbedding, build_embedding
+from text_processing.similarity_metrics import SimilarityRecommender
+
+
+@pytest.fixture(scope='module')
+def recommender():
+    # rank 8 features, so an 8 dimensional embedding keeps every similarity
+    rng = np.random.default_rng(0)
+    features = (np.abs(rng.normal(size=(120, 8))) @ np.abs(rng.normal(size=(8, 40)))).astype(np.float32)
+    return SimilarityRecommender(sparse.csr_matrix(features))
+
+
+def test_full_rank_embedding_keeps_similarities(recommender):
+    embedding = SVDEmbedding(n_components=8).fit(recommender.features)
+    assert embedding.embeddings.dtype == np.float32 and embedding.embeddings.shape == (120, 8)
+    exact = (recommender.features @ recommender.features.T).toarray()
+    np.testing.assert_allclose(embedding.score_rows(embedding.embeddings), exact, atol=1e-4)
+    np.testing.assert_allclose(embedding.transform(recommender.features[:5]), embedding.embeddings[:5], atol=1e-4)
+
+    for target in range(0, 120, 17):
+        indices, scores = embedding.recommend(target, N=10, return_scores=True)
+        exact_indices, exact_scores = recommender.recommend(target, N=10, return_scores=True, exact=True)
+        np.testing.assert_allclose(scores, exact_scores, atol=1e-4)
+        assert target not in indices and len(set(indices) & set(exact_indices)) >= 9
+
+
+def test_recommend_batch_matches_recommend(recommender):
+    embedding = SVDEmbedding(n_components=4).fit(recommender.features)
+    indices, _ = embedding.recommend_batch(range(120), N=5, block_size=16)
+    assert indices.shape == (120, 5)
+    for target in range(0, 120, 11):
+        assert list(indices[target]) == list(embedding.recommend(target, N=5))
+
+
+def test_saved_embedding_is_memory_mapped(tmp_path, recommender):
+    recommender = SimilarityRecommender(recommender.features.copy())
+    embedding = build_embedding(recommender, n_components=6, path=tmp_path)
+    assert recommender.ann_index is embedding
+    expected = recommender.recommend(3, N=10)
+
+    opened = SVDEmbedding.open(tmp_path)
+    assert isinstance(opened.embeddings, np.memmap) and opened.n_components == 6
+    assert list(opened.recommend(3, N=10)) == list(expected)
+    assert opened.memory_usage() == embedding.memory_usage()
+
+    # appended games aren't in the embedding, so it is dropped
+    recommender.append(recommender.features[:2])
+    assert recommender.ann_index is None
@@ -0,0 +1,72 @@
+from ast import literal_eval
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from text_processing.encoders import MultiLabelEncoder, fit_encoders, load_encoders, save_encoders
+from text_processing.nlp import multilabel_encode, one_hot_encode
+
+datasets = Path(__file__).parent.parent.joinpath('datasets')
+
+
+@pytest.fixture(scope='module')
+def library():
+    df = pd.read_csv(datasets.joinpath('new_data.csv'))
+    for field in ['genres', 'themes', 'platforms', 'involved_companies']:
+        df[field] = [literal_eval(value) if isinstance(value, str) else [] for value in df[field]]
+    return df
+
+
+@pytest.fixture(scope='module')
+def joined_genres(library):
+    # the cleaned library's "Adventure,RPG" strings, without games that have no genres
+    genres = library['genres'][library['genres'].map(len) > 0]
+    return pd.DataFrame({'genres': genres.map(','.join)})
+
+
+def dense(frame: pd.DataFrame) -> pd.DataFrame:
+    return frame.sparse.to_dense().astype(int).sort_index(axis=1)
+
+
+def test_matches_one_hot_encode(joined_genres):
+    encoder = MultiLabelEncoder(sep=',')
+    encoded = encoder.to_frame(encoder.fit_transform(joined_genres['genres']), index=joined_genres.index)
+    expected = one_hot_encode(joined_genres, 'genres').sort_index(axis=1)
+    pd.testing.assert_frame_equal(dense(encoded), expected.astype(int), check_names=False)
+    pd.testing.assert_frame_equal(dense(encoded), multilabel_encode(joined_genres).sort_index(axis=1).astype(int),
+                                  check_names=False)
+
+
+def test_lists_match_joined_strings(library, joined_genres):
+    from_lists = MultiLabelEncoder().fit_transform(library['genres'].loc[joined_genres.index])
+    from_strings = MultiLabelEncoder(sep=',').fit_transform(joined_genres['genres'])
+    assert from_lists.dtype == np.float32 and (from_lists != from_strings).nnz == 0
+
+
+def test_saved_vocabulary_encodes_new_titles(tmp_path, library):
+    fitted, new = library.iloc[:300], library.iloc[300:]
+    encoders = fit_encoders(fitted, min_count=2)
+    save_encoders(encoders, tmp_path)
+    loaded = load_encoders(tmp_path)
+    assert loaded.keys() == encoders.keys()
+    for field, encoder in encoders.items():
+        assert loaded[field].labels_ == encoder.labels_
+        assert (loaded[field].transform(new[field]) != encoder.transform(new[field])).nnz == 0
+
+    # labels the vocabulary doesn't have are ignored, and duplicates count once
+    encoder = loaded['genres']
+    matrix = encoder.transform(pd.Series([['Shooter', 'Not A Genre', 'Shooter'], []]))
+    assert matrix.shape == (2, len(encoder.labels_))
+    assert matrix.toarray().tolist()[0] == [float(label == 'Shooter') for label in encoder.labels_]
+    assert matrix[1].nnz == 0
+
+
+def test_partial_fit_keeps_columns(library):
+    encoder = MultiLabelEncoder().fit(library['involved_companies'].iloc[:100])
+    before = encoder.transform(library['involved_companies'].iloc[:100])
+    added = encoder.partial_fit(library['involved_companies'].iloc[100:])
+    assert added and encoder.labels_[-len(added):] == added
+    after = encoder.transform(library['involved_companies'].iloc[:100])
+    assert (after[:, :before.shape[1]] != before).nnz == 0 and after[:, before.shape[1]:].nnz == 0
@@ -0,0 +1,110 @@
+import numpy as np
+import pytest
+from scipy import sparse
+
+from text_processing.hybrid import HybridRecommender, SimilarGamesGraph, popularity_prior
+from text_processing.similarity_metrics import SimilarityRecommender
+
+
+def reference_pagerank(adjacency: np.ndarray, target: int, restart: float, steps: int) -> np.ndarray:
+    # dense power iteration of the same walk
+    degree = adjacency.sum(axis=1)
+    scores = np.zeros(len(adjacency))
+    scores[target] = 1.0
+    for _ in range(steps):
+        linked = degree > 0
+        spread = (1 - restart) * adjacency.T @ np.where(linked, scores / np.where(linked, degree, 1), 0)
+        spread[target] += restart * scores[linked].sum() + scores[~linked].sum()
+        scores = spread
+    return scores
+
+
+def random_graph(num_games, num_edges, seed=0):
+    rng = np.random.default_rng(seed)
+    edges = sparse.coo_matrix((np.ones(num_edges), (rng.integers(0, num_games, num_edges),
+                                                    rng.integers(0, num_games, num_edges))),
+                              shape=(num_games, num_games)).tocsr()
+    return SimilarGamesGraph(edges + edges.T)
+
+
+def dense_adjacency(graph):
+    return (graph._adjacency().toarray() > 0).astype(float)
+
+
+def test_from_library_resolves_names():
+    names = ['Halo', 'Doom', 'The Legend of Zelda', 'Quake', 'Halo']
+    similar = [['Doom', 'Unknown Game', 'Halo'], "['the legend of zelda']", None, ['DOOM'], ['Quake']]
+    graph = SimilarGamesGraph.from_library(names, similar)
+    # links go both ways, a game doesn't link to itself, and the second Halo's link lands on its own row
+    assert sorted(graph.neighbours(0)) == [1]
+    assert sorted(graph.neighbours(1)) == [0, 2, 3]
+    assert sorted(graph.neighbours(2)) == [1]
+    assert sorted(graph.neighbours(3)) == [1, 4]
+    assert graph.indices.dtype == np.int32 and graph.num_edges == 4
+
+
+@pytest.mark.parametrize('num_edges', [8, 400])
+def test_pagerank_matches_dense_iteration(num_edges):
+    # a sparse graph keeps to gathering neighbour lists, a dense one switches to whole-graph mat-vecs
+    graph = random_graph(60, num_edges)
+    adjacency = dense_adjacency(graph)
+    for target in [0, 7, 31]:
+        for steps in [1, 3, 5]:
+            scores = graph.personalized_pagerank(target, restart=0.3, steps=steps)
+            np.testing.assert_allclose(scores, reference_pagerank(adjacency, target, 0.3, steps), atol=1e-12)
+            assert scores.sum() == pytest.approx(1.0)
+
+
+def test_pagerank_on_a_path():
+    # 0 - 1 - 2, and 3 on its own
+    graph = SimilarGamesGraph(sparse.csr_matrix(([1, 1, 1, 1], ([0, 1, 1, 2], [1, 0, 2, 1])), shape=(4, 4)))
+    np.testing.assert_allclose(graph.personalized_pagerank(0, restart=0.3, steps=1), [0.3, 0.7, 0, 0])
+    np.testing.assert_allclose(graph.personalized_pagerank(0, restart=0.3, steps=2),
+                               [0.09 + 0.21 + 0.245, 0.21, 0.245, 0])
+    # a game without links keeps all of its mass
+    np.testing.assert_allclose(graph.personalized_pagerank(3, steps=3), [0, 0, 0, 1])
+
+
+def test_save_and_load(tmp_path):
+    graph = random_graph(30, 50)
+    graph.save(tmp_path / 'graph.npz')
+    loaded = SimilarGamesGraph.load(tmp_path / 'graph.npz')
+    np.testing.assert_array_equal(loaded.personalized_pagerank(4), graph.personalized_pagerank(4))
+
+
+def test_hybrid_blends_scores():
+    rng = np.random.default_rng(1)
+    features = sparse.random(40, 12, density=0.15, format='csr', dtype=np.float32, random_state=rng)
+    recommender = SimilarityRecommender(features)
+    graph = random_graph(40, 30, seed=2)
+    rating_count = rng.integers(0, 500, 40).astype(float)
+    rating_count[5] = np.nan
+    hybrid = HybridRecommender(recommender, graph, rating_count, weights={'content': 0.5, 'graph': 0.3,
+                                                                           'popularity': 0.2})
+    prior = popularity_prior(rating_count)
+    assert prior[5] == 0 and prior.max() == pytest.approx(1.0)
+
+    for target in range(0, 40, 9):
+        content = recommender.scores(target)
+        walk = graph.personalized_pagerank(target)
+        walk[target] = 0
+        walk = walk / walk.max() if walk.max() > 0 else walk
+        related = (content > 0) | (walk > 0)
+        expected = 0.5 * content + 0.3 * walk + 0.2 * prior * related
+        np.testing.assert_allclose(hybrid.scores(target), expected, rtol=1e-5, atol=1e-6)
+
+        indices, scores = hybrid.recommend(target, N=5, return_scores=True)
+        assert target not in indices and list(scores) == sorted(scores, reverse=True)
+
+    # the graph alone ranks the target's neighbours first
+    hybrid.set_weights({'graph': 1.0})
+    target = int(np.argmax(graph.degree))
+    assert set(hybrid.recommend(target, N=len(graph.neighbours(target)))) == set(graph.neighbours(target))
+
+
+def test_hybrid_rejects_mismatches():
+    recommender = SimilarityRecommender(sparse.identity(5, dtype=np.float32, format='csr'))
+    with pytest.raises(ValueError):
+        HybridRecommender(recommender, random_graph(6, 5), np.ones(6))
+    with pytest.raises(ValueError):
+        HybridRecommender(recommender, random_graph(5, 5), np.ones(5), weights={'views': 1.0})
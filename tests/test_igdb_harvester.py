@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+
+from igdb_harvester import HarvestError, IGDBHarvester, harvest_titles
+from igdb_stub_server import StubServer, load_records
+
+titles = ['The Legend of Zelda: Tears of the Kingdom', 'Big Brain Academy', 'Donkey Kong Land',
+          'Street Fighter II Turbo']
+
+
+@pytest.fixture(scope='module')
+def records():
+    return load_records()
+
+
+def harvest(server, titles, **kwargs):
+    kwargs = {'rate': 1000, 'backoff': 0.01, **kwargs}
+    batch_size = kwargs.pop('batch_size', 1)
+    return harvest_titles(titles, 'client-id', 'token', base_url=server.url, batch_size=batch_size, **kwargs)
+
+
+@pytest.mark.parametrize('batch_size', [1, 3])
+def test_harvest_passes_and_fails(records, batch_size):
+    with StubServer(records=records) as server:
+        passes, fails, discards = harvest(server, titles + ['Not A Real Game'], batch_size=batch_size)
+    assert sorted(row['name'] for row in passes) == sorted(titles)
+    assert fails == [('Not A Real Game', 'name equals')]
+
+
+def test_known_ids_are_discarded(records):
+    known = {r['id'] for r in records if r['name'] == titles[0]}
+    with StubServer(records=records) as server:
+        passes, fails, discards = harvest(server, titles, known_ids=set(known))
+    assert titles[0] not in {row['name'] for row in passes}
+    assert {body['id'] for body in discards} == known
+
+
+def test_retries_server_errors(records):
+    async def run(server):
+        async with IGDBHarvester('client-id', 'token', base_url=server.url, rate=1000, backoff=0.01,
+                                 max_retries=20) as harvester:
+            return await harvester.harvest(titles), harvester.num_retries
+
+    with StubServer(records=records, error_rate=0.5) as server:
+        (passes, fails, _), num_retries = asyncio.run(run(server))
+        errors = server.stats['errors']
+    assert len(passes) == len(titles) and not fails
+    assert num_retries == errors > 0
+
+
+def test_exhausted_retries_become_fails(records):
+    with StubServer(records=records, error_rate=1.0) as server:
+        passes, fails, _ = harvest(server, titles, max_retries=1)
+    assert not passes
+    assert [title for title, _ in fails] == titles
+
+
+def test_client_error_fails_only_its_title(records):
+    rejected = []
+
+    @web.middleware
+    async def reject(request, handler):
+        # IGDB answers queries it can't handle with a 400
+        if b'Donkey Kong' in await request.read():
+            rejected.append(request)
+            return web.Response(status=400, text='Syntax Error')
+        return await handler(request)
+
+    server = StubServer(records=records)
+    server.app.middlewares.append(reject)
+    with server:
+        passes, fails, _ = harvest(server, titles)
+    assert sorted(row['name'] for row in passes) == sorted(set(titles) - {'Donkey Kong Land'})
+    assert fails == [('Donkey Kong Land', 'name equals')]
+    # not retried
+    assert len(rejected) == 1
+
+
+def test_post_raises_harvest_error_on_client_error(records):
+    async def run(server):
+        async with IGDBHarvester('client-id', 'token', base_url=server.url, rate=1000) as harvester:
+            await harvester.post(b'fields name;', endpoint='missing')
+
+    with StubServer(records=records) as server, pytest.raises(HarvestError, match='HTTP 404'):
+        asyncio.run(run(server))
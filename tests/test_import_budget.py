@@ -0,0 +1,10 @@
+import pytest
+
+from benchmarks.bench_import import import_budgets, lazy_dependencies, measure
+
+
+@pytest.mark.parametrize('module', list(import_budgets))
+def test_cold_import_within_budget(module):
+    result = measure(module, repeat=2)
+    assert not set(result['loaded']) & set(lazy_dependencies), f"{module} imported {result['loaded']} at import time"
+    assert result['seconds'] <= import_budgets[module]
@@ -0,0 +1,62 @@
+import json
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from text_processing.incremental import IncrementalModel
+from text_processing.neighbours import compute_neighbour_table
+
+
+def library(num_games, first_id=1, seed=0):
+    rng = np.random.default_rng(seed)
+    labels = {'genres': ['Shooter', 'RPG', 'Puzzle', 'Racing'], 'themes': ['Action', 'Fantasy', 'Horror'],
+              'platforms': ['PC', 'Xbox', 'Switch'], 'involved_companies': ['Bungie', 'Nintendo', 'Valve']}
+    return pd.DataFrame([{'id': first_id + i, **{field: list(rng.choice(values, 2, replace=False))
+                                                 for field, values in labels.items()}}
+                         for i in range(num_games)])
+
+
+def test_save_copies_temporary_table_into_model(tmp_path):
+    model = IncrementalModel.build(library(30), k=5)
+    temporary = model.table.path
+    assert model.table.temporary
+
+    model.save(tmp_path / 'model')
+    assert not temporary.exists()
+    with open(tmp_path / 'model' / 'model.json', encoding='utf-8') as f:
+        assert json.load(f)['neighbours'] == 'neighbours'
+
+    # the saved model doesn't depend on where it was written
+    shutil.move(tmp_path / 'model', tmp_path / 'moved')
+    loaded = IncrementalModel.load(tmp_path / 'moved')
+    np.testing.assert_array_equal(loaded.table.indices, model.table.indices)
+
+
+def test_save_references_chosen_table_path(tmp_path):
+    model = IncrementalModel.build(library(30), k=5, neighbours_path=tmp_path / 'neighbours')
+    model.save(tmp_path / 'model')
+    assert not (tmp_path / 'model' / 'neighbours').exists()
+    loaded = IncrementalModel.load(tmp_path / 'model')
+    assert loaded.table.path.resolve() == (tmp_path / 'neighbours').resolve()
+
+
+def test_add_titles_matches_rebuild(tmp_path):
+    old, new = library(40), library(10, first_id=41, seed=1)
+    model = IncrementalModel.build(old, k=5)
+    model.save(tmp_path / 'model')
+    model = IncrementalModel.load(tmp_path / 'model')
+    added = model.add_titles(new)
+    assert added.tolist() == list(range(40, 50))
+
+    expected = compute_neighbour_table(model.recommender.features, 5, normalize_rows=False)
+    np.testing.assert_allclose(model.table.scores, expected.scores, rtol=1e-5)
+
+
+def test_temporary_table_is_deleted_with_its_last_user():
+    model = IncrementalModel.build(library(20), k=3)
+    model.add_titles(library(5, first_id=21, seed=2))
+    path = model.table.path
+    assert path.exists()
+    del model
+    assert not path.exists()
@@ -0,0 +1,90 @@
+import csv
+
+import pytest
+
+from library_store import LibraryStore
+
+
+def rows(*games):
+    return [{'id': game_id, 'name': name, 'category': category, 'platforms': platforms, 'genres': ['Shooter']}
+            for game_id, name, category, platforms in games]
+
+
+@pytest.mark.parametrize('file_format', ['arrow', 'parquet'])
+def test_compact_multi_part(tmp_path, file_format):
+    store = LibraryStore(tmp_path, file_format)
+    store.append(rows((1, 'Halo', 'main_game', ['Xbox'])))
+    store.append(rows((2, 'Doom', 'main_game', ['PC', 'Linux'])))
+    store.append(rows((1, 'Halo: CE', 'remaster', ['PC'])))
+    store.compact()
+
+    assert len(store.parts) == 1
+    df = store.to_pandas().set_index('id')
+    assert df.loc[1, 'name'] == 'Halo: CE'
+    assert list(df.loc[1, 'platforms']) == ['PC']
+    assert list(df.loc[2, 'platforms']) == ['PC', 'Linux']
+    assert df.loc[2, 'category'] == 'main_game'
+
+
+def test_compact_twice(tmp_path):
+    store = LibraryStore(tmp_path)
+    store.append(rows((1, 'Halo', 'main_game', ['Xbox'])))
+    store.compact()
+    store.append(rows((2, 'Doom', 'main_game', ['PC'])))
+    store.compact()
+    assert sorted(store.ids()) == [1, 2]
+
+
+def write_csv(path, games):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, ['id', 'name', 'category', 'platforms'])
+        writer.writeheader()
+        for game_id, name, category, platforms in games:
+            writer.writerow({'id': game_id, 'name': name, 'category': category, 'platforms': repr(platforms)})
+
+
+def test_migrate_csvs(tmp_path):
+    write_csv(tmp_path / 'library.csv', [(1, 'Halo', 'main_game', ['Xbox']), (2, 'Doom', 'main_game', ['PC'])])
+    write_csv(tmp_path / 'new_data.csv', [(2, 'DOOM', 'remake', ['PC', 'Linux']), (3, 'Quake', 'main_game', [])])
+    store = LibraryStore.migrate_csvs([tmp_path / 'library.csv', tmp_path / 'new_data.csv'], tmp_path / 'store')
+
+    assert len(store.parts) == 1
+    df = store.to_pandas().set_index('id')
+    assert sorted(df.index) == [1, 2, 3]
+    # later csvs win
+    assert df.loc[2, 'name'] == 'DOOM'
+    assert list(df.loc[2, 'platforms']) == ['PC', 'Linux']
+
+
+def test_parts_ordered_across_formats(tmp_path):
+    LibraryStore(tmp_path, 'parquet').append(rows((1, 'Halo', 'main_game', ['Xbox'])))
+    store = LibraryStore(tmp_path, 'arrow')
+    store.append(rows((1, 'Halo: CE', 'remaster', ['PC'])))
+    LibraryStore(tmp_path, 'parquet').append(rows((2, 'Doom', 'main_game', ['PC'])))
+
+    assert [part.name for part in store.parts] == ['part-00000.parquet', 'part-00001.arrow', 'part-00002.parquet']
+    df = store.to_pandas().set_index('id')
+    assert df.loc[1, 'name'] == 'Halo: CE' and sorted(df.index) == [1, 2]
+
+
+def test_crash_during_compact_keeps_library(tmp_path, monkeypatch):
+    store = LibraryStore(tmp_path)
+    store.append(rows((1, 'Halo', 'main_game', ['Xbox'])))
+    store.append(rows((1, 'Halo: CE', 'remaster', ['PC']), (2, 'Doom', 'main_game', ['PC'])))
+    expected = store.to_pandas()
+
+    def crash(self, *args, **kwargs):
+        raise OSError('crashed before removing the old parts')
+
+    with monkeypatch.context() as m:
+        m.setattr(type(tmp_path), 'unlink', crash)
+        with pytest.raises(OSError):
+            store.compact()
+    # the compacted part was renamed into place as the newest, next to the old parts it replaces
+    assert len(store.parts) == 3 and not list(tmp_path.glob('*.tmp'))
+    assert store.to_pandas().sort_values('id').reset_index(drop=True).equals(
+        expected.sort_values('id').reset_index(drop=True))
+
+    store.compact()
+    assert len(store.parts) == 1
+    assert sorted(store.ids()) == [1, 2] and store.to_pandas().set_index('id').loc[1, 'name'] == 'Halo: CE'
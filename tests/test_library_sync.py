@@ -0,0 +1,154 @@
+import asyncio
+import copy
+import csv
+import shutil
+
+import pytest
+
+from data_pull import game_categories, parse_response
+from igdb_harvester import IGDBHarvester
+from igdb_stub_server import StubServer, load_records
+from library_sync import LibraryIndex, fetch_updated, format_updated_since_query, library_fields, sync_library, \
+    upsert_rows
+
+pulled_at = 1_700_000_000
+
+
+@pytest.fixture(scope='module')
+def all_records():
+    # the stub's records hold a few duplicate ids
+    records = {r['id']: r for r in load_records() if r.get('release_dates') and r['category'] in game_categories}
+    return list(records.values())
+
+
+@pytest.fixture
+def records(all_records):
+    records = copy.deepcopy(all_records[:60])
+    for record in records:
+        record['updated_at'] = pulled_at
+    return records
+
+
+def write_library(path, records):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, library_fields)
+        writer.writeheader()
+        writer.writerows(parse_response(record) for record in records)
+
+
+def read_library(path):
+    with open(path, encoding='utf-8', newline='') as f:
+        return list(csv.DictReader(f))
+
+
+def run(server, coroutine_f, *args, **kwargs):
+    async def go():
+        async with IGDBHarvester('client-id', 'token', base_url=server.url, rate=1000) as harvester:
+            return await coroutine_f(harvester, *args, **kwargs), harvester.num_requests
+    return asyncio.run(go())
+
+
+def test_upsert(tmp_path):
+    index = LibraryIndex(tmp_path / 'index.json')
+    assert index.upsert(1, 'halo', 100)
+    assert not index.upsert(1, 'halo', 100)
+    assert not index.upsert(1, 'halo', 50)
+    assert index.upsert(1, 'halo-ce', 200)
+    assert index.upsert(2, None, None)
+    assert 1 in index and 2 in index and 3 not in index
+    assert index.slugs == {'halo': 1, 'halo-ce': 1} and index.high_water_mark == 200
+
+    index.save()
+    loaded = LibraryIndex(tmp_path / 'index.json')
+    assert loaded.ids == {1: 200, 2: 0} and loaded.high_water_mark == 200
+
+
+def test_format_updated_since_query():
+    query = format_updated_since_query(1234, limit=50, offset=100).decode('utf-8')
+    assert 'updated_at > 1234' in query
+    assert f"category = ({','.join(map(str, game_categories))})" in query
+    assert 'sort updated_at asc;' in query and 'limit 50;' in query and 'offset 100;' in query
+    # no id list: games new to IGDB match too
+    assert 'id = (' not in query
+
+
+def test_from_library_seeds_pull_time(tmp_path, records):
+    write_library(tmp_path / 'library.csv', records[:10])
+    index = LibraryIndex.from_library([tmp_path / 'library.csv'], tmp_path / 'index.json', pulled_at=pulled_at)
+    assert len(index) == 10 and set(index.ids.values()) == {pulled_at} and index.high_water_mark == pulled_at
+
+
+def test_fetch_updated_pages(records):
+    for i, record in enumerate(records):
+        record['updated_at'] = pulled_at + i
+    with StubServer(records=records) as server:
+        bodies, num_requests = run(server, fetch_updated, pulled_at + 9, page_size=7)
+    assert [b['updated_at'] for b in bodies] == list(range(pulled_at + 10, pulled_at + len(records)))
+    assert num_requests == len(bodies) // 7 + 1
+
+
+def test_sync_library(tmp_path, records):
+    library, index_path = tmp_path / 'library.csv', tmp_path / 'index.json'
+    write_library(library, records[:40])
+    index = LibraryIndex.from_library([library], index_path, pulled_at=pulled_at)
+    index.save()
+
+    # five library games change, ten games appear that the library doesn't have, the rest stay as pulled
+    for record in records[:5]:
+        record['updated_at'], record['name'] = pulled_at + 10, record['name'] + ' (Remastered)'
+    for record in records[40:50]:
+        record['updated_at'] = pulled_at + 20
+
+    with StubServer(records=records) as server:
+        written, _ = run(server, sync_library, index, library)
+        assert written == 15
+        rows = read_library(library)
+        ids = [int(row['id']) for row in rows]
+        assert len(ids) == len(set(ids)) == 50
+        assert sum(row['name'].endswith('(Remastered)') for row in rows) == 5
+        assert index.high_water_mark == pulled_at + 20
+        assert LibraryIndex(index_path).high_water_mark == pulled_at + 20
+
+        # nothing changed since, so the next sync is a single empty page
+        written, num_requests = run(server, sync_library, index, library)
+        assert written == 0 and num_requests == 1
+
+
+def test_sync_is_idempotent_after_crash_before_index_save(tmp_path, records):
+    library, index_path = tmp_path / 'library.csv', tmp_path / 'index.json'
+    write_library(library, records[:40])
+    LibraryIndex.from_library([library], index_path, pulled_at=pulled_at).save()
+    shutil.copy(index_path, tmp_path / 'stale.json')
+    for record in records[:5] + records[40:45]:
+        record['updated_at'] = pulled_at + 10
+
+    with StubServer(records=records) as server:
+        run(server, sync_library, LibraryIndex(index_path), library)
+        # the csv was written but the index save was lost
+        shutil.copy(tmp_path / 'stale.json', index_path)
+        written, _ = run(server, sync_library, LibraryIndex(index_path), library)
+    ids = [int(row['id']) for row in read_library(library)]
+    assert written == 10 and len(ids) == len(set(ids)) == 45
+
+
+def test_existing_only(tmp_path, records):
+    library = tmp_path / 'library.csv'
+    write_library(library, records[:40])
+    index = LibraryIndex.from_library([library], tmp_path / 'index.json', pulled_at=pulled_at)
+    for record in records[:5] + records[40:45]:
+        record['updated_at'] = pulled_at + 10
+    with StubServer(records=records) as server:
+        written, _ = run(server, sync_library, index, library, new_games=False)
+    assert written == 5 and len(read_library(library)) == 40
+    assert index.high_water_mark == pulled_at + 10
+
+
+def test_upsert_rows_replaces_in_place(tmp_path, records):
+    library = tmp_path / 'library.csv'
+    write_library(library, records[:3])
+    index = LibraryIndex.from_library([library], tmp_path / 'index.json', pulled_at=pulled_at)
+    updated = dict(parse_response(records[1]), name='Renamed')
+    assert upsert_rows([updated], library, index, {updated['id']: pulled_at + 1}) == 1
+    assert [row['name'] for row in read_library(library)] == [records[0]['name'], 'Renamed', records[2]['name']]
+    # an older version doesn't replace it
+    assert upsert_rows([parse_response(records[1])], library, index, {records[1]['id']: pulled_at}) == 0
@@ -0,0 +1,39 @@
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from text_processing.nlp import PreprocessCache, preprocess_corpus, preprocess_text
+
+datasets = Path(__file__).parent.parent.joinpath('datasets')
+
+
+@pytest.fixture(scope='module')
+def texts():
+    summaries = pd.read_csv(datasets.joinpath('new_data.csv'), usecols=['summary'])['summary'].dropna()
+    # repeats, and a text with numbers and punctuation only
+    return list(summaries[:60]) + list(summaries[:5]) + ['1999, 2004... 42!']
+
+
+def test_matches_preprocess_text(texts):
+    expected = [preprocess_text(text) for text in texts]
+    assert preprocess_corpus(texts, n_jobs=2, chunk_size=16) == expected
+    assert preprocess_corpus(texts, stem_words=False) == [preprocess_text(text, stem_words=False) for text in texts]
+
+
+def test_second_run_reads_everything_from_cache(tmp_path, texts):
+    expected = [preprocess_text(text) for text in texts]
+    cache = PreprocessCache(tmp_path / 'preprocessed.sqlite')
+    assert preprocess_corpus(texts, n_jobs=2, chunk_size=16, cache=cache) == expected
+    assert cache.hits == 0 and cache.misses == len(texts)
+
+    assert preprocess_corpus(texts, n_jobs=2, chunk_size=16, cache=cache) == expected
+    assert cache.hits == len(texts) and cache.misses == len(texts)
+
+    # the options are part of the key, and a fresh connection sees what was written
+    reopened = PreprocessCache(tmp_path / 'preprocessed.sqlite')
+    unstemmed = preprocess_corpus(texts, stem_words=False, cache=reopened)
+    assert unstemmed == [preprocess_text(text, stem_words=False) for text in texts]
+    assert reopened.hits == 0
+    assert preprocess_corpus(texts[:3] + ['a new summary'], cache=reopened)[:3] == expected[:3]
+    assert reopened.hits == 3 and reopened.misses == len(texts) + 1
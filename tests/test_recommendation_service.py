@@ -0,0 +1,103 @@
+import asyncio
+
+import pandas as pd
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+from recommendation_service import RecommendationService, create_app
+
+games = [
+    ('Halo 3', ['Shooter'], ['Action', 'Science fiction'], ['Xbox 360'], ['Bungie']),
+    ('Halo 3: ODST', ['Shooter'], ['Action', 'Science fiction'], ['Xbox 360'], ['Bungie']),
+    ('Halo Reach', ['Shooter'], ['Action', 'Science fiction'], ['Xbox 360'], ['Bungie']),
+    ('Destiny', ['Shooter', 'RPG'], ['Action', 'Science fiction'], ['PlayStation 4', 'Xbox One'], ['Bungie']),
+    ('Final Fantasy VII', ['RPG'], ['Fantasy'], ['PlayStation'], ['Square']),
+    ('Final Fantasy VIII', ['RPG'], ['Fantasy'], ['PlayStation'], ['Square']),
+    ('Tetris', ['Puzzle'], [], ['Game Boy'], ['Nintendo']),
+    ('Dr. Mario', ['Puzzle'], [], ['NES', 'Game Boy'], ['Nintendo']),
+]
+
+
+@pytest.fixture
+def library():
+    return pd.DataFrame([{'id': 100 + i, 'name': name, 'slug': name.lower().replace(' ', '-'), 'genres': genres,
+                          'themes': themes, 'platforms': platforms, 'involved_companies': companies}
+                         for i, (name, genres, themes, platforms, companies) in enumerate(games)])
+
+
+def requests(library, *calls, **service_kwargs):
+    """Runs (method, path, kwargs) calls against the service app, returning (status, json body) for each"""
+    async def run():
+        service = RecommendationService(library, **service_kwargs)
+        async with TestClient(TestServer(create_app(service))) as client:
+            async def call(method, path, kwargs):
+                response = await client.request(method, path, **kwargs)
+                body = await response.json() if response.content_type == 'application/json' else await response.text()
+                return response.status, body
+            return await asyncio.gather(*(call(*c) for c in calls)), service
+
+    return asyncio.run(run())
+
+
+def test_recommend_post_and_get(library):
+    (post, get), _ = requests(library, ('POST', '/recommend', {'json': {'title': 'Halo 3', 'k': 3}}),
+                              ('GET', '/recommend', {'params': {'title': 'Halo 3', 'k': '3'}}))
+    assert post == get
+    status, body = post
+    assert status == 200 and body['title'] == 'Halo 3' and body['id'] == 100
+    names = [r['name'] for r in body['recommendations']]
+    assert len(names) == 3 and 'Halo 3' not in names
+    assert set(names[:2]) == {'Halo 3: ODST', 'Halo Reach'}
+
+
+def test_title_resolution_tolerates_variants(library):
+    ((status, body),), _ = requests(library, ('POST', '/recommend', {'json': {'title': 'final fantasy 7', 'k': 1}}))
+    assert status == 200 and body['title'] == 'Final Fantasy VII'
+    assert body['recommendations'][0]['name'] == 'Final Fantasy VIII'
+
+
+def test_weights(library):
+    ((status, body),), _ = requests(library, ('GET', '/recommend', {'params': {
+        'title': 'Destiny', 'k': 1, 'weights': '{"genres": 0, "themes": 0, "platforms": 0, "involved_companies": 1}'}}))
+    assert status == 200 and body['recommendations'][0]['name'].startswith('Halo')
+
+
+def test_unknown_title(library):
+    ((status, body),), service = requests(library, ('POST', '/recommend', {'json': {'title': 'Zzzzqqq', 'k': 3}}))
+    assert status == 404 and service.metrics.counters['not_found_total'] == 1
+
+
+@pytest.mark.parametrize('body', [
+    {'k': 3},
+    {'title': 'Halo 3', 'k': 'three'},
+    {'title': 'Halo 3', 'weights': [1]},
+    {'title': 'Halo 3', 'weights': '1'},
+    {'title': 'Halo 3', 'weights': 'not json'},
+    {'title': 'Halo 3', 'weights': {'genres': 'high'}},
+    {'title': 'Halo 3', 'weights': {'genres': True}},
+    {'title': 'Halo 3', 'weights': {'genres': -1}},
+    {'title': 'Halo 3', 'weights': {'colour': 1}},
+    [1, 2],
+])
+def test_bad_requests(library, body):
+    ((status, response),), _ = requests(library, ('POST', '/recommend', {'json': body}))
+    assert status == 400 and 'Bad request' in response['error']
+
+
+def test_concurrent_requests_are_batched_and_cached(library):
+    titles = [name for name, *_ in games] * 4
+    calls = [('POST', '/recommend', {'json': {'title': title, 'k': 2}}) for title in titles]
+    responses, service = requests(library, *calls, max_wait=0.05)
+    assert all(status == 200 for status, _ in responses)
+    for title, (_, body) in zip(titles, responses):
+        assert body['title'] == title and title not in [r['name'] for r in body['recommendations']]
+    counters = service.metrics.counters
+    assert counters['requests_total'] == len(titles)
+    assert counters['batched_queries_total'] + counters['cache_hits_total'] == len(titles)
+    assert counters['batches_total'] < counters['batched_queries_total']
+
+
+def test_health_and_metrics(library):
+    ((_, health), (status, metrics)), _ = requests(library, ('GET', '/health', {}), ('GET', '/metrics', {}))
+    assert health['status'] == 'ok' and health['games'] == len(games)
+    assert status == 200 and f"vgrm_games {len(games)}" in metrics
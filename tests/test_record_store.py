@@ -0,0 +1,43 @@
+import orjson
+import pytest
+
+from data_pull import parse_response
+from igdb_stub_server import load_records
+from record_store import RecordStore
+from response_parser import list_fields, parse_payloads
+
+
+@pytest.fixture(scope='module')
+def payloads():
+    records = load_records()[:200]
+    return [orjson.dumps(records[i:i + 50]) for i in range(0, len(records), 50)]
+
+
+def parsed_rows(payloads):
+    rows = [parse_response(body) for payload in payloads for body in orjson.loads(payload) if body.get('release_dates')]
+    # the store keeps a missing list field as an empty list
+    return [{k: [] if k in list_fields and v is None else v for k, v in row.items()} for row in rows]
+
+
+def test_records_match_parse_response(payloads):
+    store = RecordStore.from_payloads(payloads)
+    rows = parsed_rows(payloads)
+    assert [game.to_dict() for game in store] == rows
+    assert RecordStore.from_rows(parsed_rows(payloads)).to_arrow().equals(store.to_arrow())
+    assert store[-1].name == rows[-1]['name'] and store[0]['platforms'] == rows[0]['platforms']
+
+
+def test_to_arrow_matches_column_buffers(payloads):
+    store, buffers = RecordStore.from_payloads(payloads).to_arrow(), parse_payloads(payloads).to_arrow()
+    assert store.schema.names == buffers.schema.names
+    for name in store.schema.names:
+        assert store.column(name).to_pylist() == buffers.column(name).to_pylist(), name
+
+
+def test_interned_labels_are_stored_once(payloads):
+    store = RecordStore.from_payloads(payloads)
+    platforms = [label for game in store for label in game.platforms]
+    assert len(store.vocabularies['platforms']) == len(set(platforms)) < len(platforms)
+    matrix = store.indicator_matrix('platforms')
+    assert matrix.shape == (len(store), len(store.vocabularies['platforms']))
+    assert matrix.sum() == sum(len(set(game.platforms)) for game in store)
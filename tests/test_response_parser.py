@@ -0,0 +1,25 @@
+import orjson
+import pandas as pd
+
+from data_pull import parse_response
+from igdb_stub_server import load_records
+from response_parser import parse_payloads
+
+
+def test_matches_parse_response():
+    records = [r for r in load_records()[:100] if r.get('release_dates')]
+    df = parse_payloads([orjson.dumps(records[:50]), records[50:]]).to_pandas()
+    expected = pd.DataFrame([parse_response(body) for body in records])
+    assert list(df.columns) == list(expected.columns)
+    assert df['id'].tolist() == expected['id'].tolist()
+    assert df['category'].astype(object).tolist() == expected['category'].tolist()
+    assert [list(p) for p in df['platforms']] == [p or [] for p in expected['platforms']]
+
+
+def test_unknown_category_is_null():
+    base = {'release_dates': [{'y': 2020}], 'name': 'Game'}
+    games = [{'id': 1, 'category': 0}, {'id': 2, 'category': 15}, {'id': 3, 'category': 200}, {'id': 4},
+             {'id': 5, 'category': 14}]
+    table = parse_payloads([orjson.dumps([{**base, **game} for game in games])]).to_arrow()
+    table.validate(full=True)
+    assert table.column('category').to_pylist() == ['main_game', None, None, None, 'update']
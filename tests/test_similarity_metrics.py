@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+from scipy import sparse
+
+from text_processing.similarity_metrics import FusedRecommender, SimilarityRecommender, default_memory_budget
+
+
+def random_features(num_games, num_features, seed=0):
+    rng = np.random.default_rng(seed)
+    return sparse.random(num_games, num_features, density=0.2, format='csr', dtype=np.float32, random_state=rng) * 3
+
+
+def test_recommender_does_not_mutate_inputs():
+    features = random_features(50, 20)
+    original = features.copy()
+    recommender = SimilarityRecommender(features)
+    assert (features != original).nnz == 0
+
+    new = random_features(5, 25, seed=1)
+    new_original = new.copy()
+    recommender.append(new)
+    assert new.shape == new_original.shape
+    assert (new != new_original).nnz == 0
+    assert recommender.features.shape == (55, 25)
+
+
+def test_fused_recommender_does_not_mutate_inputs():
+    blocks = {'genres': random_features(40, 10), 'themes': random_features(40, 8, seed=2)}
+    originals = {name: block.copy() for name, block in blocks.items()}
+    recommender = FusedRecommender(blocks, weights={'genres': 2.0, 'themes': 1.0})
+    recommender.append({'genres': random_features(3, 12, seed=3), 'themes': random_features(3, 8, seed=4)})
+    for name, block in blocks.items():
+        assert (block != originals[name]).nnz == 0
+
+
+def test_recommend_matches_dense_cosine():
+    features = random_features(60, 30)
+    recommender = SimilarityRecommender(features)
+    dense = features.toarray()
+    unit = dense / np.maximum(np.linalg.norm(dense, axis=1, keepdims=True), 1e-12)
+    expected = unit @ unit[7]
+    indices, scores = recommender.recommend(7, 5, return_scores=True)
+    assert 7 not in indices
+    np.testing.assert_allclose(scores, np.sort(np.delete(expected, 7))[::-1][:5], rtol=1e-5)
+
+
+@pytest.mark.parametrize('memory_budget', [default_memory_budget, 4096])
+def test_recommend_batch_matches_loop(memory_budget):
+    recommender = SimilarityRecommender(random_features(80, 30))
+    targets = np.arange(0, 80, 3)
+    indices, scores = recommender.recommend_batch(targets, 5, memory_budget=memory_budget)
+    for row, target in enumerate(targets):
+        _, expected = recommender.recommend(int(target), 5, return_scores=True, exact=True)
+        np.testing.assert_allclose(scores[row], expected, rtol=1e-5)
+        assert target not in indices[row]
+
+
+def test_batch_blocks_count_feature_width(monkeypatch):
+    recommender = SimilarityRecommender(random_features(100, 5000))
+    block_rows = []
+    score_block = recommender._score_block
+    monkeypatch.setattr(recommender, '_score_block', lambda queries: block_rows.append(queries.shape[0])
+                        or score_block(queries))
+    memory_budget = 200 * 1024
+    recommender.recommend_batch(np.arange(100), 5, memory_budget=memory_budget)
+    dense_bytes = max(block_rows) * (5000 * 4 + 100 * 20)
+    assert dense_bytes <= memory_budget
+    assert sum(block_rows) == 100
@@ -0,0 +1,62 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer, TfidfVectorizer
+
+from text_processing.nlp import preprocess_corpus
+from text_processing.summary_features import SummaryVectorizer
+
+datasets = Path(__file__).parent.parent.joinpath('datasets')
+
+
+@pytest.fixture(scope='module')
+def summaries():
+    summaries = pd.read_csv(datasets.joinpath('new_data.csv'), usecols=['summary'])['summary']
+    # missing summaries are encoded as empty ones
+    return list(summaries[:200]) + [None, float('nan')]
+
+
+def assert_same(a, b):
+    assert a.shape == b.shape
+    np.testing.assert_allclose(a.toarray(), b.toarray(), rtol=1e-5, atol=1e-6)
+
+
+def test_fitted_matches_tfidf_vectorizer(summaries):
+    features = SummaryVectorizer('fitted').fit_transform(summaries)
+    texts = preprocess_corpus([s if isinstance(s, str) else '' for s in summaries])
+    expected = TfidfVectorizer(dtype=np.float32).fit_transform(texts)
+    assert features.format == 'csr' and features.dtype == np.float32
+    assert_same(features, expected)
+    assert features[-1].nnz == 0
+
+
+def test_hashing_matches_tfidf_over_hashed_counts(summaries):
+    vectorizer = SummaryVectorizer('hashing', n_features=2 ** 12)
+    features = vectorizer.fit_transform(summaries)
+    texts = preprocess_corpus([s if isinstance(s, str) else '' for s in summaries])
+    counts = HashingVectorizer(n_features=2 ** 12, alternate_sign=False, norm=None).transform(texts)
+    assert vectorizer.vocabulary_ is None and features.dtype == np.float32
+    assert_same(features, TfidfTransformer().fit_transform(counts))
+
+
+@pytest.mark.parametrize('mode', ['fitted', 'hashing'])
+def test_batches_and_saved_artifact(tmp_path, summaries, mode):
+    vectorizer = SummaryVectorizer(mode, n_features=2 ** 12, min_df=2).fit(summaries[:150])
+    new = summaries[150:]
+    features = vectorizer.transform(new)
+    assert_same(vectorizer.transform(new, batch_size=7), features)
+
+    vectorizer.save(tmp_path / 'summary.npz')
+    loaded = SummaryVectorizer.load(tmp_path / 'summary.npz')
+    assert loaded.num_columns == vectorizer.num_columns and loaded.idf_.dtype == np.float32
+    assert_same(loaded.transform(new), features)
+    assert loaded.transform([]).shape == (0, vectorizer.num_columns)
+
+
+def test_transform_before_fit_raises():
+    with pytest.raises(ValueError):
+        SummaryVectorizer().transform(['a summary'])
+    with pytest.raises(ValueError):
+        SummaryVectorizer('bag_of_words')
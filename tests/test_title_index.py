@@ -0,0 +1,40 @@
+import pytest
+
+from text_processing.title_index import TitleIndex
+
+
+@pytest.mark.parametrize('names', [['Halo 3: ODST', 'Halo 3'], ['Halo 3', 'Halo 3: ODST']])
+def test_full_name_beats_main_title(names):
+    index = TitleIndex(names)
+    assert names[index.resolve('Halo 3')] == 'Halo 3'
+    assert names[index.resolve('halo 3 odst')] == 'Halo 3: ODST'
+
+
+def test_main_title_resolves_when_no_full_name_matches():
+    index = TitleIndex(['Doom', 'The Legend of Zelda: Breath of the Wild'])
+    assert index.resolve('The Legend of Zelda') == 1
+
+
+def test_slug_beats_main_title():
+    index = TitleIndex(['Final Fantasy VII: Remake', 'FF7'], ['final-fantasy-vii-remake', 'final-fantasy-vii'])
+    assert index.resolve('Final Fantasy 7') == 1
+
+
+def test_roman_numerals_and_punctuation():
+    index = TitleIndex(['Final Fantasy VII', 'Grand Theft Auto: San Andreas'])
+    assert index.resolve('final-fantasy-7') == 0
+    assert index.resolve('Grand Theft Auto San Andreas') == 1
+
+
+def test_typo_falls_back_to_trigrams():
+    index = TitleIndex(['Super Mario Galaxy', 'Mario Kart 8'])
+    assert index.resolve('Super Mraio Galaxy', min_score=0.5) == 0
+    assert index.resolve('Completely Unrelated Title') is None
+
+
+def test_save_load_keeps_precedence(tmp_path):
+    names = ['Halo 3: ODST', 'Halo 3', 'Halo Wars']
+    TitleIndex(names).save(tmp_path / 'titles.npz')
+    index = TitleIndex.load(tmp_path / 'titles.npz')
+    assert index.resolve('Halo 3') == 1
+    assert index.search('Halo Wars', k=1)[0].tolist() == [2]
@@ -0,0 +1,122 @@
+from pathlib import Path
+
+import numpy as np
+from scipy import sparse
+
+from instrumentation import instrumented
+from text_processing.similarity_metrics import SimilarityRecommender, normalize, top_k
+
+
+# ///////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+# ///////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+class IVFIndex:
+    """Approximate nearest neighbour index (inverted file) over normalized game features, in plain numpy. Games are
+    clustered with spherical k-means; a query only scores the games in the `nprobe` clusters whose centroids are
+    closest to it. Raising nprobe trades latency for recall, nprobe = n_lists is exact \n
+    :param n_lists: number of clusters, defaults to 4 * sqrt(number of games)
+    :param nprobe: default number of clusters to search per query
+    :param n_iter: k-means iterations
+    :param max_train: k-means trains on a sample of at most this many games
+    :param seed: random seed for the k-means sample and initialisation
+
+    Usage:
+        index = IVFIndex().fit(recommender.features, normalize_rows=False)
+        recommender.ann_index = index
+    """
+
+    def __init__(self, n_lists: int | None = None, nprobe: int = 8, n_iter: int = 10, max_train: int = 50_000,
+                 seed: int = 0):
+        self.n_lists = n_lists
+        self.nprobe = nprobe
+        self.n_iter = n_iter
+        self.max_train = max_train
+        self.seed = seed
+        self.features = None
+        self.centroids = None
+        self.list_offsets = None
+        self.list_members = None
+
+    def __len__(self):
+        return self.features.shape[0]
+
+    def fit(self, features, normalize_rows: bool = True, block_size: int = 10_000) -> 'IVFIndex':
+        """Clusters the games and builds the inverted lists \n
+        :param features: one row per game
+        :param normalize_rows: L2 normalize the rows first. Pass False for rows that are already scaled the way they
+        should be scored, e.g. SimilarityRecommender/FusedRecommender.features"""
+        features = sparse.csr_matrix(features, dtype=np.float32)
+        self.features = normalize(features, norm='l2') if normalize_rows else features
+        num_games = self.features.shape[0]
+        n_lists = min(self.n_lists or int(4 * np.sqrt(num_games)), num_games)
+        rng = np.random.default_rng(self.seed)
+
+        sample = self.features[rng.choice(num_games, min(num_games, self.max_train), replace=False)]
+        centroids = sample[rng.choice(sample.shape[0], n_lists, replace=False)].toarray()
+        for _ in range(self.n_iter):
+            assignment = self._nearest_centroid(sample, centroids, block_size)
+            sums = (sparse.csr_matrix((np.ones(sample.shape[0], dtype=np.float32),
+                                       (assignment, np.arange(sample.shape[0]))),
+                                      shape=(n_lists, sample.shape[0])) @ sample).toarray()
+            # keep the old centroid for clusters that lost all their games
+            empty = ~sums.any(axis=1)
+            sums[empty] = centroids[empty]
+            centroids = normalize(sums, norm='l2')
+        self.centroids = centroids.astype(np.float32)
+
+        assignment = self._nearest_centroid(self.features, self.centroids, block_size)
+        self.list_members = np.argsort(assignment, kind='stable').astype(np.int32)
+        self.list_offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=n_lists))])
+        return self
+
+    @staticmethod
+    def _nearest_centroid(rows: sparse.csr_matrix, centroids: np.ndarray, block_size: int) -> np.ndarray:
+        # in blocks, so the rows x centroids score matrix stays small
+        return np.concatenate([np.asarray(rows[start:start + block_size] @ centroids.T).argmax(axis=1)
+                               for start in range(0, rows.shape[0], block_size)])
+
+    @instrumented('ann_search')
+    def search(self, query, k: int = 10, nprobe: int | None = None, exclude: int | None = None) -> tuple:
+        """Approximate top k games for a feature row, scored the same way as the rows passed to fit \n
+        :returns (indices, scores), best first"""
+        query = np.asarray(sparse.csr_matrix(query).todense()).ravel().astype(np.float32)
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        lists = top_k(self.centroids @ query, nprobe)
+        candidates = np.concatenate([self.list_members[self.list_offsets[i]:self.list_offsets[i + 1]]
+                                     for i in lists])
+        if exclude is not None:
+            candidates = candidates[candidates != exclude]
+        scores = self.features[candidates] @ query
+        best = top_k(scores, k)
+        return candidates[best], scores[best]
+
+    def recommend(self, target_game_index: int, N: int = 5, return_scores: bool = False, nprobe: int | None = None):
+        """Approximate top N most similar games to the target, most similar first"""
+        indices, scores = self.search(self.features[target_game_index], N, nprobe, exclude=target_game_index)
+        if return_scores:
+            return indices, scores
+        return indices
+
+    def save(self, path: str | Path):
+        np.savez(path, centroids=self.centroids, list_offsets=self.list_offsets, list_members=self.list_members,
+                 data=self.features.data, indices=self.features.indices, indptr=self.features.indptr,
+                 shape=np.array(self.features.shape), nprobe=self.nprobe)
+
+    @classmethod
+    def load(cls, path: str | Path) -> 'IVFIndex':
+        with np.load(path) as data:
+            index = cls(n_lists=len(data['centroids']), nprobe=int(data['nprobe']))
+            index.centroids = data['centroids']
+            index.list_offsets = data['list_offsets']
+            index.list_members = data['list_members']
+            index.features = sparse.csr_matrix((data['data'], data['indices'], data['indptr']),
+                                               shape=tuple(data['shape']))
+        return index
+
+
+def build_index(recommender: SimilarityRecommender, **index_kwargs) -> IVFIndex:
+    """Builds an IVFIndex over a recommender's (already normalized and weighted) features and plugs it in, so
+    recommender.recommend answers from the index"""
+    index = IVFIndex(**index_kwargs).fit(recommender.features, normalize_rows=False)
+    recommender.ann_index = index
+    return index
@@ -1,16 +1,10 @@
 import pandas as pd
 import numpy as np
 import re
-from pathlib import Path
-from os import listdir, getcwd
-from importlib import reload
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.preprocessing import MultiLabelBinarizer, OneHotEncoder, normalize
-from text_processing.similarity_metrics import recommend_similar_games, cosine_similarity
-from text_processing import nlp, similarity_metrics
 from collections import Counter
 from ast import literal_eval
-import matplotlib.pyplot as plt
+
+from instrumentation import instrumented
 
 platform_aliases = {
     "Legacy Mobile Device": "Mobile",
@@ -161,6 +155,7 @@ genre_map = {
 esrb_ratings = ["RP", "EC", "E", "E10", "T", "M", "AO"]
 
 
+@instrumented()
 def assign_platform_aliases(platform_str) -> str:
     if ',' in platform_str:
         platforms = platform_str.split(',')
@@ -173,6 +168,7 @@ def assign_platform_aliases(platform_str) -> str:
             return platform_str
 
 
+@instrumented()
 def assert_esrb_rating(age_ratings_str: str | None):
     if ',' in age_ratings_str:
         age_ratings_list = literal_eval(age_ratings_str)
@@ -196,6 +192,7 @@ def assert_esrb_rating(age_ratings_str: str | None):
             return age_ratings_map[rating]
 
 
+@instrumented()
 def map_genres(genre_str: str):
     if ',' in genre_str:
         genre_list = list(literal_eval(genre_str))
@@ -210,6 +207,121 @@ def map_genres(genre_str: str):
         return genre_map[genre_str]
 
 
+# ///////////////////////////////////////////// BATCH CLEANING ///////////////////////////////////////////////////////
+# //////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+# matches one quoted item in the python repr of a list of strings, e.g. "['Adventure', "Hack and slash/Beat 'em up"]"
+list_item_pattern = re.compile(r"'((?:[^'\\]|\\.)*)'|\"((?:[^\"\\]|\\.)*)\"")
+
+# lookups used by the batch pipeline, built once instead of per row
+esrb_rank = {rating: rank for rank, rating in enumerate(esrb_ratings)}
+no_rank = len(esrb_ratings)
+
+
+def _row_items(value) -> list:
+    if isinstance(value, str):
+        if not value.lstrip().startswith('['):
+            # comma separated, as assign_platform_aliases takes and clean_library returns
+            return value.split(',') if value else []
+        # one compiled regex pass per row, much cheaper than literal_eval
+        return [single or double.replace('\\"', '"') if double else single.replace("\\'", "'")
+                for single, double in list_item_pattern.findall(value)]
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return list(value)
+    return []
+
+
+def explode_list_column(col: pd.Series) -> tuple:
+    """Flattens a column of lists into a single array of values plus row offsets, so that row i's values are
+    values[offsets[i]:offsets[i + 1]]. Entries can be python lists/arrays (e.g. from library_store) or python reprs of
+    lists (from the library csvs) or comma separated strings; anything else counts as an empty list"""
+    rows = [_row_items(value) for value in col]
+    offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum([len(row) for row in rows], out=offsets[1:])
+    values = np.array([item for row in rows for item in row], dtype=object)
+    return values, offsets
+
+
+def _map_values(values: np.ndarray, mapper) -> np.ndarray:
+    # map each distinct value once through its factorized code, rather than once per occurrence
+    codes, uniques = pd.factorize(values)
+    lookup = np.array([mapper(value) for value in uniques] + [None], dtype=object)
+    return lookup[codes]
+
+
+def _join_rows(values: np.ndarray, offsets: np.ndarray) -> list:
+    values = values.tolist()
+    return [','.join(values[start:stop]) for start, stop in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+
+
+@instrumented()
+def batch_assign_platform_aliases(col: pd.Series) -> pd.Series:
+    """Batch version of assign_platform_aliases. Strings are split on commas just as assign_platform_aliases splits
+    them, list reprs included, so string rows give the same output row for row; lists (e.g. from library_store) are
+    mapped item by item, and empty or missing rows become NaN"""
+    col = col.map(lambda value: value.split(',') if isinstance(value, str) else value)
+    values, offsets = explode_list_column(col)
+    mapped = _map_values(values, lambda platform: platform_aliases.get(platform, platform))
+    result = pd.Series(_join_rows(mapped, offsets), index=col.index, dtype=object)
+    result[np.diff(offsets) == 0] = np.nan
+    return result
+
+
+@instrumented()
+def batch_assert_esrb_rating(col: pd.Series) -> pd.Series:
+    """Batch version of assert_esrb_rating, for a column of age rating lists. Matches assert_esrb_rating row for row,
+    including its fallback to 'AO' for rows with several ratings but no ESRB one"""
+    values, offsets = explode_list_column(col)
+    codes, uniques = pd.factorize(values)
+    counts = np.diff(offsets)
+    rows = np.repeat(np.arange(len(col)), counts)
+
+    # rank of each distinct rating among the ESRB ratings, and how a lone rating maps onto them
+    rank_lookup = np.array([esrb_rank.get(r, no_rank) for r in uniques], dtype=np.int64)
+    single_lookup = np.array([r if r in esrb_rank else age_ratings_map.get(r) for r in uniques] + [None],
+                             dtype=object)
+
+    best_rank = np.full(len(col), no_rank, dtype=np.int64)
+    np.minimum.at(best_rank, rows, rank_lookup[codes])
+
+    result = np.full(len(col), np.nan, dtype=object)
+    several = counts > 1
+    result[several] = np.array(esrb_ratings + ['AO'], dtype=object)[best_rank[several]]
+    single = counts == 1
+    result[single] = single_lookup[codes[offsets[:-1][single]]]
+    return pd.Series(result, index=col.index, dtype=object)
+
+
+@instrumented()
+def batch_map_genres(col: pd.Series) -> pd.Series:
+    """Batch version of map_genres, for a column of genre lists. Genres missing from genre_map are dropped, as
+    map_genres does for rows with several genres; rows whose only genre is unknown become NaN rather than raising"""
+    values, offsets = explode_list_column(col)
+    mapped = _map_values(values, genre_map.get)
+    counts = np.diff(offsets)
+
+    # drop unknown genres, and shift the offsets to match
+    known = pd.notna(mapped)
+    rows = np.repeat(np.arange(len(col)), counts)
+    known_offsets = np.zeros_like(offsets)
+    np.cumsum(np.bincount(rows[known], minlength=len(col)), out=known_offsets[1:])
+    result = np.array(_join_rows(mapped[known], known_offsets), dtype=object)
+    result[(counts == 0) | ((counts == 1) & (np.diff(known_offsets) == 0))] = np.nan
+    return pd.Series(result, index=col.index, dtype=object)
+
+
+@instrumented()
+def clean_library(df: pd.DataFrame, platforms_col: str = 'platforms', age_ratings_col: str = 'age_ratings',
+                  genres_col: str = 'genres') -> pd.DataFrame:
+    """Cleans platforms, age ratings and genres for the whole library in one pass per column, equivalent to applying
+    assign_platform_aliases, assert_esrb_rating and map_genres row by row. Returns a cleaned copy of df"""
+    cleaned = df.copy()
+    cleaned[platforms_col] = batch_assign_platform_aliases(df[platforms_col])
+    cleaned[age_ratings_col] = batch_assert_esrb_rating(df[age_ratings_col])
+    cleaned[genres_col] = batch_map_genres(df[genres_col])
+    return cleaned
+
+
 def get_unique_companies(df: pd.DataFrame, col_name: str):
     companies = []
     for company_str in df[col_name].tolist():
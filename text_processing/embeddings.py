@@ -0,0 +1,126 @@
+"""Dense low-dimensional game embeddings.
+
+The stacked genre/theme/platform/company/summary features are tens of thousands of columns wide. Randomized truncated
+SVD projects them onto their top n_components singular directions: row i of the embeddings is the game's coordinates
+in that basis, and the dot product of two embedded rows approximates the dot product of the full rows, i.e. the
+(weighted) cosine similarity the recommenders score with. The embeddings are saved as a float32 .npy and memory-mapped
+on load, so processes serving recommendations share one copy through the page cache.
+
+    embedding = build_embedding(recommender, n_components=256, path=datasets.joinpath('embedding'))
+    recommender.recommend(target_game_index)    # answered from the embedding, like an ann_index
+    ...
+    recommender.ann_index = SVDEmbedding.open(datasets.joinpath('embedding'))
+"""
+from pathlib import Path
+
+import numpy as np
+from scipy import sparse
+
+from instrumentation import instrumented
+from text_processing.similarity_metrics import SimilarityRecommender, batch_top_k, default_memory_budget, top_k
+
+
+# ///////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+class SVDEmbedding:
+    """Truncated SVD of a games x features matrix, scored by dot product in the reduced space \n
+    :param n_components: embedding dimensions
+    :param n_iter: power iterations of the randomized range finder; more is slower but closer to the exact SVD
+    :param seed: random seed for the range finder
+
+    Has the same recommend/search methods as ann.IVFIndex, so it can be set as a recommender's ann_index.
+    """
+
+    def __init__(self, n_components: int = 256, n_iter: int = 5, seed: int = 0):
+        self.n_components = n_components
+        self.n_iter = n_iter
+        self.seed = seed
+        self.embeddings: np.ndarray | None = None
+        self.components: np.ndarray | None = None
+        self.path: Path | None = None
+
+    def __len__(self):
+        return self.embeddings.shape[0]
+
+    def fit(self, features, path: str | Path | None = None) -> 'SVDEmbedding':
+        """Computes the embeddings of the rows as they are (no normalization), so pass rows scaled the way they
+        should be scored, e.g. SimilarityRecommender/FusedRecommender.features \n
+        :param path: directory to write the embeddings to as memory-mapped .npy files, None to keep them in memory"""
+        from sklearn.utils.extmath import randomized_svd
+
+        features = sparse.csr_matrix(features, dtype=np.float32)
+        n_components = min(self.n_components, *features.shape)
+        u, s, vt = randomized_svd(features, n_components, n_iter=self.n_iter, random_state=self.seed)
+        self.components = vt.astype(np.float32)
+        embeddings = (u * s).astype(np.float32)
+        if path is None:
+            self.embeddings = embeddings
+            return self
+
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.embeddings = np.lib.format.open_memmap(self.path.joinpath('embeddings.npy'), mode='w+',
+                                                    dtype=np.float32, shape=embeddings.shape)
+        self.embeddings[:] = embeddings
+        self.embeddings.flush()
+        np.save(self.path.joinpath('components.npy'), self.components)
+        return self
+
+    def transform(self, features) -> np.ndarray:
+        """Embeds feature rows (e.g. of games that weren't in the fitted library), scaled as the fitted rows were"""
+        return np.asarray(sparse.csr_matrix(features, dtype=np.float32) @ self.components.T, dtype=np.float32)
+
+    @classmethod
+    def open(cls, path: str | Path, mode: str = 'r') -> 'SVDEmbedding':
+        """Memory-maps saved embeddings; pages are only read from disk as they are scored"""
+        path = Path(path)
+        embedding = cls()
+        embedding.embeddings = np.load(path.joinpath('embeddings.npy'), mmap_mode=mode)
+        embedding.components = np.load(path.joinpath('components.npy'))
+        embedding.n_components = embedding.embeddings.shape[1]
+        embedding.path = path
+        return embedding
+
+    # ////////////////////////////////////////// SCORING //////////////////////////////////////////
+
+    def score_rows(self, queries: np.ndarray) -> np.ndarray:
+        """Scores embedded query rows against every game \n
+        :returns a dense (num queries, num games) array"""
+        return np.atleast_2d(queries) @ self.embeddings.T
+
+    @instrumented('embedding_search')
+    def search(self, query: np.ndarray, k: int = 10, exclude: int | None = None) -> tuple:
+        """Top k games for an embedded query row \n
+        :returns (indices, scores), best first"""
+        scores = self.embeddings @ np.asarray(query, dtype=np.float32).ravel()
+        indices = top_k(scores, k, exclude=exclude)
+        return indices, scores[indices]
+
+    def recommend(self, target_game_index: int, N: int = 5, return_scores: bool = False):
+        """Top N most similar games to the target in the embedding, most similar first"""
+        indices, scores = self.search(self.embeddings[target_game_index], N, exclude=target_game_index)
+        if return_scores:
+            return indices, scores
+        return indices
+
+    @instrumented('embedding_recommend_batch')
+    def recommend_batch(self, targets, N: int = 5, n_jobs: int = 1, block_size: int | None = None,
+                        memory_budget: int = default_memory_budget) -> tuple:
+        """Top N most similar games in the embedding for each of many targets, see similarity_metrics.batch_top_k \n
+        :returns (indices, scores), each (len(targets), N), most similar first"""
+        return batch_top_k(lambda block: self.score_rows(self.embeddings[block]), targets, N, len(self), block_size,
+                           n_jobs, memory_budget, num_features=self.embeddings.shape[1])
+
+    def memory_usage(self) -> int:
+        """Bytes of the embeddings and components (mapped or in memory)"""
+        return self.embeddings.nbytes + self.components.nbytes
+
+
+def build_embedding(recommender: SimilarityRecommender, n_components: int = 256, path: str | Path | None = None,
+                    **embedding_kwargs) -> SVDEmbedding:
+    """Embeds a recommender's (already normalized and weighted) features and plugs the embedding in as its ann_index,
+    so recommender.recommend answers from it. Like any ann_index it is dropped when the weights change or games are
+    appended"""
+    embedding = SVDEmbedding(n_components, **embedding_kwargs).fit(recommender.features, path)
+    recommender.ann_index = embedding
+    return embedding
@@ -0,0 +1,130 @@
+import json
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from text_processing.dataset_clean import explode_list_column
+
+# list columns of the library that get a multi-label encoding
+multilabel_fields = ['genres', 'themes', 'platforms', 'involved_companies']
+
+
+# ///////////////////////////////////////////// FEATURE ENCODING ///////////////////////////////////////////////////////
+# //////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+class MultiLabelEncoder:
+    """Sparse replacement for nlp.one_hot_encode/multilabel_encode. Builds a CSR indicator matrix (one row per game,
+    one column per label) in a single pass over the exploded labels, against a fitted vocabulary that can be saved,
+    reloaded and applied to new titles without refitting \n
+    :param sep: separator for columns of joined strings (e.g. ',' for cleaned genres "Adventure,RPG"). None means
+    entries are lists/arrays or python reprs of lists, as in the library csvs
+    :param min_count: labels seen in fewer games than this are left out of the vocabulary. Useful for the long tail
+    of involved_companies and tags
+    :param dtype: dtype of the matrix; float32 can go straight into similarity products
+    """
+
+    def __init__(self, sep: str | None = None, min_count: int = 1, dtype=np.float32):
+        self.sep = sep
+        self.min_count = min_count
+        self.dtype = np.dtype(dtype)
+        self.labels_: List[str] = []
+        self._index = pd.Index([], dtype=object)
+
+    @property
+    def vocabulary_(self) -> Dict[str, int]:
+        return {label: i for i, label in enumerate(self.labels_)}
+
+    def _explode(self, col: pd.Series) -> tuple:
+        if self.sep is not None:
+            col = col.map(lambda x: x.split(self.sep) if isinstance(x, str) and x else [])
+        return explode_list_column(col)
+
+    def fit(self, col: pd.Series) -> 'MultiLabelEncoder':
+        values, offsets = self._explode(col)
+        rows = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+        # count each label once per game
+        pairs = pd.DataFrame({'row': rows, 'label': values}).drop_duplicates()
+        counts = pairs['label'].value_counts()
+        self._set_labels(sorted(counts.index[counts >= self.min_count]))
+        return self
+
+    def partial_fit(self, col: pd.Series) -> List[str]:
+        """Grows the vocabulary in place with labels from new games that it doesn't have yet. New labels are added at
+        the end, in order of first appearance, so existing columns keep their positions and matrices encoded before
+        only need zero columns appended. min_count applies to counts within col \n
+        :returns the labels that were added"""
+        values, offsets = self._explode(col)
+        if not len(values):
+            return []
+        rows = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+        pairs = pd.DataFrame({'row': rows, 'label': values}).drop_duplicates()
+        counts = pairs['label'].value_counts(sort=False)
+        candidates = pd.unique(pairs['label'])
+        new_labels = [label for label in candidates[self._index.get_indexer(candidates) < 0]
+                      if counts[label] >= self.min_count]
+        if new_labels:
+            self._set_labels(self.labels_ + new_labels)
+        return new_labels
+
+    def _set_labels(self, labels: List[str]):
+        self.labels_ = list(labels)
+        self._index = pd.Index(self.labels_, dtype=object)
+
+    def transform(self, col: pd.Series) -> sparse.csr_matrix:
+        """Encodes a column against the fitted vocabulary; labels outside it are ignored"""
+        values, offsets = self._explode(col)
+        columns = self._index.get_indexer(values) if len(values) else np.array([], dtype=np.intp)
+        known = columns >= 0
+
+        # offsets of the known labels only
+        rows = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+        indptr = np.zeros(len(offsets), dtype=np.int64)
+        np.cumsum(np.bincount(rows[known], minlength=len(offsets) - 1), out=indptr[1:])
+
+        data = np.ones(int(known.sum()), dtype=self.dtype)
+        matrix = sparse.csr_matrix((data, columns[known], indptr), shape=(len(offsets) - 1, len(self.labels_)))
+        # a label listed twice for the same game still only counts once
+        matrix.sum_duplicates()
+        matrix.data[:] = 1
+        return matrix
+
+    def fit_transform(self, col: pd.Series) -> sparse.csr_matrix:
+        return self.fit(col).transform(col)
+
+    def to_frame(self, matrix: sparse.spmatrix, index=None) -> pd.DataFrame:
+        """Sparse DataFrame view of an encoded matrix, with the same layout as nlp.one_hot_encode"""
+        frame = pd.DataFrame.sparse.from_spmatrix(matrix, index=index, columns=self.labels_)
+        # newer pandas fill the gaps of a float matrix with nan; one_hot_encode has 0 there
+        return frame.astype(pd.SparseDtype(self.dtype, 0))
+
+    def save(self, path: str | Path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'sep': self.sep, 'min_count': self.min_count, 'dtype': self.dtype.name,
+                       'labels': self.labels_}, f)
+
+    @classmethod
+    def load(cls, path: str | Path) -> 'MultiLabelEncoder':
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        encoder = cls(data['sep'], data['min_count'], data['dtype'])
+        encoder._set_labels(data['labels'])
+        return encoder
+
+
+def fit_encoders(df: pd.DataFrame, fields: List[str] = None, **encoder_kwargs) -> Dict[str, MultiLabelEncoder]:
+    """Fits a MultiLabelEncoder per field, see multilabel_fields"""
+    return {field: MultiLabelEncoder(**encoder_kwargs).fit(df[field]) for field in (fields or multilabel_fields)}
+
+
+def save_encoders(encoders: Dict[str, MultiLabelEncoder], directory: str | Path):
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    for field, encoder in encoders.items():
+        encoder.save(directory.joinpath(f"{field}.json"))
+
+
+def load_encoders(directory: str | Path) -> Dict[str, MultiLabelEncoder]:
+    return {path.stem: MultiLabelEncoder.load(path) for path in sorted(Path(directory).glob('*.json'))}
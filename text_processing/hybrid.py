@@ -0,0 +1,208 @@
+"""Hybrid recommendations: content similarity blended with IGDB's similar_games graph and a popularity prior.
+
+similar_games lists are resolved against the library's names into a CSR adjacency (int32 indices), symmetrized, so
+"X lists Y as similar" links both ways. A query runs a few steps of personalized PageRank from the target: each step
+spreads the walk's mass from the nodes holding it to their neighbours and sends a share back to the target. The walk
+starts on a single node, so each step only gathers the neighbour lists of the nodes it has reached so far, and its cost
+follows the target's neighbourhood rather than the size of the graph.
+
+    graph = SimilarGamesGraph.from_library(df['name'], df['similar_games'])
+    hybrid = HybridRecommender(recommender, graph, df['rating_count'])
+    indices, scores = hybrid.recommend(target_game_index, N=10, return_scores=True)
+"""
+from pathlib import Path
+from typing import Dict, Iterable
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from instrumentation import instrumented
+from text_processing.similarity_metrics import SimilarityRecommender, top_k
+
+default_hybrid_weights = {'content': 0.6, 'graph': 0.3, 'popularity': 0.1}
+
+
+# ///////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+def _gather_rows(indptr: np.ndarray, rows: np.ndarray) -> tuple:
+    # positions of every entry in the given CSR rows, and which of the rows each belongs to, without a python loop
+    starts, lengths = indptr[rows], indptr[rows + 1] - indptr[rows]
+    total = int(lengths.sum())
+    owner = np.repeat(np.arange(len(rows)), lengths)
+    positions = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths) + starts[owner]
+    return positions, owner
+
+
+class SimilarGamesGraph:
+    """Undirected graph of the library's similar_games links, as a CSR adjacency over game indices \n
+    :param adjacency: (num games, num games) sparse matrix; any non-zero entry is an edge
+    """
+
+    def __init__(self, adjacency: sparse.csr_matrix):
+        adjacency = sparse.csr_matrix(adjacency)
+        adjacency.setdiag(0)
+        adjacency.eliminate_zeros()
+        self.indptr = adjacency.indptr.astype(np.int32)
+        self.indices = adjacency.indices.astype(np.int32)
+        self.degree = np.diff(self.indptr)
+        self._matrix = None
+
+    def __len__(self):
+        return len(self.degree)
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.indices) // 2
+
+    def neighbours(self, game_index: int) -> np.ndarray:
+        return self.indices[self.indptr[game_index]:self.indptr[game_index + 1]]
+
+    @classmethod
+    def from_library(cls, names: Iterable[str], similar_games: Iterable) -> 'SimilarGamesGraph':
+        """Resolves each game's similar_games names to library indices. A name shared by several games resolves to
+        the first of them; names that exactly match no game are retried by their normalized form (see
+        title_index.normalize_title), and dropped if that misses too \n
+        :param names: the library's game names, in row order
+        :param similar_games: each game's similar_games, as lists/arrays or the csvs' python reprs of lists"""
+        from text_processing.dataset_clean import explode_list_column
+        from text_processing.title_index import normalize_title
+
+        names = pd.Series(list(names), dtype=object)
+        values, offsets = explode_list_column(pd.Series(list(similar_games), dtype=object))
+        first = ~names.duplicated(keep='first').to_numpy()
+        exact = pd.Index(names[first])
+        targets = np.flatnonzero(first)[np.maximum(exact.get_indexer(values), 0)]
+        targets[exact.get_indexer(values) < 0] = -1
+
+        missing = np.flatnonzero(targets < 0)
+        if len(missing):
+            keys = names.fillna('').map(normalize_title)
+            first_key = ~keys.duplicated(keep='first').to_numpy()
+            normalized = pd.Index(keys[first_key])
+            found = normalized.get_indexer([normalize_title(str(value)) for value in values[missing]])
+            targets[missing[found >= 0]] = np.flatnonzero(first_key)[found[found >= 0]]
+
+        sources = np.repeat(np.arange(len(names)), np.diff(offsets))
+        resolved = targets >= 0
+        edges = sparse.csr_matrix((np.ones(resolved.sum(), dtype=np.float32), (sources[resolved], targets[resolved])),
+                                  shape=(len(names), len(names)))
+        return cls(edges + edges.T)
+
+    def save(self, path: str | Path):
+        np.savez(path, indptr=self.indptr, indices=self.indices)
+
+    @classmethod
+    def load(cls, path: str | Path) -> 'SimilarGamesGraph':
+        with np.load(path) as data:
+            graph = cls.__new__(cls)
+            graph.indptr, graph.indices = data['indptr'], data['indices']
+            graph.degree = np.diff(graph.indptr)
+            graph._matrix = None
+        return graph
+
+    def _adjacency(self) -> sparse.csr_matrix:
+        if self._matrix is None:
+            self._matrix = sparse.csr_matrix((np.ones(len(self.indices), dtype=np.float32), self.indices, self.indptr),
+                                             shape=(len(self), len(self)))
+        return self._matrix
+
+    @instrumented('personalized_pagerank')
+    def personalized_pagerank(self, target_game_index: int, restart: float = 0.3, steps: int = 3) -> np.ndarray:
+        """Visit probabilities of a random walk that starts at the target and jumps back to it with probability
+        `restart` at each step, after `steps` steps. Walks reaching a game with no links also go back to the target.
+        Steps gather only the neighbour lists of the games the walk has reached, until those cover a good part of
+        the graph; from then on a step is one mat-vec over the whole adjacency
+        :returns a dense (num games,) array summing to 1"""
+        scores = np.zeros(len(self))
+        scores[target_game_index] = 1.0
+        for _ in range(steps):
+            active = np.flatnonzero(scores)
+            degree = self.degree[active]
+            linked = degree > 0
+            if degree.sum() > len(self.indices) // 4:
+                # the graph is symmetric, so spreading along out-links is a product with the adjacency itself
+                share = np.divide(scores, self.degree, out=np.zeros(len(self)), where=self.degree > 0)
+                spread = (1 - restart) * (self._adjacency() @ share)
+            else:
+                positions, owner = _gather_rows(self.indptr, active[linked])
+                share = (1 - restart) * scores[active[linked]] / degree[linked]
+                spread = np.bincount(self.indices[positions], weights=share[owner], minlength=len(self))
+            # restarts, plus the mass of walks stuck on games without links
+            spread[target_game_index] += restart * scores[active[linked]].sum() + scores[active[~linked]].sum()
+            scores = spread
+        return scores
+
+
+def popularity_prior(rating_count) -> np.ndarray:
+    """log(1 + rating_count), scaled to [0, 1]; missing counts count as 0"""
+    counts = np.log1p(np.nan_to_num(np.asarray(rating_count, dtype=np.float64), nan=0.0).clip(min=0))
+    return (counts / counts.max() if counts.max() > 0 else counts).astype(np.float32)
+
+
+class HybridRecommender:
+    """Blends content similarity, personalized PageRank over the similar_games graph and a popularity prior \n
+    :param recommender: a SimilarityRecommender/FusedRecommender over the same games, in the same order as the graph
+    :param graph: see SimilarGamesGraph.from_library
+    :param rating_count: each game's rating_count, for the popularity prior
+    :param weights: 'content', 'graph' and 'popularity' -> weight
+    :param restart: restart probability of the walk, see SimilarGamesGraph.personalized_pagerank
+    :param steps: walk steps; each step reaches one link further from the target
+
+    A game's score is content_weight * cosine + graph_weight * walk score (scaled so the best game other than the
+    target scores 1) + popularity_weight * prior. The prior only counts for games the content or the graph relates to
+    the target, so it breaks ties between related games rather than pushing popular unrelated ones in.
+    """
+
+    def __init__(self, recommender: SimilarityRecommender, graph: SimilarGamesGraph, rating_count,
+                 weights: Dict[str, float] | None = None, restart: float = 0.3, steps: int = 3):
+        if len(recommender) != len(graph):
+            raise ValueError(f"The recommender has {len(recommender)} games but the graph has {len(graph)}.")
+        self.recommender = recommender
+        self.graph = graph
+        self.prior = popularity_prior(rating_count)
+        self.restart = restart
+        self.steps = steps
+        self.set_weights(weights or default_hybrid_weights)
+
+    def __len__(self):
+        return len(self.graph)
+
+    def set_weights(self, weights: Dict[str, float]):
+        unknown = set(weights) - set(default_hybrid_weights)
+        if unknown:
+            raise ValueError(f"Invalid weight name(s) {sorted(unknown)}, expected some of "
+                             f"{list(default_hybrid_weights)}.")
+        self.weights = {name: float(weights.get(name, 0.0)) for name in default_hybrid_weights}
+
+    def graph_scores(self, target_game_index: int) -> np.ndarray:
+        scores = self.graph.personalized_pagerank(target_game_index, self.restart, self.steps)
+        scores[target_game_index] = 0
+        best = scores.max()
+        return scores / best if best > 0 else scores
+
+    def scores(self, target_game_index: int) -> np.ndarray:
+        """Blended score of every game for the target"""
+        blended = np.zeros(len(self))
+        related = np.zeros(len(self), dtype=bool)
+        if self.weights['content']:
+            content = self.recommender.scores(target_game_index)
+            blended += self.weights['content'] * content
+            related |= content > 0
+        if self.weights['graph']:
+            walk = self.graph_scores(target_game_index)
+            blended += self.weights['graph'] * walk
+            related |= walk > 0
+        if self.weights['popularity']:
+            # multiplying by the mask is several times faster than boolean indexing when most games are related
+            blended += self.weights['popularity'] * self.prior * related
+        return blended
+
+    @instrumented('hybrid_recommend')
+    def recommend(self, target_game_index: int, N: int = 5, return_scores: bool = False):
+        """Top N games for the target by blended score, best first"""
+        scores = self.scores(target_game_index)
+        indices = top_k(scores, N, exclude=target_game_index)
+        if return_scores:
+            return indices, scores[indices]
+        return indices
@@ -0,0 +1,119 @@
+"""Adds newly harvested games to a fitted model without refitting it.
+
+New rows are encoded against the frozen vocabularies, which grow in place when a game brings an unseen genre, theme,
+platform or company. The encoded rows are appended to the recommender's stored features, and only the neighbour
+lists that the new games actually change are rewritten.
+
+    model = IncrementalModel.build(library_df, neighbours_path=datasets.joinpath('neighbours'))
+    model.save(datasets.joinpath('model'))
+    ...
+    model = IncrementalModel.load(datasets.joinpath('model'))
+    model.add_titles(new_rows)          # e.g. the rows passed to library_sync.upsert_rows
+    model.save(datasets.joinpath('model'))
+"""
+import json
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from text_processing.encoders import MultiLabelEncoder, load_encoders, multilabel_fields, save_encoders
+from text_processing.neighbours import NeighbourTable, compute_neighbour_table, update_neighbour_table
+from text_processing.similarity_metrics import FusedRecommender
+
+
+# ///////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+class IncrementalModel:
+    """Encoders, recommender and (optionally) precomputed neighbour table for a library, kept in step as games are
+    added \n
+    :param encoders: field -> fitted MultiLabelEncoder, one feature block each
+    :param recommender: a FusedRecommender over the encoders' blocks, in the same order
+    :param ids: IGDB ids of the games, in row order
+    :param table: top k neighbours for every game, see neighbours.compute_neighbour_table
+    """
+
+    def __init__(self, encoders: Dict[str, MultiLabelEncoder], recommender: FusedRecommender, ids: List[int],
+                 table: NeighbourTable | None = None):
+        self.encoders = encoders
+        self.recommender = recommender
+        self.ids = list(ids)
+        self.table = table
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, df: pd.DataFrame, fields: List[str] | None = None, weights: Dict[str, float] | None = None,
+              k: int | None = 10, neighbours_path: str | Path | None = None, **table_kwargs) -> 'IncrementalModel':
+        """Fits everything from scratch \n
+        :param k: neighbours to precompute per game, None to skip the neighbour table"""
+        fields = fields or multilabel_fields
+        encoders = {field: MultiLabelEncoder().fit(df[field]) for field in fields}
+        recommender = FusedRecommender({field: encoders[field].transform(df[field]) for field in fields}, weights)
+        table = None
+        if k is not None:
+            table = compute_neighbour_table(recommender.features, k, neighbours_path, normalize_rows=False,
+                                            **table_kwargs)
+        return cls(encoders, recommender, df['id'].tolist(), table)
+
+    def add_titles(self, rows: pd.DataFrame | List[dict]) -> np.ndarray:
+        """Appends new games (parsed rows or a DataFrame with the encoders' fields) to the model. Games already in it
+        are skipped; use a rebuild to pick up changes to existing games \n
+        :returns the row indices of the added games"""
+        df = pd.DataFrame(rows) if not isinstance(rows, pd.DataFrame) else rows
+        known = set(self.ids)
+        df = df[~df['id'].isin(known)].drop_duplicates(subset=['id'], keep='last')
+        if df.empty:
+            return np.array([], dtype=np.int64)
+
+        blocks = {}
+        for field, encoder in self.encoders.items():
+            encoder.partial_fit(df[field])
+            blocks[field] = encoder.transform(df[field])
+        start = len(self)
+        self.recommender.append(blocks)
+        self.ids.extend(df['id'].tolist())
+        new_rows = np.arange(start, len(self))
+        if self.table is not None:
+            self.table = update_neighbour_table(self.table, self.recommender.features, new_rows, normalize_rows=False)
+        return new_rows
+
+    def save(self, directory: str | Path):
+        """Writes encoders, stored (unweighted) feature blocks, weights and ids. The neighbour table is a memory-mapped
+        directory of its own: one written to a path of the caller's choosing is only referenced by that path, while an
+        in-memory or temporary table is copied to directory/neighbours"""
+        directory = Path(directory)
+        save_encoders(self.encoders, directory.joinpath('encoders'))
+        directory.joinpath('blocks').mkdir(parents=True, exist_ok=True)
+        for name in self.recommender.block_names:
+            sparse.save_npz(directory.joinpath('blocks', f"{name}.npz"), self.recommender.block(name))
+        table_path = None
+        if self.table is not None:
+            if self.table.path is None or self.table.temporary:
+                saved = NeighbourTable.create(directory.joinpath('neighbours'), len(self.table), self.table.k)
+                saved.indices[:], saved.scores[:] = self.table.indices, self.table.scores
+                saved.flush()
+                self.table.close()
+                self.table = saved
+            table_path = self.table.path.absolute()
+            # relative when inside the model directory, so the directory can be moved as a whole
+            if table_path.is_relative_to(directory.absolute()):
+                table_path = table_path.relative_to(directory.absolute())
+        with open(directory.joinpath('model.json'), 'w', encoding='utf-8') as f:
+            json.dump({'blocks': self.recommender.block_names, 'weights': self.recommender.weights, 'ids': self.ids,
+                       'neighbours': table_path.as_posix() if table_path is not None else None}, f)
+
+    @classmethod
+    def load(cls, directory: str | Path) -> 'IncrementalModel':
+        directory = Path(directory)
+        with open(directory.joinpath('model.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        encoders = load_encoders(directory.joinpath('encoders'))
+        # the blocks are stored normalized, so FusedRecommender's normalization leaves them as they are
+        blocks = {name: sparse.load_npz(directory.joinpath('blocks', f"{name}.npz")) for name in meta['blocks']}
+        table = NeighbourTable.open(directory.joinpath(meta['neighbours']), mode='r+') if meta['neighbours'] else None
+        return cls({name: encoders[name] for name in meta['blocks']}, FusedRecommender(blocks, meta['weights']),
+                   meta['ids'], table)
@@ -0,0 +1,203 @@
+"""Precomputed "similar games" lists for the whole library.
+
+Computes every game's top k neighbours by cosine similarity without ever holding the full N x N similarity matrix:
+rows are scored a block at a time, with the block size chosen to fit a memory budget, and blocks can run in parallel
+across processes. Only the top k indices/scores per game are kept, in a memory-mapped int32/float32 table, so serving
+"similar to X" is a single array slice.
+
+    table = compute_neighbour_table(features, k=20, path=datasets.joinpath('neighbours'), n_jobs=4)
+    indices, scores = NeighbourTable.open(datasets.joinpath('neighbours')).similar(target_game_index)
+"""
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from scipy import sparse
+
+from text_processing.similarity_metrics import block_size_for_budget, normalize, top_k_rows
+
+# set in each worker process by _init_worker, so the features are shipped once rather than with every block
+_worker_state = {}
+
+
+# ///////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+class NeighbourTable:
+    """Top k neighbours of every game: indices (int32) and scores (float32), both (num games, k), best first. Rows of
+    games with fewer than k candidates are padded with index -1 and score -inf"""
+
+    def __init__(self, indices: np.ndarray, scores: np.ndarray, path: Path | None = None):
+        self.indices = indices
+        self.scores = scores
+        self.path = path
+        # set for tables in a temporary directory, which is deleted along with the last table using it
+        self._tmpdir = None
+
+    @property
+    def temporary(self) -> bool:
+        return self._tmpdir is not None
+
+    @property
+    def k(self) -> int:
+        return self.indices.shape[1]
+
+    def __len__(self):
+        return self.indices.shape[0]
+
+    def similar(self, target_game_index: int, N: int | None = None) -> tuple:
+        """The target's top N (default: all k) neighbours and their scores"""
+        return self.indices[target_game_index, :N], self.scores[target_game_index, :N]
+
+    @classmethod
+    def create(cls, path: str | Path, num_games: int, k: int) -> 'NeighbourTable':
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        indices = np.lib.format.open_memmap(path.joinpath('indices.npy'), mode='w+', dtype=np.int32,
+                                            shape=(num_games, k))
+        scores = np.lib.format.open_memmap(path.joinpath('scores.npy'), mode='w+', dtype=np.float32,
+                                           shape=(num_games, k))
+        return cls(indices, scores, path)
+
+    @classmethod
+    def open(cls, path: str | Path, mode: str = 'r') -> 'NeighbourTable':
+        """Memory-maps a saved table; pages are only read from disk as rows are used"""
+        path = Path(path)
+        return cls(np.load(path.joinpath('indices.npy'), mmap_mode=mode),
+                   np.load(path.joinpath('scores.npy'), mmap_mode=mode), path)
+
+    def flush(self):
+        for array in (self.indices, self.scores):
+            if isinstance(array, np.memmap):
+                array.flush()
+
+    def close(self):
+        """Drops the arrays, and deletes the directory of a temporary table. The table can't be used afterwards"""
+        self.indices = self.scores = None
+        if self._tmpdir is not None:
+            self._tmpdir.cleanup()
+            self._tmpdir = None
+
+    def grow(self, num_games: int) -> 'NeighbourTable':
+        """A copy of the table with rows for num_games games; the extra rows are padding (-1/-inf). A table on disk is
+        rewritten in place, so reopen it rather than keep using this one"""
+        extra = num_games - len(self)
+        if self.path is None:
+            return NeighbourTable(np.pad(self.indices, ((0, extra), (0, 0)), constant_values=-1),
+                                  np.pad(self.scores, ((0, extra), (0, 0)), constant_values=-np.inf))
+        tmp = NeighbourTable.create(self.path.joinpath('grow.tmp'), num_games, self.k)
+        tmp.indices[:len(self)], tmp.scores[:len(self)] = self.indices, self.scores
+        tmp.indices[len(self):], tmp.scores[len(self):] = -1, -np.inf
+        tmp.flush()
+        del tmp
+        for name in ('indices.npy', 'scores.npy'):
+            self.path.joinpath('grow.tmp', name).replace(self.path.joinpath(name))
+        self.path.joinpath('grow.tmp').rmdir()
+        grown = NeighbourTable.open(self.path, mode='r+')
+        grown._tmpdir = self._tmpdir
+        return grown
+
+
+def _score_block(features: sparse.csr_matrix, inverted: sparse.csr_matrix, start: int, stop: int, k: int) -> tuple:
+    scores = (features[start:stop] @ inverted).toarray()
+    # a game is not its own neighbour
+    rows = np.arange(stop - start)
+    scores[rows, rows + start] = -np.inf
+    # pad out tables where k is larger than the library
+    return top_k_rows(scores, k, pad=True)
+
+
+def _init_worker(features: sparse.csr_matrix, path: Path):
+    _worker_state['features'] = features
+    _worker_state['inverted'] = features.T.tocsr()
+    _worker_state['table'] = NeighbourTable.open(path, mode='r+')
+
+
+def _worker_block(args: tuple) -> int:
+    start, stop, k = args
+    table = _worker_state['table']
+    table.indices[start:stop], table.scores[start:stop] = _score_block(
+        _worker_state['features'], _worker_state['inverted'], start, stop, k)
+    table.flush()
+    return stop - start
+
+
+def update_neighbour_table(table: NeighbourTable, features, new_rows, normalize_rows: bool = True) -> NeighbourTable:
+    """Brings a table up to date after games were appended to the library, without recomputing it: the new games get
+    their top k, and an existing game's list only changes if one of the new games beats its current k-th neighbour.
+    Costs one (num new games x num games) product \n
+    :param table: the table for the library before the new games were added
+    :param features: the whole library's features, new games included (same scaling as the table was computed with)
+    :param new_rows: indices of the new games in features, e.g. range(old size, new size)
+    :param normalize_rows: see compute_neighbour_table
+    :returns the updated table, with a row per game in features"""
+    features = sparse.csr_matrix(features, dtype=np.float32)
+    if normalize_rows:
+        features = normalize(features, norm='l2')
+    new_rows = np.asarray(new_rows, dtype=np.int64)
+    num_old = len(table)
+    if len(table) < features.shape[0]:
+        table = table.grow(features.shape[0])
+
+    scores = (features[new_rows] @ features.T.tocsr()).toarray()
+    scores[np.arange(len(new_rows)), new_rows] = -np.inf
+
+    # the new games' own lists
+    indices, top_scores = top_k_rows(scores, table.k, pad=True)
+    table.indices[new_rows], table.scores[new_rows] = indices, top_scores
+
+    # existing games a new game now beats the k-th neighbour of (similarity is symmetric)
+    old_scores = scores[:, :num_old]
+    affected = np.flatnonzero((old_scores > np.asarray(table.scores[:num_old, -1])).any(axis=0))
+    if len(affected):
+        candidates = np.hstack([table.indices[affected], np.broadcast_to(new_rows, (len(affected), len(new_rows)))])
+        candidate_scores = np.hstack([table.scores[affected], old_scores[:, affected].T])
+        best, best_scores = top_k_rows(candidate_scores, table.k)
+        best = np.take_along_axis(candidates, best, axis=1)
+        best[np.isneginf(best_scores)] = -1
+        table.indices[affected], table.scores[affected] = best, best_scores
+    table.flush()
+    return table
+
+
+def compute_neighbour_table(features, k: int = 10, path: str | Path | None = None,
+                            memory_budget: int = 512 * 1024 ** 2, n_jobs: int = 1,
+                            normalize_rows: bool = True) -> NeighbourTable:
+    """All-pairs top k neighbours, block by block \n
+    :param features: one row per game (sparse or dense)
+    :param k: neighbours to keep per game
+    :param path: directory to write indices.npy/scores.npy to. If not given, a temporary directory that is deleted
+    once the table is no longer used (see NeighbourTable.temporary)
+    :param memory_budget: approximate cap, in bytes, on memory used for scoring across all workers
+    :param n_jobs: number of worker processes; each writes its blocks straight into the memory-mapped table
+    :param normalize_rows: L2 normalize rows first, for cosine similarity. Pass False for rows that are already
+    scaled, e.g. FusedRecommender.features
+    """
+    features = sparse.csr_matrix(features, dtype=np.float32)
+    if normalize_rows:
+        features = normalize(features, norm='l2')
+    num_games = features.shape[0]
+    tmpdir = None
+    if path is None:
+        tmpdir = tempfile.TemporaryDirectory(prefix='neighbours-', ignore_cleanup_errors=True)
+        path = tmpdir.name
+    path = Path(path)
+    table = NeighbourTable.create(path, num_games, k)
+    table._tmpdir = tmpdir
+
+    block_size = block_size_for_budget(num_games, memory_budget, n_jobs)
+    blocks = [(start, min(start + block_size, num_games), k) for start in range(0, num_games, block_size)]
+    if n_jobs > 1 and len(blocks) > 1:
+        table.flush()
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker,
+                                 initargs=(features, path)) as executor:
+            list(executor.map(_worker_block, blocks))
+        table = NeighbourTable.open(path)
+        table._tmpdir = tmpdir
+        return table
+
+    inverted = features.T.tocsr()
+    for start, stop, _ in blocks:
+        table.indices[start:stop], table.scores[start:stop] = _score_block(features, inverted, start, stop, k)
+    table.flush()
+    return table
@@ -1,25 +1,68 @@
 import pandas as pd
 import numpy as np
 from pathlib import Path
-from os import getcwd
 import string
+import hashlib
+import sqlite3
 from collections import Counter
-from nltk.tokenize import word_tokenize, TweetTokenizer
-from nltk.stem import WordNetLemmatizer, PorterStemmer
-from nltk.corpus import stopwords
-from sklearn.preprocessing import LabelBinarizer, MultiLabelBinarizer, OneHotEncoder
-from sklearn.feature_extraction.text import TfidfVectorizer
-import category_encoders as ce
-from typing import List
-
-stop_words = set(stopwords.words('english'))
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import List, Iterable
+
+from instrumentation import instrumented, timer
+
+# nltk and sklearn take seconds to import, so they are only imported on first use. stop_words and stemmer are still
+# available as module attributes, see __getattr__
+
+# precomputed copy of nltk's english stopword corpus, rebuild with write_stop_words
+stop_words_path = Path(__file__).parent.joinpath('stopwords_english.txt')
 puncts_to_exclude = "."
 punctuation = string.punctuation.replace(puncts_to_exclude, '')
 
+
+@lru_cache(maxsize=None)
+def load_stop_words() -> frozenset:
+    if stop_words_path.exists():
+        return frozenset(stop_words_path.read_text(encoding='utf-8').split())
+    from nltk.corpus import stopwords
+    return frozenset(stopwords.words('english'))
+
+
+def write_stop_words(path: str | Path = stop_words_path):
+    from nltk.corpus import stopwords
+    Path(path).write_text('\n'.join(stopwords.words('english')) + '\n', encoding='utf-8')
+
+
+@lru_cache(maxsize=None)
+def _stemmer():
+    from nltk.stem import PorterStemmer
+    return PorterStemmer()
+
+
+@lru_cache(maxsize=None)
+def _word_tokenize():
+    from nltk.tokenize import word_tokenize
+    return word_tokenize
+
+
+def __getattr__(name: str):
+    if name == 'stop_words':
+        return load_stop_words()
+    if name == 'stemmer':
+        return _stemmer()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 # ///////////////////////////////////////////// PREPROCESSING //////////////////////////////////////////////////////////
 # //////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
 
-stemmer = PorterStemmer()
+# the same few thousand words make up most summaries, so stems are memoized per unique token
+stem_cache_size = 200_000
+
+
+@lru_cache(maxsize=stem_cache_size)
+def stem(token: str) -> str:
+    return _stemmer().stem(token)
 
 
 # need to get unique combos of genres, ignoring ordering
@@ -45,6 +88,7 @@ def trim_escape_chars(text: str, chars: List[str] = None) -> str:
         return text
 
 
+@instrumented()
 def preprocess_text(text: str, stem_words: bool = True, remove_stopwords: bool = True,
                     remove_numeric: bool = True) -> str:
     # lowercase
@@ -52,17 +96,19 @@ def preprocess_text(text: str, stem_words: bool = True, remove_stopwords: bool =
     # remove punctuation
     text = text.translate(str.maketrans("", "", punctuation))
     # get tokens
-    tokens = word_tokenize(text)
+    with timer('tokenize'):
+        tokens = _word_tokenize()(text)
     # remove stop words
     if remove_stopwords:
+        stop_words = load_stop_words()
         tokens = [word for word in tokens if word not in stop_words]
 
     if stem_words and not remove_numeric:
-        tokens = [stemmer.stem(token) for token in tokens]
+        tokens = [stem(token) for token in tokens]
 
     # stem tokens
     elif stem_words and remove_numeric:
-        tokens = [stemmer.stem(token) for token in tokens if not token.isnumeric()]
+        tokens = [stem(token) for token in tokens if not token.isnumeric()]
 
     elif not stem_words and remove_numeric:
         tokens = [token for token in tokens if not token.isnumeric()]
@@ -71,11 +117,100 @@ def preprocess_text(text: str, stem_words: bool = True, remove_stopwords: bool =
     return " ".join(tokens)
 
 
+def _preprocess_chunk(args: tuple) -> List[str]:
+    texts, options = args
+    return [preprocess_text(text, **options) for text in texts]
+
+
+class PreprocessCache:
+    """On-disk cache of preprocessed summaries: one sqlite table from a hash of the summary and the preprocess_text
+    options to the processed text. A whole corpus is looked up, and stored, in a single transaction \n
+    :param path: location of the sqlite database
+    """
+    # sqlite's default cap on bound parameters per statement
+    max_variables = 999
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.hits = 0
+        self.misses = 0
+        self._conn = sqlite3.connect(self.path, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS preprocessed (key BLOB PRIMARY KEY, text TEXT)')
+
+    @staticmethod
+    def make_key(text: str, options: dict) -> bytes:
+        prefix = ','.join(f"{k}={int(v)}" for k, v in sorted(options.items()))
+        return hashlib.sha256(f"{prefix}\0{text}".encode('utf-8')).digest()
+
+    def get_many(self, keys: List[bytes]) -> dict:
+        """key -> processed text for every key in the cache"""
+        unique = list(dict.fromkeys(keys))
+        found = {}
+        with self._conn:
+            self._conn.execute('BEGIN')
+            for start in range(0, len(unique), self.max_variables):
+                batch = unique[start:start + self.max_variables]
+                rows = self._conn.execute(f"SELECT key, text FROM preprocessed WHERE key IN "
+                                          f"({','.join('?' * len(batch))})", batch)
+                found.update(rows)
+        self.hits += sum(key in found for key in keys)
+        self.misses += sum(key not in found for key in keys)
+        return found
+
+    def put_many(self, items: Iterable[tuple]):
+        """Stores (key, processed text) pairs"""
+        with self._conn:
+            self._conn.execute('BEGIN')
+            self._conn.executemany('INSERT OR REPLACE INTO preprocessed VALUES (?, ?)', items)
+
+    def close(self):
+        self._conn.close()
+
+
+@instrumented()
+def preprocess_corpus(texts: Iterable[str], stem_words: bool = True, remove_stopwords: bool = True,
+                      remove_numeric: bool = True, n_jobs: int = 1, chunk_size: int = 500,
+                      cache: PreprocessCache | str | Path | None = None) -> List[str]:
+    """Batch version of preprocess_text for a whole column of summaries. Output matches preprocess_text exactly, in
+    input order \n
+    :param n_jobs: number of worker processes; chunks of `chunk_size` summaries are spread across them
+    :param cache: a PreprocessCache (or the path of one), so reruns only process new or changed summaries
+    """
+    texts = list(texts)
+    options = {'stem_words': stem_words, 'remove_stopwords': remove_stopwords, 'remove_numeric': remove_numeric}
+    if cache is not None and not isinstance(cache, PreprocessCache):
+        cache = PreprocessCache(cache)
+
+    results = [None] * len(texts)
+    keys = [PreprocessCache.make_key(text, options) for text in texts] if cache is not None else []
+    if cache is not None:
+        cached = cache.get_many(keys)
+        results = [cached.get(key) for key in keys]
+
+    todo = [i for i, result in enumerate(results) if result is None]
+    chunks = [([texts[i] for i in todo[start:start + chunk_size]], options)
+              for start in range(0, len(todo), chunk_size)]
+    if n_jobs > 1 and len(chunks) > 1:
+        # executor.map hands results back in submission order
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            processed = [text for chunk in executor.map(_preprocess_chunk, chunks) for text in chunk]
+    else:
+        processed = [text for chunk in map(_preprocess_chunk, chunks) for text in chunk]
+
+    for i, text in zip(todo, processed):
+        results[i] = text
+    if cache is not None and todo:
+        cache.put_many((keys[i], results[i]) for i in todo)
+    return results
+
+
 # ///////////////////////////////////////////// FEATURE ENCODING ///////////////////////////////////////////////////////
 # //////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
 
 
 def binary_encode(df: pd.DataFrame, col_name: str):
+    from sklearn.preprocessing import LabelBinarizer
     encoder = LabelBinarizer()
     encoded = encoder.fit_transform(df[col_name])
     return encoded
@@ -1,29 +1,147 @@
-import pandas as pd
 import numpy as np
-from pathlib import Path
-from sklearn.metrics.pairwise import cosine_similarity
-from os import getcwd
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from scipy import sparse
+from typing import Callable, List, Dict
+
+from instrumentation import instrumented
+
+# bytes held per (row, game) pair while scoring a block: the dense float32 scores, the int64 argpartition output and
+# headroom for the sparse product it came from
+bytes_per_score = 20
+# bytes per (row, feature) pair of a dense float32 copy of a block's query rows
+bytes_per_query_feature = 4
+default_memory_budget = 256 * 1024 ** 2
+
+
+def __getattr__(name: str):
+    # sklearn takes seconds to import, so cosine_similarity is only imported when something asks for it
+    if name == 'cosine_similarity':
+        from sklearn.metrics.pairwise import cosine_similarity
+        return cosine_similarity
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def normalize(features, norm: str = 'l2', copy: bool = True):
+    """Row-wise L2 normalization with the same results as sklearn.preprocessing.normalize, without importing sklearn.
+    All-zero rows are left as they are"""
+    if norm != 'l2':
+        raise ValueError(f"Invalid norm {norm}, only 'l2' is supported.")
+    if sparse.issparse(features):
+        features = sparse.csr_matrix(features, copy=copy)
+        if not np.issubdtype(features.dtype, np.floating):
+            features = features.astype(np.float64)
+        rows = np.repeat(np.arange(features.shape[0]), np.diff(features.indptr))
+        norms = np.sqrt(np.bincount(rows, weights=features.data ** 2, minlength=features.shape[0]))
+        norms[norms == 0] = 1
+        features.data /= norms[rows].astype(features.dtype)
+        return features
+    dtype = np.result_type(np.asarray(features).dtype, np.float32)
+    features = np.array(features, dtype=dtype) if copy else np.asarray(features, dtype=dtype)
+    norms = np.linalg.norm(features, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    features /= norms
+    return features
 
 
 # ///////////////////////////////////////////////////////////////////////////////////////////////////////////////////
 # ///////////////////////////////////////////////////////////////////////////////////////////////////////////////////
 
-def recommend_similar_titles_single_feature(similarity_matrix, target_game_index: int, N: int = 5):
-    target_game_similarity_scores = similarity_matrix[target_game_index]
+def top_k(scores: np.ndarray, k: int, exclude: int | None = None) -> np.ndarray:
+    """Indices of the k highest scores, highest first. Uses argpartition, so only the k winners get sorted \n
+    :param exclude: an index to leave out, usually the target game itself"""
+    if exclude is not None:
+        scores = scores.copy()
+        scores[exclude] = -np.inf
+    k = min(k, len(scores) - (exclude is not None))
+    if k <= 0:
+        return np.array([], dtype=np.intp)
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+def top_k_rows(scores: np.ndarray, k: int, pad: bool = False) -> tuple:
+    """Row-wise top k of a dense score block, best first \n
+    :param pad: always return k columns: pad with index -1 / score -inf where there are fewer than k columns, and set
+    the index of any -inf score (e.g. an excluded game) to -1
+    :returns (indices, scores), each (num rows, k)"""
+    top = min(k, scores.shape[1])
+    if top > 0:
+        candidates = np.argpartition(-scores, top - 1, axis=1)[:, :top]
+        candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+        order = np.argsort(-candidate_scores, axis=1, kind='stable')
+        indices = np.take_along_axis(candidates, order, axis=1)
+        top_scores = np.take_along_axis(candidate_scores, order, axis=1)
+    else:
+        indices, top_scores = np.empty((scores.shape[0], 0), dtype=np.intp), scores[:, :0]
+    if not pad:
+        return indices, top_scores
+    if top < k:
+        indices = np.pad(indices, ((0, 0), (0, k - top)), constant_values=-1)
+        top_scores = np.pad(top_scores, ((0, 0), (0, k - top)), constant_values=-np.inf)
+    indices[np.isneginf(top_scores)] = -1
+    return indices, top_scores
+
+
+def block_size_for_budget(num_games: int, memory_budget: int, n_jobs: int = 1, num_features: int = 0) -> int:
+    """Number of rows to score at once so that n_jobs blocks in flight stay within memory_budget bytes 
+
+    :param num_features: width of the dense copy of the query rows a block is scored with, if it makes one"""
+    row_bytes = bytes_per_score * num_games + bytes_per_query_feature * num_features
+    return max(1, int(memory_budget // (row_bytes * max(1, n_jobs))))
+
 
-    # Sort indices based on similarity scores
-    similar_game_indices = target_game_similarity_scores.argsort()[::-1]
+def batch_top_k(score_block: Callable[[np.ndarray], object], targets, k: int, num_games: int,
+                block_size: int | None = None, n_jobs: int = 1, memory_budget: int = default_memory_budget,
+                num_features: int = 0) -> tuple:
+    """Top k games for many targets, scoring a block of targets at a time with one matrix-matrix product \n
+    :param score_block: block of target indices -> (block size, num_games) scores, dense or sparse
+    :param targets: indices of the target games; each target is excluded from its own list
+    :param block_size: targets per block, defaults to what fits memory_budget
+    :param n_jobs: threads to score blocks on. The products and top-k run in numpy/scipy code that releases the GIL
+    :param num_features: see block_size_for_budget
+    :returns (indices, scores): int32 and float32 arrays of shape (len(targets), k), best first. Rows with fewer than
+    k candidates are padded with index -1 and score -inf"""
+    targets = np.asarray(targets, dtype=np.int64).ravel()
+    block_size = block_size or block_size_for_budget(num_games, memory_budget, n_jobs, num_features)
+    indices = np.empty((len(targets), k), dtype=np.int32)
+    scores = np.empty((len(targets), k), dtype=np.float32)
 
-    # Exclude the target game itself
-    similar_game_indices = similar_game_indices[similar_game_indices != target_game_index]
+    def run(start: int):
+        block = targets[start:start + block_size]
+        block_scores = score_block(block)
+        block_scores = np.array(block_scores.toarray() if sparse.issparse(block_scores) else block_scores,
+                                dtype=np.float32)
+        block_scores[np.arange(len(block)), block] = -np.inf
+        indices[start:start + len(block)], scores[start:start + len(block)] = top_k_rows(block_scores, k, pad=True)
 
-    # Get the top N similar game indices
-    top_similar_indices = similar_game_indices[:N]
+    starts = range(0, len(targets), block_size)
+    if n_jobs > 1 and len(starts) > 1:
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            list(executor.map(run, starts))
+    else:
+        for start in starts:
+            run(start)
+    return indices, scores
+
+
+@instrumented()
+def recommend_similar_titles_single_feature(similarity_matrix, target_game_index: int, N: int = 5):
+    target_game_similarity_scores = np.asarray(similarity_matrix[target_game_index]).ravel()
+
+    # Get the top N similar game indices, excluding the target game itself
+    top_similar_indices = top_k(target_game_similarity_scores, N, exclude=target_game_index)
 
     return top_similar_indices
 
 
+@instrumented()
+def recommend_similar_titles_batch(similarity_matrix, targets, N: int = 5, n_jobs: int = 1) -> tuple:
+    """recommend_similar_titles_single_feature for many targets at once \n
+    :returns (indices, scores), each (len(targets), N), see batch_top_k"""
+    return batch_top_k(lambda block: similarity_matrix[block], targets, N, similarity_matrix.shape[1], n_jobs=n_jobs)
+
+
+@instrumented()
 def recommend_similar_games(scores, target_game_index, N=5):
     # Get the similarity score for the target game
     target_score = scores[target_game_index]
@@ -41,3 +159,210 @@ def recommend_similar_games(scores, target_game_index, N=5):
     return similar_game_indices[:N]
 
 
+
+
+class SimilarityRecommender:
+    """Cosine similarity recommendations without a precomputed N x N similarity matrix. Feature rows are L2 normalized
+    once; each query is then a single sparse mat-vec against the transposed features (which acts as an inverted index,
+    so only games sharing a feature with the target are touched), followed by a top-k argpartition \n
+    :param features: one row per game, e.g. the output of encoders.MultiLabelEncoder (sparse or dense)
+
+    Set ann_index (see ann.build_index) to answer recommend from an approximate index instead of exact scoring.
+    """
+
+    def __init__(self, features):
+        # normalize copies, so a float32 csr input (which csr_matrix passes through as is) isn't normalized in place
+        self.features = normalize(sparse.csr_matrix(features, dtype=np.float32), norm='l2')
+        self._inverted = self.features.T.tocsr()
+        self.ann_index = None
+
+    def __len__(self):
+        return self.features.shape[0]
+
+    def append(self, features):
+        """Adds games to the end of the library without touching the existing rows. features may be wider than the
+        current ones, when the vocabulary it was encoded against has grown (new columns at the end). Drops any
+        ann_index, which doesn't know about the new games"""
+        features = normalize(sparse.csr_matrix(features, dtype=np.float32), norm='l2')
+        width = max(self.features.shape[1], features.shape[1])
+        self.features.resize((self.features.shape[0], width))
+        features.resize((features.shape[0], width))
+        self.features = sparse.vstack([self.features, features], format='csr')
+        self._inverted = self.features.T.tocsr()
+        self.ann_index = None
+
+    def query_row(self, target_game_index: int) -> sparse.csr_matrix:
+        """The feature row a game is scored with"""
+        return self.features[target_game_index]
+
+    def query_rows(self, targets) -> sparse.csr_matrix:
+        """The feature rows several games are scored with"""
+        return self.features[np.asarray(targets)]
+
+    def scores(self, target_game_index: int) -> np.ndarray:
+        """Cosine similarity of one game against every game in the library"""
+        return self.score_vector(self.query_row(target_game_index))
+
+    @instrumented('score_rows')
+    def score_rows(self, queries: sparse.csr_matrix) -> np.ndarray:
+        """Scores several query rows (e.g. stacked query_row results) against the library in one product \n
+        :returns a dense (num queries, num games) array"""
+        return (sparse.csr_matrix(queries) @ self._inverted).toarray()
+
+    @instrumented('score_vector')
+    def score_vector(self, query) -> np.ndarray:
+        """Cosine similarity of an (already normalized) feature row against every game in the library"""
+        query = sparse.csr_matrix(query)
+        # gather the games listed under each of the query's features and add up their weights. Cheaper than a
+        # sparse-sparse product, which has to build and sort an intermediate sparse result
+        inverted = self._inverted
+        starts, ends = inverted.indptr[query.indices], inverted.indptr[query.indices + 1]
+        if len(starts) == 0:
+            return np.zeros(len(self))
+        rows = np.concatenate([inverted.indices[a:b] for a, b in zip(starts, ends)])
+        weights = np.concatenate([inverted.data[a:b] * w for a, b, w in zip(starts, ends, query.data)])
+        return np.bincount(rows, weights=weights, minlength=len(self))
+
+    @instrumented('recommend')
+    def recommend(self, target_game_index: int, N: int = 5, return_scores: bool = False, exact: bool = False):
+        """Top N most similar games to the target, most similar first \n
+        :param exact: score every game even if an ann_index is set"""
+        if self.ann_index is not None and not exact:
+            return self.ann_index.recommend(target_game_index, N, return_scores)
+        scores = self.scores(target_game_index)
+        indices = top_k(scores, N, exclude=target_game_index)
+        if return_scores:
+            return indices, scores[indices]
+        return indices
+
+    @instrumented('recommend_batch')
+    def recommend_batch(self, targets, N: int = 5, n_jobs: int = 1, block_size: int | None = None,
+                        memory_budget: int = default_memory_budget, **query_kwargs) -> tuple:
+        """Top N most similar games for each of many targets, e.g. a whole wishlist or the whole library. Always
+        scored exactly; see batch_top_k for the parameters \n
+        :param query_kwargs: passed on to query_rows, e.g. FusedRecommender's one-off weights
+        :returns (indices, scores), each (len(targets), N), most similar first"""
+        return batch_top_k(lambda block: self._score_block(self.query_rows(block, **query_kwargs)), targets, N,
+                           len(self), block_size, n_jobs, memory_budget, num_features=self.features.shape[1])
+
+    def _score_block(self, queries: sparse.csr_matrix) -> np.ndarray:
+        # for blocks of hundreds of queries the scores are mostly non-zero, and a sparse x dense product is cheaper
+        # than building them up as a sparse result the way score_rows does. The dense queries are
+        # (num features, block size), which recommend_batch counts against the memory budget
+        return np.ascontiguousarray((self.features @ queries.T.toarray()).T)
+
+
+class FusedRecommender(SimilarityRecommender):
+    """Weighted multi-feature similarity in a single product. Each feature block (genres, themes, platforms, summary
+    tf-idf, companies, ...) is L2 normalized on its own, scaled by the square root of its weight, and the blocks are
+    stacked side by side; the dot product of two stacked rows is then sum(weight * cosine similarity) over the
+    features. With weights summing to 1, scores stay within [0, 1] \n
+    :param blocks: feature name -> matrix with one row per game, all in the same game order
+    :param weights: feature name -> weight, defaults to equal weights
+
+    Changing weights only rescales the stored blocks (set_weights) or the query row (the `weights` argument of
+    scores/recommend); nothing is re-encoded or rebuilt.
+    """
+
+    def __init__(self, blocks: Dict[str, object], weights: Dict[str, float] | None = None):
+        self.block_names = list(blocks)
+        unit_blocks = [normalize(sparse.csr_matrix(block, dtype=np.float32), norm='l2') for block in blocks.values()]
+        self._set_unit(sparse.hstack(unit_blocks, format='csr', dtype=np.float32),
+                       [block.shape[1] for block in unit_blocks])
+        self.set_weights(weights or {name: 1 / len(self.block_names) for name in self.block_names})
+
+    def _set_unit(self, unit: sparse.csr_matrix, widths: List[int]):
+        bounds = np.concatenate([[0], np.cumsum(widths)])
+        self.block_slices = {name: slice(bounds[i], bounds[i + 1]) for i, name in enumerate(self.block_names)}
+        # unweighted copies of the stacked rows and of the inverted index, which weights are always applied to
+        self._unit = unit
+        self._column_block = np.repeat(np.arange(len(widths)), widths)
+        self.features = self._unit.copy()
+        self._inverted = self._unit.T.tocsr()
+        self._unit_inverted_data = self._inverted.data.copy()
+
+    def block(self, name: str) -> sparse.csr_matrix:
+        """A feature block as stored: rows L2 normalized, unweighted"""
+        return self._unit[:, self.block_slices[name]]
+
+    def append(self, blocks: Dict[str, object]):
+        """Adds games to the end of the library without re-encoding or renormalizing the existing rows \n
+        :param blocks: feature name -> matrix of the new games, for every feature. A block may be wider than the stored
+        one when its vocabulary has grown (see encoders.MultiLabelEncoder.partial_fit); the new columns go at the end
+        of that block, and existing games get zeros for them
+
+        Drops any ann_index, which doesn't know about the new games"""
+        if set(blocks) != set(self.block_names):
+            raise ValueError(f"Expected blocks for {self.block_names}, got {sorted(blocks)}.")
+        new_blocks = [normalize(sparse.csr_matrix(blocks[name], dtype=np.float32), norm='l2')
+                      for name in self.block_names]
+        old_widths = [self.block_slices[name].stop - self.block_slices[name].start for name in self.block_names]
+        widths = [max(old, new.shape[1]) for old, new in zip(old_widths, new_blocks)]
+        for block, width in zip(new_blocks, widths):
+            block.resize((block.shape[0], width))
+
+        # shift the existing columns of every block right by however much the blocks before it grew
+        shift = (np.cumsum([0] + widths) - np.cumsum([0] + old_widths))[:-1]
+        old = self._unit
+        old_unit = sparse.csr_matrix((old.data, old.indices + shift[self._column_block[old.indices]], old.indptr),
+                                     shape=(old.shape[0], sum(widths)))
+        unit = sparse.vstack([old_unit, sparse.hstack(new_blocks, format='csr', dtype=np.float32)], format='csr')
+        self._set_unit(unit, widths)
+        self.set_weights(self.weights)
+
+    def _weight_array(self, weights: Dict[str, float]) -> np.ndarray:
+        unknown = set(weights) - set(self.block_names)
+        if unknown:
+            raise ValueError(f"Invalid feature name(s) {sorted(unknown)}, expected some of {self.block_names}.")
+        return np.array([weights.get(name, 0.0) for name in self.block_names], dtype=np.float32)
+
+    def set_weights(self, weights: Dict[str, float]):
+        """Rescales the stored blocks to new weights; features left out get a weight of 0. Drops any ann_index, which
+        was built for the old weights"""
+        self.ann_index = None
+        self._weights = self._weight_array(weights)
+        self.weights = dict(zip(self.block_names, self._weights.tolist()))
+        column_scale = np.sqrt(self._weights)[self._column_block]
+        self.features.data = self._unit.data * column_scale[self._unit.indices]
+        self._inverted.data = self._unit_inverted_data * np.repeat(column_scale, np.diff(self._inverted.indptr))
+
+    def query_row(self, target_game_index: int, weights: Dict[str, float] | None = None) -> sparse.csr_matrix:
+        """The feature row a game is scored with, optionally re-weighted for a single query. Features whose stored
+        weight is 0 can't be re-weighted this way, use set_weights for that"""
+        if weights is None:
+            return self.features[target_game_index]
+        return self.query_rows([target_game_index], weights)
+
+    def query_rows(self, targets, weights: Dict[str, float] | None = None) -> sparse.csr_matrix:
+        """The feature rows several games are scored with, optionally re-weighted, see query_row"""
+        targets = np.asarray(targets)
+        if weights is None:
+            return self.features[targets]
+
+        new_weights = self._weight_array(weights)
+        if np.any((new_weights > 0) & (self._weights == 0)):
+            raise ValueError("Can't give weight to a feature whose stored weight is 0, use set_weights instead.")
+        # library rows carry sqrt(stored weight), so the query row carries new weight / sqrt(stored weight)
+        block_scale = np.divide(new_weights, np.sqrt(self._weights), out=np.zeros_like(new_weights),
+                                where=self._weights > 0)
+        queries = self._unit[targets]
+        queries.data = queries.data * block_scale[self._column_block[queries.indices]]
+        return queries
+
+    def scores(self, target_game_index: int, weights: Dict[str, float] | None = None) -> np.ndarray:
+        """Weighted similarity of one game against every game in the library \n
+        :param weights: one-off weights for this query, see query_row"""
+        return self.score_vector(self.query_row(target_game_index, weights))
+
+    @instrumented('recommend')
+    def recommend(self, target_game_index: int, N: int = 5, return_scores: bool = False, exact: bool = False,
+                  weights: Dict[str, float] | None = None):
+        """Top N most similar games to the target by weighted similarity, most similar first. One-off weights are
+        always scored exactly"""
+        if weights is None:
+            return super().recommend(target_game_index, N, return_scores, exact)
+        scores = self.scores(target_game_index, weights)
+        indices = top_k(scores, N, exclude=target_game_index)
+        if return_scores:
+            return indices, scores[indices]
+        return indices
@@ -0,0 +1,135 @@
+"""Sparse tf-idf features for game summaries.
+
+Two modes:
+    'fitted'   tf-idf over a vocabulary learned from the library. The vocabulary and idf weights are saved as one
+               compact .npz artifact, so every consumer transforms against the same columns without refitting
+    'hashing'  terms are hashed into n_features columns (HashingVectorizer), so there is no vocabulary to keep in
+               memory or ship; only the idf weights of the hashed columns are fitted and saved
+
+Both produce float32 CSR matrices with L2 normalized rows and transform in batches, so they slot straight into
+FusedRecommender as the 'summary' block.
+
+    vectorizer = SummaryVectorizer('fitted', min_df=2).fit(df['summary'])
+    vectorizer.save(datasets.joinpath('summary_tfidf.npz'))
+    features = SummaryVectorizer.load(datasets.joinpath('summary_tfidf.npz')).transform(new_df['summary'])
+"""
+from pathlib import Path
+from typing import Iterable, List
+
+import numpy as np
+from scipy import sparse
+
+from text_processing.similarity_metrics import normalize
+
+summary_modes = ['fitted', 'hashing']
+
+
+# ///////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+class SummaryVectorizer:
+    """Summary text -> float32 tf-idf rows \n
+    :param mode: 'fitted' or 'hashing', see the module docstring
+    :param n_features: number of hashed columns in hashing mode
+    :param min_df: fitted mode only: drop terms found in fewer summaries than this
+    :param max_df: fitted mode only: drop terms found in more than this fraction of summaries
+    :param max_features: fitted mode only: keep only the most frequent terms
+    :param preprocess: run summaries through nlp.preprocess_corpus first (lowercase, stopwords, stemming)
+    :param preprocess_kwargs: passed on to nlp.preprocess_corpus, e.g. n_jobs or cache
+    """
+
+    def __init__(self, mode: str = 'fitted', n_features: int = 2 ** 18, min_df: int = 1, max_df: float = 1.0,
+                 max_features: int | None = None, preprocess: bool = True, **preprocess_kwargs):
+        if mode not in summary_modes:
+            raise ValueError(f"Invalid mode {mode}, expected one of {summary_modes}.")
+        self.mode = mode
+        self.n_features = n_features
+        self.min_df = min_df
+        self.max_df = max_df
+        self.max_features = max_features
+        self.preprocess = preprocess
+        self.preprocess_kwargs = preprocess_kwargs
+        self.vocabulary_: List[str] | None = None
+        self.idf_: np.ndarray | None = None
+        self._vectorizer = None
+
+    @property
+    def num_columns(self) -> int:
+        return len(self.vocabulary_) if self.mode == 'fitted' else self.n_features
+
+    def _texts(self, summaries: Iterable[str | None]) -> List[str]:
+        texts = [summary if isinstance(summary, str) else '' for summary in summaries]
+        if self.preprocess:
+            from text_processing.nlp import preprocess_corpus
+            texts = preprocess_corpus(texts, **self.preprocess_kwargs)
+        return texts
+
+    def _hasher(self):
+        from sklearn.feature_extraction.text import HashingVectorizer
+        return HashingVectorizer(n_features=self.n_features, alternate_sign=False, norm=None, dtype=np.float32)
+
+    def fit(self, summaries: Iterable[str | None]) -> 'SummaryVectorizer':
+        texts = self._texts(summaries)
+        if self.mode == 'fitted':
+            from sklearn.feature_extraction.text import TfidfVectorizer
+            vectorizer = TfidfVectorizer(min_df=self.min_df, max_df=self.max_df, max_features=self.max_features,
+                                         dtype=np.float32).fit(texts)
+            self._set_state(vectorizer.get_feature_names_out().tolist(), vectorizer.idf_)
+        else:
+            counts = self._hasher().transform(texts).tocsc()
+            document_frequency = np.diff(counts.indptr)
+            # smoothed idf, as TfidfVectorizer computes it
+            self._set_state(None, np.log((1 + len(texts)) / (1 + document_frequency)) + 1)
+        return self
+
+    def _set_state(self, vocabulary: List[str] | None, idf: np.ndarray):
+        self.vocabulary_ = vocabulary
+        self.idf_ = np.asarray(idf, dtype=np.float32)
+        if self.mode == 'fitted':
+            from sklearn.feature_extraction.text import TfidfVectorizer
+            self._vectorizer = TfidfVectorizer(vocabulary=vocabulary, dtype=np.float32)
+            self._vectorizer.idf_ = self.idf_
+        else:
+            self._vectorizer = self._hasher()
+
+    def _transform_texts(self, texts: List[str]) -> sparse.csr_matrix:
+        if self.mode == 'fitted':
+            return self._vectorizer.transform(texts).astype(np.float32, copy=False)
+        counts = self._vectorizer.transform(texts)
+        counts.data *= self.idf_[counts.indices]
+        return normalize(counts, norm='l2', copy=False)
+
+    def transform(self, summaries: Iterable[str | None], batch_size: int = 10_000) -> sparse.csr_matrix:
+        """Encodes summaries against the fitted state, batch_size at a time so intermediate results stay small.
+        Terms the vocabulary doesn't know are ignored in fitted mode; in hashing mode every term lands in a column"""
+        if self.idf_ is None:
+            raise ValueError("SummaryVectorizer has not been fitted yet, call fit or load first.")
+        texts = self._texts(summaries)
+        if not texts:
+            return sparse.csr_matrix((0, self.num_columns), dtype=np.float32)
+        return sparse.vstack([self._transform_texts(texts[start:start + batch_size])
+                              for start in range(0, len(texts), batch_size)], format='csr', dtype=np.float32)
+
+    def fit_transform(self, summaries: Iterable[str | None], batch_size: int = 10_000) -> sparse.csr_matrix:
+        # preprocess once rather than in both fit and transform
+        texts = self._texts(summaries)
+        preprocess, self.preprocess = self.preprocess, False
+        try:
+            return self.fit(texts).transform(texts, batch_size)
+        finally:
+            self.preprocess = preprocess
+
+    def save(self, path: str | Path):
+        """Writes the fitted state as one .npz: the vocabulary as a single newline-joined string (fitted mode) and the
+        idf weights as float32"""
+        vocabulary = '\n'.join(self.vocabulary_) if self.vocabulary_ is not None else ''
+        np.savez_compressed(path, mode=self.mode, n_features=self.n_features, preprocess=self.preprocess,
+                            vocabulary=np.array(vocabulary), idf=self.idf_)
+
+    @classmethod
+    def load(cls, path: str | Path, **preprocess_kwargs) -> 'SummaryVectorizer':
+        with np.load(path) as data:
+            vectorizer = cls(str(data['mode']), int(data['n_features']), preprocess=bool(data['preprocess']),
+                             **preprocess_kwargs)
+            vocabulary = str(data['vocabulary'])
+            vectorizer._set_state(vocabulary.split('\n') if vectorizer.mode == 'fitted' else None, data['idf'])
+        return vectorizer
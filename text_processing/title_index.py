@@ -0,0 +1,175 @@
+"""Name -> game index resolution that tolerates typos, subtitles and roman numerals.
+
+Every game is indexed under its normalized name, its slug and its main title (the name without a subtitle). Queries
+are looked up in a hash map of those keys first; only when that misses are they scored against a trigram inverted
+index, by Dice similarity of the trigram sets.
+
+    index = TitleIndex(df['name'], df['slug'])
+    index.resolve('legend of zelda breath of the wild')     # -> game index or None
+    indices, scores = index.search('Final Fantasy 7', k=5)
+    matches, unmatched = index.partition(vgsales['Name'])   # only unmatched titles need an IGDB search
+"""
+import re
+import unicodedata
+from pathlib import Path
+from typing import Iterable, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from text_processing.similarity_metrics import top_k
+
+roman_numerals = {'i': '1', 'ii': '2', 'iii': '3', 'iv': '4', 'v': '5', 'vi': '6', 'vii': '7', 'viii': '8', 'ix': '9',
+                  'x': '10', 'xi': '11', 'xii': '12', 'xiii': '13', 'xiv': '14', 'xv': '15', 'xvi': '16',
+                  'xvii': '17', 'xviii': '18', 'xix': '19', 'xx': '20'}
+# single letters that are more often words or series names than numerals, only converted as the last word
+ambiguous_numerals = {'i', 'v', 'x'}
+
+non_word_pattern = re.compile(r"[^\w\s]|_")
+subtitle_pattern = re.compile(r"\s*(?::|\s-\s|\s–\s).*$")
+
+# score given to normalized exact matches, above any trigram score
+exact_score = 1.0
+
+
+# ///////////////////////////////////////////////////////////////////////////////////////////////////////////////////
+
+def normalize_title(title: str) -> str:
+    """Casefolds, strips accents and punctuation, spells out '&' and turns roman numerals into numbers, so e.g.
+    'Final Fantasy VII' and 'final-fantasy-7' normalize the same"""
+    title = unicodedata.normalize('NFKD', title)
+    title = ''.join(c for c in title if not unicodedata.combining(c)).casefold().replace('&', ' and ')
+    words = non_word_pattern.sub(' ', title).split()
+    return ' '.join(roman_numerals[w] if w in roman_numerals and (w not in ambiguous_numerals or i == len(words) - 1)
+                    else w for i, w in enumerate(words))
+
+
+def main_title(title: str) -> str:
+    """The title without its subtitle: 'Halo 3: ODST' -> 'Halo 3'"""
+    return subtitle_pattern.sub('', title)
+
+
+def trigrams(key: str) -> set:
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TitleIndex:
+    """Prebuilt title index over a library's names and (optionally) slugs \n
+    :param names: game names, in game index order
+    :param slugs: IGDB slugs in the same order; hyphens are treated as spaces
+    """
+
+    def __init__(self, names: Iterable[str], slugs: Iterable[str] | None = None):
+        names = list(names)
+        slugs = list(slugs) if slugs is not None else [None] * len(names)
+        keys, games, main_titles = [], [], []
+        for i, (name, slug) in enumerate(zip(names, slugs)):
+            # (candidate, is it only a main title); a main title that is also the full name or slug counts as those
+            candidates = {}
+            if isinstance(name, str):
+                candidates[normalize_title(name)] = False
+            if isinstance(slug, str):
+                candidates.setdefault(normalize_title(slug.replace('-', ' ')), False)
+            if isinstance(name, str):
+                candidates.setdefault(normalize_title(main_title(name)), True)
+            for key, is_main_title in candidates.items():
+                if key:
+                    keys.append(key)
+                    games.append(i)
+                    main_titles.append(is_main_title)
+        self._build(keys, np.array(games, dtype=np.int32), len(names), np.array(main_titles, dtype=bool))
+
+    def _build(self, keys: List[str], games: np.ndarray, num_games: int, main_titles: np.ndarray):
+        self._set_keys(keys, games, num_games, main_titles)
+        # trigram -> key postings, as CSR offsets + key indices
+        key_trigrams = [trigrams(key) for key in keys]
+        self.trigram_counts = np.array([len(t) for t in key_trigrams], dtype=np.int32)
+        pairs = pd.DataFrame({'trigram': [t for ts in key_trigrams for t in ts],
+                              'key': np.repeat(np.arange(len(keys), dtype=np.int32), self.trigram_counts)})
+        codes, vocabulary = pd.factorize(pairs['trigram'])
+        self.vocabulary = {t: i for i, t in enumerate(vocabulary)}
+        order = np.argsort(codes, kind='stable')
+        self.postings = pairs['key'].to_numpy()[order]
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(codes, minlength=len(vocabulary)))])
+
+    def _set_keys(self, keys: List[str], games: np.ndarray, num_games: int, main_titles: np.ndarray):
+        self.keys = keys
+        self.games = games
+        self.num_games = num_games
+        self.main_titles = main_titles
+        # full names and slugs are registered before any main title, so 'Halo 3' resolves to Halo 3 even when
+        # 'Halo 3: ODST' comes first in the library; among keys of the same kind the first game wins
+        self.exact = {}
+        for main_title_pass in (False, True):
+            for key, game, is_main_title in zip(keys, games.tolist(), main_titles.tolist()):
+                if is_main_title == main_title_pass:
+                    self.exact.setdefault(key, game)
+
+    def __len__(self):
+        return self.num_games
+
+    def search(self, query: str, k: int = 5, min_score: float = 0.0) -> Tuple[np.ndarray, np.ndarray]:
+        """Ranked candidate games for a query \n
+        :param k: max candidates to return
+        :param min_score: drop candidates whose Dice similarity to the query is below this
+        :returns (game indices, scores), best first. An exact match on a normalized key scores exact_score"""
+        key = normalize_title(query)
+        exact = self.exact.get(key)
+        if exact is not None and k == 1:
+            return np.array([exact], dtype=np.int32), np.array([exact_score])
+
+        query_trigrams = [self.vocabulary[t] for t in trigrams(key) if t in self.vocabulary]
+        if not query_trigrams:
+            if exact is None:
+                return np.array([], dtype=np.int32), np.array([])
+            return np.array([exact], dtype=np.int32), np.array([exact_score])
+
+        hits = np.concatenate([self.postings[self.offsets[t]:self.offsets[t + 1]] for t in query_trigrams])
+        candidates, shared = np.unique(hits, return_counts=True)
+        scores = 2 * shared / (len(trigrams(key)) + self.trigram_counts[candidates])
+        if exact is not None:
+            scores[self.games[candidates] == exact] = exact_score
+
+        # best key per game; take a few extra keys since a game can show up under several
+        best = top_k(scores, min(len(scores), 3 * k))
+        games, first = np.unique(self.games[candidates[best]], return_index=True)
+        order = np.argsort(first)
+        games, game_scores = games[order], scores[best][first[order]]
+        keep = game_scores >= min_score
+        return games[keep][:k], game_scores[keep][:k]
+
+    def resolve(self, query: str, min_score: float = 0.6) -> int | None:
+        """The single best game for a query, or None if nothing scores at least min_score"""
+        games, scores = self.search(query, k=1, min_score=min_score)
+        return int(games[0]) if len(games) else None
+
+    def partition(self, titles: Iterable[str], min_score: float = 0.9) -> Tuple[List[tuple], List[str]]:
+        """Splits titles (e.g. vgsales.csv names) into those already in the library and those that still need an IGDB
+        lookup \n
+        :returns matches as (title, game index, score) and the unmatched titles"""
+        matches, unmatched = [], []
+        for title in titles:
+            games, scores = self.search(title, k=1, min_score=min_score)
+            if len(games):
+                matches.append((title, int(games[0]), float(scores[0])))
+            else:
+                unmatched.append(title)
+        return matches, unmatched
+
+    def save(self, path: str | Path):
+        np.savez(path, keys=np.array(self.keys), games=self.games, num_games=self.num_games,
+                 main_titles=self.main_titles, vocabulary=np.array(list(self.vocabulary)), postings=self.postings, offsets=self.offsets,
+                 trigram_counts=self.trigram_counts)
+
+    @classmethod
+    def load(cls, path: str | Path) -> 'TitleIndex':
+        """Loads a saved index without re-deriving the trigram postings"""
+        with np.load(path) as data:
+            index = cls.__new__(cls)
+            index._set_keys(data['keys'].tolist(), data['games'], int(data['num_games']), data['main_titles'])
+            index.vocabulary = {t: i for i, t in enumerate(data['vocabulary'].tolist())}
+            index.postings = data['postings']
+            index.offsets = data['offsets']
+            index.trigram_counts = data['trigram_counts']
+        return index